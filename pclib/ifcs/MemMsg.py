@@ -78,37 +78,13 @@ class MemReqMsg( BitStructDefinition ):
     s.data   = BitField( s.data_nbits   )
 
   def mk_rd( s, opaque, addr, len_ ):
-
-    msg        = s()
-    msg.type_  = MemReqMsg.TYPE_READ
-    msg.opaque = opaque
-    msg.addr   = addr
-    msg.len    = len_
-    msg.data   = 0
-
-    return msg
+    return s.pack( MemReqMsg.TYPE_READ, opaque, addr, len_, 0 )
 
   def mk_wr( s, opaque, addr, len_, data ):
-
-    msg        = s()
-    msg.type_  = MemReqMsg.TYPE_WRITE
-    msg.opaque = opaque
-    msg.addr   = addr
-    msg.len    = len_
-    msg.data   = data
-
-    return msg
+    return s.pack( MemReqMsg.TYPE_WRITE, opaque, addr, len_, data )
 
   def mk_msg( s, type_, opaque, addr, len_, data ):
-
-    msg        = s()
-    msg.type_  = type_
-    msg.opaque = opaque
-    msg.addr   = addr
-    msg.len    = len_
-    msg.data   = data
-
-    return msg
+    return s.pack( type_, opaque, addr, len_, data )
 
   def __str__( s ):
 
@@ -214,37 +190,13 @@ class MemRespMsg( BitStructDefinition ):
     s.data   = BitField( s.data_nbits   )
 
   def mk_rd( s, opaque, len_, data ):
-
-    msg        = s()
-    msg.type_  = MemReqMsg.TYPE_READ
-    msg.opaque = opaque
-    msg.test   = 0
-    msg.len    = len_
-    msg.data   = data
-
-    return msg
+    return s.pack( MemReqMsg.TYPE_READ, opaque, 0, len_, data )
 
   def mk_wr( s, opaque, len_ ):
-
-    msg        = s()
-    msg.type_  = MemReqMsg.TYPE_WRITE
-    msg.opaque = opaque
-    msg.test   = 0
-    msg.len    = len_
-    msg.data   = 0
-
-    return msg
+    return s.pack( MemReqMsg.TYPE_WRITE, opaque, 0, len_, 0 )
 
   def mk_msg( s, type_, opaque, len_, data ):
-
-    msg        = s()
-    msg.type_  = type_
-    msg.opaque = opaque
-    msg.test   = 0
-    msg.len    = len_
-    msg.data   = data
-
-    return msg
+    return s.pack( type_, opaque, 0, len_, data )
 
   def __str__( s ):
 
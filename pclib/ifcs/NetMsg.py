@@ -43,14 +43,7 @@ class NetMsg( BitStructDefinition ):
 
   # TODO: Should this be a class method?
   def mk_msg( s, dest, src, opaque, payload ):
-
-    msg         = s()
-    msg.dest    = dest
-    msg.src     = src
-    msg.opaque  = opaque
-    msg.payload = payload
-
-    return msg
+    return s.pack( dest, src, opaque, payload )
 
   #s.hash = hash(( num_routers, num_messages, payload_nbits ))
   #def __hash__( s ):
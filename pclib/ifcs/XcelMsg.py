@@ -32,22 +32,10 @@ class XcelReqMsg( BitStructDefinition ):
     s.data  = BitField( 32 )
 
   def mk_rd( s, raddr ):
-
-    msg       = s()
-    msg.type_ = XcelReqMsg.TYPE_READ
-    msg.raddr = raddr
-    msg.data  = 0
-
-    return msg
+    return s.pack( XcelReqMsg.TYPE_READ, raddr, 0 )
 
   def mk_wr( s, raddr, data ):
-
-    msg       = s()
-    msg.type_ = XcelReqMsg.TYPE_WRITE
-    msg.addr  = raddr
-    msg.data  = data
-
-    return msg
+    return s.pack( XcelReqMsg.TYPE_WRITE, raddr, data )
 
   def __str__( s ):
 
@@ -83,20 +71,10 @@ class XcelRespMsg( BitStructDefinition ):
     s.data  = BitField( 32 )
 
   def mk_rd( s, data ):
-
-    msg       = s()
-    msg.type_ = XcelReqMsg.TYPE_READ
-    msg.data  = data
-
-    return msg
+    return s.pack( XcelReqMsg.TYPE_READ, data )
 
   def mk_wr( s ):
-
-    msg       = s()
-    msg.type_ = XcelReqMsg.TYPE_WRITE
-    msg.data  = 0
-
-    return msg
+    return s.pack( XcelReqMsg.TYPE_WRITE, 0 )
 
   def __str__( s ):
 
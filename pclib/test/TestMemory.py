@@ -77,47 +77,50 @@ class TestMemory( Model ):
 
           memreq = req_q.deq()
 
+          # Decode all fields of the request at once
+
+          type_, opaque, addr, len_, data = memreq.unpack()
+
           # When len is zero, then we use all of the data
 
-          nbytes = memreq.len
-          if memreq.len == 0:
+          nbytes = len_
+          if len_ == 0:
             nbytes = s.data_nbits/8
 
           # Handle a read request
 
-          if memreq.type_ == MemReqMsg.TYPE_READ:
+          if type_ == MemReqMsg.TYPE_READ:
 
             # Copy the bytes from the bytearray into read data bits
 
-            read_data = Bits( s.data_nbits )
+            read_data = 0
             for j in range( nbytes ):
-              read_data[j*8:j*8+8] = s.mem[ memreq.addr + j ]
+              read_data |= s.mem[ addr + j ] << (j*8)
 
             # Create and enqueue response message
 
-            resp_q.enq( s.mk_rd_resp( memreq.opaque, memreq.len, read_data ) )
+            resp_q.enq( s.mk_rd_resp( opaque, len_, read_data ) )
 
           # Handle a write request
 
-          elif memreq.type_ == MemReqMsg.TYPE_WRITE:
+          elif type_ == MemReqMsg.TYPE_WRITE:
 
             # Copy write data bits into bytearray
 
-            write_data = memreq.data
             for j in range( nbytes ):
-              s.mem[ memreq.addr + j ] = write_data[j*8:j*8+8].uint()
+              s.mem[ addr + j ] = (data >> (j*8)) & 0xff
 
             # Create and enqueu response message
 
-            resp_q.enq( s.mk_wr_resp( memreq.opaque, 0 ) )
+            resp_q.enq( s.mk_wr_resp( opaque, 0 ) )
 
           # AMOS
 
-          elif ( memreq.type_ == MemReqMsg.TYPE_AMO_ADD  or
-                 memreq.type_ == MemReqMsg.TYPE_AMO_AND  or
-                 memreq.type_ == MemReqMsg.TYPE_AMO_OR   or
-                 memreq.type_ == MemReqMsg.TYPE_AMO_XCHG or
-                 memreq.type_ == MemReqMsg.TYPE_AMO_MIN ):
+          elif ( type_ == MemReqMsg.TYPE_AMO_ADD  or
+                 type_ == MemReqMsg.TYPE_AMO_AND  or
+                 type_ == MemReqMsg.TYPE_AMO_OR   or
+                 type_ == MemReqMsg.TYPE_AMO_XCHG or
+                 type_ == MemReqMsg.TYPE_AMO_MIN ):
 
             req_data = memreq.data
 
@@ -125,21 +128,20 @@ class TestMemory( Model ):
 
             read_data = Bits( s.data_nbits )
             for j in range( nbytes ):
-              read_data[j*8:j*8+8] = s.mem[ memreq.addr + j ]
+              read_data[j*8:j*8+8] = s.mem[ addr + j ]
 
             # compute the data to be written
 
-            write_data = AMO_FUNS[ memreq.type_.uint() ]( read_data, req_data )
+            write_data = AMO_FUNS[ type_ ]( read_data, req_data )
 
             # Copy write data bits into bytearray
 
             for j in range( nbytes ):
-              s.mem[ memreq.addr + j ] = write_data[j*8:j*8+8].uint()
+              s.mem[ addr + j ] = write_data[j*8:j*8+8].uint()
 
             # Create and enqueue response message
 
-            resp_q.enq( s.mk_misc_resp( memreq.type_, memreq.opaque,
-                                        memreq.len, read_data ) )
+            resp_q.enq( s.mk_misc_resp( type_, opaque, len_, read_data ) )
 
           # Unknown message type -- throw an exception
 
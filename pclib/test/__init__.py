@@ -17,3 +17,5 @@ from test_utils import mk_test_case_table
 from test_utils import run_test_vector_sim
 from test_utils import run_sim
 
+
+from sweep import run_sweep, iter_sweep, SweepTable
@@ -0,0 +1,280 @@
+#=========================================================================
+# sweep.py
+#=========================================================================
+# Parallel runner for sweeps over design parameters and seeds. Each point
+# of a parameter grid is elaborated and simulated (like run_sim) in a
+# worker of a process pool, and the per-run results are streamed back
+# into a SweepTable.
+#
+# Example:
+#
+#   table = run_sweep( mk_harness, { 'nports' : [2,4,8], 'seed' : range(16) } )
+#   print( table )
+#
+# The model factory is called with the parameters of each point as
+# keyword arguments and must return an un-elaborated model with a done()
+# method. Both the factory and parameter values are sent to the workers,
+# so they must be picklable (e.g., module-level functions or classes).
+
+from __future__ import print_function
+
+import csv
+import timeit
+import itertools
+import traceback
+import multiprocessing
+
+from collections import namedtuple
+
+from pymtl import SimulationTool, TranslationTool
+
+#-------------------------------------------------------------------------
+# SweepResult
+#-------------------------------------------------------------------------
+# Result of simulating a single point. error is None for runs which
+# finished, otherwise it is the timeout message or the full formatted
+# traceback of the exception. metrics is a (possibly empty) dict.
+
+SweepResult = namedtuple( 'SweepResult',
+  [ 'params', 'passed', 'ncycles', 'time', 'error', 'metrics' ] )
+
+#-------------------------------------------------------------------------
+# mk_sweep_points
+#-------------------------------------------------------------------------
+# Expand a parameter grid into a list of parameter dicts. A grid is either
+# a dict mapping each parameter name to a list of values (all
+# combinations are generated, varying the last parameter fastest), or an
+# explicit list of parameter dicts.
+
+def mk_sweep_points( grid ):
+
+  if isinstance( grid, dict ):
+    names = sorted( grid )
+    return [ dict( zip( names, values ) )
+             for values in itertools.product( *[ grid[n] for n in names ] ) ]
+
+  return [ dict( point ) for point in grid ]
+
+#-------------------------------------------------------------------------
+# run_sweep_point
+#-------------------------------------------------------------------------
+# Elaborate and simulate a single point. The model is reset and cycled
+# until done() or max_cycles, runs which time out or raise an exception
+# are reported as failures.
+
+def run_sweep_point( model_factory, params, max_cycles=5000,
+                     test_verilog=False, sched='event',
+                     collect_metrics=False ):
+
+  ncycles = 0
+  metrics = {}
+  error   = None
+  start   = timeit.default_timer()
+
+  try:
+
+    model = model_factory( **params )
+    model.vcd_file = ''
+    if test_verilog:
+      with _translate_lock:
+        model = TranslationTool( model )
+    model.elaborate()
+
+    sim = SimulationTool( model, collect_metrics=collect_metrics,
+                          sched=sched )
+    sim.reset()
+
+    while not model.done() and sim.ncycles < max_cycles:
+      sim.cycle()
+
+    ncycles = sim.ncycles
+    if not model.done():
+      error = 'timed out after {} cycles'.format( max_cycles )
+
+    if collect_metrics:
+      metrics = _summarize_metrics( sim.metrics )
+
+  except Exception:
+    error = traceback.format_exc().strip()
+
+  return SweepResult( params, error is None, ncycles,
+                      timeit.default_timer() - start, error, metrics )
+
+def _summarize_metrics( metrics ):
+  ncycles = metrics._ncycles
+  return {
+    'comb_evals'               : sum( metrics.comb_evals_per_cycle[:ncycles] ),
+    'add_events'               : sum( metrics.add_events_per_cycle[:ncycles] ),
+    'avg_comb_evals_per_cycle' : metrics.avg_comb_evals_per_cycle,
+  }
+
+#-------------------------------------------------------------------------
+# Worker Setup
+#-------------------------------------------------------------------------
+# Workers translating the same model share the Verilog, wrapper and
+# library files in the current directory (that is what lets them reuse
+# previously verilated libraries), so translation is serialized with a
+# lock shared by all workers of a pool.
+
+class _NullLock( object ):
+  def __enter__( self ):       pass
+  def __exit__( self, *args ): pass
+
+_translate_lock = _NullLock()
+
+def _init_worker( lock ):
+  global _translate_lock
+  _translate_lock = lock
+
+def _run_sweep_job( job ):
+  return run_sweep_point( *job[0], **job[1] )
+
+#-------------------------------------------------------------------------
+# iter_sweep
+#-------------------------------------------------------------------------
+# Simulate every point of the grid on a pool of nprocs processes
+# (default: one per core) and yield each SweepResult as soon as it
+# completes, so results arrive in completion order rather than grid
+# order. With nprocs=1 the points are simulated in this process.
+
+def iter_sweep( model_factory, grid, nprocs=None, **kwargs ):
+
+  points = mk_sweep_points( grid )
+  jobs   = [ ( ( model_factory, params ), kwargs ) for params in points ]
+
+  if nprocs is None:
+    nprocs = multiprocessing.cpu_count()
+  nprocs = max( 1, min( nprocs, len( jobs ) ) )
+
+  if nprocs == 1:
+    for job in jobs:
+      yield _run_sweep_job( job )
+    return
+
+  pool = multiprocessing.Pool( nprocs, _init_worker,
+                               ( multiprocessing.Lock(), ) )
+  try:
+    for result in pool.imap_unordered( _run_sweep_job, jobs ):
+      yield result
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+#-------------------------------------------------------------------------
+# run_sweep
+#-------------------------------------------------------------------------
+# Simulate every point of the grid and collect the results in a
+# SweepTable (in grid order). If a callback is given, it is called with
+# each SweepResult as it arrives, e.g. to report progress.
+
+def run_sweep( model_factory, grid, nprocs=None, callback=None, **kwargs ):
+
+  points  = mk_sweep_points( grid )
+  order   = dict( ( _point_key( p ), i ) for i, p in enumerate( points ) )
+  results = []
+
+  for result in iter_sweep( model_factory, points, nprocs, **kwargs ):
+    if callback:
+      callback( result )
+    results.append( result )
+
+  results.sort( key=lambda r: order.get( _point_key( r.params ), 0 ) )
+  return SweepTable( results )
+
+def _point_key( params ):
+  return repr( sorted( params.items() ) )
+
+#-------------------------------------------------------------------------
+# SweepTable
+#-------------------------------------------------------------------------
+# Table of sweep results with one row per point and one column per
+# parameter, followed by the result columns and any collected metrics.
+
+class SweepTable( object ):
+
+  result_columns = [ 'passed', 'ncycles', 'time', 'error' ]
+
+  def __init__( self, results=None ):
+    self.results = list( results or [] )
+
+  def append( self, result ):
+    self.results.append( result )
+
+  def __len__( self ):
+    return len( self.results )
+
+  def __iter__( self ):
+    return iter( self.results )
+
+  def __getitem__( self, idx ):
+    return self.results[ idx ]
+
+  #-----------------------------------------------------------------------
+  # columns
+  #-----------------------------------------------------------------------
+
+  @property
+  def param_columns( self ):
+    return sorted( set( k for r in self.results for k in r.params ) )
+
+  @property
+  def metric_columns( self ):
+    return sorted( set( k for r in self.results for k in r.metrics ) )
+
+  @property
+  def columns( self ):
+    return self.param_columns + self.result_columns + self.metric_columns
+
+  #-----------------------------------------------------------------------
+  # rows
+  #-----------------------------------------------------------------------
+  # Return the table as a list of tuples in column order.
+
+  def rows( self ):
+    params  = self.param_columns
+    metrics = self.metric_columns
+    return [ tuple( [ r.params.get( k ) for k in params ]
+                  + [ r.passed, r.ncycles, r.time, r.error ]
+                  + [ r.metrics.get( k ) for k in metrics ] )
+             for r in self.results ]
+
+  #-----------------------------------------------------------------------
+  # queries
+  #-----------------------------------------------------------------------
+
+  def passed( self ):
+    return [ r for r in self.results if r.passed ]
+
+  def failed( self ):
+    return [ r for r in self.results if not r.passed ]
+
+  @property
+  def total_time( self ):
+    return sum( r.time for r in self.results )
+
+  #-----------------------------------------------------------------------
+  # output
+  #-----------------------------------------------------------------------
+
+  def write_csv( self, fp ):
+    writer = csv.writer( fp )
+    writer.writerow( self.columns )
+    writer.writerows( self.rows() )
+
+  # Tracebacks are shortened to their last line to keep one line per
+  # point, write_csv keeps the full error.
+
+  def __str__( self ):
+
+    def fmt( value ):
+      if isinstance( value, float ):
+        return '{:.4f}'.format( value )
+      return '' if value is None else str( value ).splitlines()[-1]
+
+    table  = [ self.columns ] + [ [ fmt( x ) for x in row ] for row in self.rows() ]
+    widths = [ max( len( row[i] ) for row in table )
+               for i in range( len( self.columns ) ) ]
+
+    return '\n'.join( '  '.join( x.ljust( w ) for x, w in zip( row, widths ) )
+                      .rstrip() for row in table )
@@ -0,0 +1,116 @@
+#=========================================================================
+# sweep_test.py
+#=========================================================================
+
+import pytest
+
+from StringIO   import StringIO
+
+from pymtl      import *
+from pclib.test import run_sweep, iter_sweep, SweepTable
+from sweep      import mk_sweep_points, run_sweep_point
+
+#-------------------------------------------------------------------------
+# Counter
+#-------------------------------------------------------------------------
+# Done once the counter reaches limit, optionally raises an exception
+# while being constructed.
+
+class Counter( Model ):
+
+  def __init__( s, nbits, limit, fail=False ):
+
+    if fail:
+      raise ValueError( 'bad parameters' )
+
+    s.count = OutPort( nbits )
+    s.limit = limit
+
+    @s.tick
+    def logic():
+      if s.reset: s.count.next = 0
+      else:       s.count.next = s.count + 1
+
+  def done( s ):
+    return s.count == s.limit
+
+#-------------------------------------------------------------------------
+# test_mk_sweep_points
+#-------------------------------------------------------------------------
+
+def test_mk_sweep_points():
+
+  points = mk_sweep_points({ 'b' : [ 1, 2 ], 'a' : [ 'x', 'y' ] })
+  assert points == [ { 'a' : 'x', 'b' : 1 }, { 'a' : 'x', 'b' : 2 },
+                     { 'a' : 'y', 'b' : 1 }, { 'a' : 'y', 'b' : 2 } ]
+
+  assert mk_sweep_points([ { 'a' : 1 } ]) == [ { 'a' : 1 } ]
+
+#-------------------------------------------------------------------------
+# test_run_sweep_point
+#-------------------------------------------------------------------------
+
+def test_run_sweep_point():
+
+  result = run_sweep_point( Counter, { 'nbits' : 8, 'limit' : 10 },
+                            collect_metrics=True )
+  assert result.passed
+  assert result.error is None
+  assert result.ncycles == 12
+  assert sorted( result.metrics ) == [ 'add_events', 'avg_comb_evals_per_cycle',
+                                      'comb_evals' ]
+
+  result = run_sweep_point( Counter, { 'nbits' : 8, 'limit' : 500 },
+                            max_cycles=100 )
+  assert not result.passed
+  assert result.ncycles == 100
+  assert 'timed out' in result.error
+
+  result = run_sweep_point( Counter, { 'nbits' : 8, 'limit' : 1,
+                                          'fail'  : True } )
+  assert not result.passed
+  assert result.error.startswith( 'Traceback' )
+  assert 'in __init__' in result.error
+  assert result.error.splitlines()[-1] == 'ValueError: bad parameters'
+
+  table = SweepTable( [ result ] )
+  assert str( table ).splitlines()[1].endswith( 'ValueError: bad parameters' )
+
+#-------------------------------------------------------------------------
+# test_run_sweep
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'nprocs', [ 1, 2 ] )
+def test_run_sweep( nprocs ):
+
+  grid   = { 'nbits' : [ 4, 8 ], 'limit' : [ 5, 20 ] }
+  seen   = []
+  table  = run_sweep( Counter, grid, nprocs=nprocs,
+                      callback=seen.append, max_cycles=50 )
+
+  assert len( table ) == len( seen ) == 4
+  assert isinstance( table, SweepTable )
+
+  # 4-bit counters never reach 20
+  assert [ ( r.params[ 'limit' ], r.params[ 'nbits' ], r.passed )
+           for r in table ] == [ ( 5, 4, True ), ( 5, 8, True ),
+                                 ( 20, 4, False ), ( 20, 8, True ) ]
+  assert len( table.failed() ) == 1
+
+  assert table.columns == [ 'limit', 'nbits', 'passed', 'ncycles', 'time',
+                            'error' ]
+  assert table.rows()[0][:4] == ( 5, 4, True, 7 )
+
+  lines = str( table ).splitlines()
+  assert len( lines ) == 5
+  assert lines[0].split() == table.columns
+
+  fp = StringIO()
+  table.write_csv( fp )
+  assert fp.getvalue().splitlines()[0] == ','.join( table.columns )
+
+def test_iter_sweep():
+
+  results = list( iter_sweep( Counter, [ { 'nbits' : 8, 'limit' : n }
+                                            for n in range( 1, 9 ) ], nprocs=4 ) )
+  assert sorted( r.ncycles for r in results ) == range( 3, 11 )
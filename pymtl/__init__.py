@@ -29,6 +29,7 @@ from datatypes.SignalValue import CreateWrappedClass
 #-----------------------------------------------------------------------
 
 from tools.simulation.SimulationTool import SimulationTool
+from tools.simulation.swapping       import SwappableModel
 from tools.translation.verilator_sim import TranslationTool
 from tools.translation.cpp_sim       import get_cpp
 from tools.integration.verilog       import VerilogModel
@@ -64,6 +65,7 @@ __all__ = [ # Model Construction
             'Model',
             'VerilogModel',
             'SystemCModel',
+            'SwappableModel',
             # Signals
             'InPort',
             'OutPort',
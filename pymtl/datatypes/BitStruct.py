@@ -4,7 +4,9 @@
 
 from __future__ import print_function
 
-from Bits import Bits
+from collections import namedtuple
+
+from Bits import Bits, _get_nbits, _get_width, _new_slice
 
 #=======================================================================
 # MetaBitStruct
@@ -53,6 +55,43 @@ class MetaBitStruct( type ):
   #
   def __call__( self, *args, **kwargs ):
     #print( "- Meta CALL", args )   # DEBUG
+    global _cache_hits, _cache_misses
+
+    # Identical parameterizations of a BitStructDefinition share the same
+    # BitStruct class. Unhashable arguments cannot be cached.
+    key = ( self, args, tuple( sorted( kwargs.items() ) ) )
+    try:
+      bitstruct_class = _class_cache.get( key )
+    except TypeError:
+      key = bitstruct_class = None
+
+    if bitstruct_class is None:
+      _cache_misses  += 1
+      bitstruct_class = self._create_bitstruct_class( args, kwargs )
+      if key is not None:
+        _class_cache[ key ] = bitstruct_class
+    else:
+      _cache_hits += 1
+
+    # Return an instance of the BitStruct class
+    bitstruct_inst = bitstruct_class( bitstruct_class._nbits )
+
+    # TODO: hack for verilog translation!
+    bitstruct_inst._module    = self.__module__
+    bitstruct_inst._classname = self.__name__
+    bitstruct_inst._instantiate = '{class_name}{args}'.format(
+        class_name = self.__name__,
+        args       = args,
+    )
+    assert not kwargs
+
+    return bitstruct_inst
+
+  #---------------------------------------------------------------------
+  # _create_bitstruct_class
+  #---------------------------------------------------------------------
+  # Create the BitStruct class for the provided definition arguments.
+  def _create_bitstruct_class( self, args, kwargs ):
 
     # Instantiate the user-created BitStructDefinition class
     def_inst = super( MetaBitStruct, self ).__call__( *args, **kwargs )
@@ -67,17 +106,21 @@ class MetaBitStruct( type ):
     # Get the total size of the BitStruct
     nbits = sum( [ f.nbits for name, f in fields ] )
 
-    # Create the new BitStruct class, then instantiate it
+    # Create the new BitStruct class
     name_prfx       = def_inst.__class__.__name__
     name_sufx       = '_'.join(str(x) for x in args)
     class_name      = "{}_{}".format( name_prfx, name_sufx )
     bitstruct_class = type( class_name, ( BitStruct, ), self._classdict )
+    bitstruct_class._nbits      = nbits
+    bitstruct_class._definition = self
 
     # Keep track of bit positions for each bitfield
     start_pos = 0
+    layout    = []
     bitstruct_class._bitfields = {}
+    bitstruct_class._accessors = {}
 
-    # Transform attributes containing BitField objects into properties,
+    # Transform attributes containing BitField objects into accessors,
     # when accessed they return slices of the underlying value
     for attr_name, bitfield in fields:
 
@@ -88,39 +131,165 @@ class MetaBitStruct( type ):
 
       # Add slice to bitfields
       bitstruct_class._bitfields[ attr_name ] = addr
+      layout.append( ( attr_name, addr.start, bitfield.nbits ) )
 
-      # Create a getter to assign to the property
-      def create_getter( addr ):
-        return lambda self : self.__getitem__( addr )
+      # Add the accessor to the class
+      accessor = BitFieldAccessor( attr_name, addr.start, bitfield.nbits )
+      bitstruct_class._accessors[ attr_name ] = accessor
+      setattr( bitstruct_class, attr_name, accessor )
 
-      # Create a setter to assign to the property
-      # TODO: not needed when returning ConnectionSlice and accessing .value
-      def create_setter( addr ):
-        return lambda self, value: self.__setitem__( addr, value )
-
-      # Add the property to the class
-      setattr( bitstruct_class, attr_name,
-               property( create_getter( addr ),
-                         create_setter( addr )
-                       )
-             )
+    # Precompile the pack/unpack methods for the field layout, fields
+    # are passed and returned in order of declaration (MSB first)
+    _compile_pack_unpack( bitstruct_class, layout[::-1], nbits )
 
     if '__str__' in def_inst.__class__.__dict__:
       bitstruct_class.__str__ = def_inst.__class__.__dict__['__str__']
 
-    # Return an instance of the new BitStruct class
-    bitstruct_inst = bitstruct_class( nbits )
+    return bitstruct_class
 
-    # TODO: hack for verilog translation!
-    bitstruct_inst._module    = def_inst.__class__.__module__
-    bitstruct_inst._classname = def_inst.__class__.__name__
-    bitstruct_inst._instantiate = '{class_name}{args}'.format(
-        class_name = def_inst.__class__.__name__,
-        args       = args,
-    )
-    assert not kwargs
+#-----------------------------------------------------------------------
+# Class Cache
+#-----------------------------------------------------------------------
+# BitStruct classes created by MetaBitStruct, keyed by the definition
+# class and its arguments.
 
-    return bitstruct_inst
+_class_cache  = {}
+_cache_hits   = 0
+_cache_misses = 0
+
+BitStructCacheInfo = namedtuple( 'BitStructCacheInfo',
+                                 [ 'hits', 'misses', 'size' ] )
+
+#-----------------------------------------------------------------------
+# bitstruct_cache_info
+#-----------------------------------------------------------------------
+# Return the number of cache hits, misses (classes created) and the
+# number of cached BitStruct classes.
+def bitstruct_cache_info():
+  return BitStructCacheInfo( _cache_hits, _cache_misses, len( _class_cache ) )
+
+#-----------------------------------------------------------------------
+# find_bitstruct_class
+#-----------------------------------------------------------------------
+# Return the cached BitStruct class named name whose definition lives in
+# module, or None if no such class was created.
+def find_bitstruct_class( module, name ):
+  for bitstruct_class in _class_cache.values():
+    if ( bitstruct_class.__name__ == name and
+         bitstruct_class._definition.__module__ == module ):
+      return bitstruct_class
+  return None
+
+#-----------------------------------------------------------------------
+# clear_bitstruct_cache
+#-----------------------------------------------------------------------
+# Clear the cache and reset its counters. BitStruct instances created
+# before clearing keep their (now uncached) classes.
+def clear_bitstruct_cache():
+  global _cache_hits, _cache_misses
+  _class_cache.clear()
+  _cache_hits   = 0
+  _cache_misses = 0
+
+#-----------------------------------------------------------------------
+# _compile_pack_unpack
+#-----------------------------------------------------------------------
+# Generate the pack() classmethod and unpack() method of a BitStruct
+# class. For a layout [ ('type_', 8, 3), ('addr', 0, 8) ] this generates:
+#
+#   def pack( _pymtl_cls, type_=0, addr=0 ):
+#     if _pymtl_get_nbits( type_ ) > 3:
+#       raise _pymtl_too_big( 'type_', 3, type_ )
+#     if _pymtl_get_nbits( addr ) > 8:
+#       raise _pymtl_too_big( 'addr', 8, addr )
+#     _pymtl_inst        = _pymtl_object_new( _pymtl_cls )
+#     _pymtl_inst.nbits  = 11
+#     _pymtl_inst._width = _pymtl_width
+#     _pymtl_inst._uint  = ( ((_pymtl_int( type_ ) & 0x7) << 8)
+#                          | (_pymtl_int( addr ) & 0xff) )
+#     return _pymtl_inst
+#
+#   def unpack( self ):
+#     v = self._uint
+#     return _pymtl_fields_tuple( ((v >> 8) & 0x7), (v & 0xff) )
+#
+# The field names are the parameters of pack, so all other names used
+# by pack are prefixed with _pymtl_ to keep them apart from the fields.
+def _compile_pack_unpack( bitstruct_class, layout, nbits ):
+
+  names = [ name for name, offset, width in layout ]
+
+  for name in names:
+    if name.startswith( '_pymtl_' ):
+      raise ValueError( 'BitField name {} is reserved'.format( name ) )
+
+  def field( value, offset, width ):
+    expr = '({} & {:#x})'.format( value, (1 << width) - 1 )
+    return '({} << {})'.format( expr, offset ) if offset else expr
+
+  # Generate the source for pack
+
+  src = [ 'def pack( _pymtl_cls, {} ):'.format(
+          ', '.join( '{}=0'.format( name ) for name in names ) ) ]
+
+  for name, offset, width in layout:
+    src.extend([
+      '  if _pymtl_get_nbits( {} ) > {}:'.format( name, width ),
+      "    raise _pymtl_too_big( '{0}', {1}, {0} )".format( name, width ),
+    ])
+
+  src.extend([
+    '  _pymtl_inst        = _pymtl_object_new( _pymtl_cls )',
+    '  _pymtl_inst.nbits  = {}'.format( nbits ),
+    '  _pymtl_inst._width = _pymtl_width',
+    '  _pymtl_inst._uint  = ( {} )'.format( ' | '.join(
+         field( '_pymtl_int( {} )'.format( name ), offset, width )
+         for name, offset, width in layout ) ),
+    '  return _pymtl_inst',
+    '',
+  ])
+
+  # Generate the source for unpack
+
+  src.extend([
+    'def unpack( self ):',
+    '  v = self._uint',
+    '  return _pymtl_fields_tuple( {} )'.format( ', '.join(
+         field( '(v >> {})'.format( offset ) if offset else 'v', 0, width )
+         for name, offset, width in layout ) ),
+  ])
+
+  src = '\n'.join( src ) + '\n'
+
+  # Compile the methods and add them to the class
+
+  fields_tuple = namedtuple( bitstruct_class.__name__ + '_fields', names )
+  namespace    = {
+    '_pymtl_object_new'  : object.__new__,
+    '_pymtl_width'       : _get_width( nbits ),
+    '_pymtl_get_nbits'   : _get_nbits,
+    '_pymtl_int'         : int,
+    '_pymtl_too_big'     : _field_too_big,
+    '_pymtl_fields_tuple': fields_tuple,
+  }
+  exec( compile( src, '<{} pack>'.format( bitstruct_class.__name__ ), 'exec' ),
+        namespace )
+
+  bitstruct_class._pack_src     = src
+  bitstruct_class._fields_tuple = fields_tuple
+  bitstruct_class.pack          = classmethod( namespace['pack'] )
+  bitstruct_class.unpack        = namespace['unpack']
+
+#-----------------------------------------------------------------------
+# _field_too_big
+#-----------------------------------------------------------------------
+# Return the error raised when a value does not fit in a field.
+def _field_too_big( name, nbits, value ):
+  return ValueError(
+    'Provided value is too big to fit in field {} ({} bits)!\n'
+    '({} bits are needed to represent value = {} in two\'s complement.)'
+    .format( name, nbits, _get_nbits( value ), value )
+  )
 
 #=======================================================================
 # BitStructDefinition
@@ -147,6 +316,55 @@ class BitField( object ):
     self.id       = BitField.ids
     BitField.ids += 1
 
+#=======================================================================
+# BitFieldAccessor
+#=======================================================================
+# Descriptor implementing a field of a BitStruct class. Reading the field
+# returns a new BitSlice holding a snapshot of the field, which writes
+# through to the BitStruct (msg.addr.value = 4 in simulation). Writing
+# the field updates the value in place.
+#
+class BitFieldAccessor( object ):
+
+  __slots__ = ( 'name', 'offset', 'width', 'mask' )
+
+  def __init__( self, name, offset, nbits ):
+    self.name   = name
+    self.offset = offset
+    self.width  = _get_width( nbits )
+    self.mask   = self.width.mask
+
+  def __get__( self, inst, owner ):
+    if inst is None:
+      return self
+    return _new_slice( inst, self.offset, self.width )
+
+  def __set__( self, inst, value ):
+    self.write( inst, value )
+
+  #---------------------------------------------------------------------
+  # read
+  #---------------------------------------------------------------------
+  # Return the value of the field as an int.
+  def read( self, inst ):
+    return (inst._uint >> self.offset) & self.mask
+
+  #---------------------------------------------------------------------
+  # write
+  #---------------------------------------------------------------------
+  # Write the value of the field in place.
+  def write( self, inst, value ):
+    value = int( value )
+
+    # This fires if the value you are trying to store is wider than the
+    # bitwidth of the field you are writing to!
+    if not (self.width.nbits >= _get_nbits( value )):
+      raise _field_too_big( self.name, self.width.nbits, value )
+
+    mask = self.mask
+    inst._uint = ( (inst._uint & ~(mask << self.offset))
+                 | ((value & mask) << self.offset) )
+
 #=======================================================================
 # BitStruct
 #=======================================================================
@@ -164,6 +382,40 @@ class BitStruct( Bits ):
   def bitfields( self ):
     return self._bitfields
 
+  #---------------------------------------------------------------------
+  # read_field
+  #---------------------------------------------------------------------
+  # Return the value of a field as an int, without creating a slice.
+  #
+  #   addr = msg.read_field( 'addr' )
+  #
+  def read_field( self, name ):
+    return self._accessors[ name ].read( self )
+
+  #---------------------------------------------------------------------
+  # write_field
+  #---------------------------------------------------------------------
+  # Write the value of a field in place. Like writing the field attribute
+  # (msg.addr = 4), this does not notify the simulator, in simulation
+  # use msg.addr.value instead.
+  #
+  #   msg.write_field( 'addr', 4 )
+  #
+  def write_field( self, name, value ):
+    self._accessors[ name ].write( self, value )
+
+  #---------------------------------------------------------------------
+  # pack/unpack
+  #---------------------------------------------------------------------
+  # Each generated BitStruct class gets a precompiled pack classmethod
+  # which builds a new instance from field values in a single expression,
+  # and an unpack method which returns all fields as a namedtuple of
+  # ints. Fields are in order of declaration, omitted fields are zero.
+  #
+  #   msg = dtype.pack( type_=0, addr=0x1000, data=3 )
+  #   type_, addr, data = msg.unpack()
+  #
+
   #---------------------------------------------------------------------
   # __call__
   #---------------------------------------------------------------------
@@ -3,10 +3,12 @@
 #=======================================================================
 
 import math
+import pytest
 
 from pymtl     import *
 from Bits      import Bits
 from BitStruct import BitStructDefinition, BitField
+from BitStruct import bitstruct_cache_info, clear_bitstruct_cache
 
 #-----------------------------------------------------------------------
 # Example BitStruct and Enums
@@ -120,12 +122,120 @@ def test_bitstruct_call():
     y.addr = 8
     assert x.addr != y.addr
 
+#-----------------------------------------------------------------------
+# Test field slices
+#-----------------------------------------------------------------------
+
+def test_bitstruct_field_slices():
+
+  x = MemMsg( 16, 32 )
+  x.addr = 0xbeef
+
+  # Field reads return independent snapshots of the field
+  a = x.addr
+  assert a == 0xbeef
+  assert x.addr is not a
+  x.addr = 0x1234
+  assert a == 0xbeef
+  assert x.addr == 0x1234
+
+  # Field values used as dict keys are not changed by later writes
+  d = { x.addr : 'a' }
+  x.addr = 0x5678
+  assert d.keys() == [ 0x1234 ]
+
+  # Writes through a field slice update the struct
+  x.addr.v = 0xcafe
+  assert x.addr == 0xcafe
+  assert x.read_field( 'addr' ) == 0xcafe
+
+  # Copies snapshot the value
+  y = x[:]
+  z = x.addr[:]
+  assert type( y ) is type( x )
+  x.addr = 0x1
+  assert y.addr == 0xcafe
+  assert z      == 0xcafe
+  assert type( z ) is Bits
+
+def test_bitstruct_write_field():
+
+  x = MemMsg( 16, 32 )
+  x.write_field( 'addr', 0xbeef )
+  x.write_field( 'data', 0xabcd1234 )
+  x.write_field( 'len',  MemMsg.HALF )
+  assert x.read_field( 'addr' ) == 0xbeef
+  assert x.read_field( 'data' ) == 0xabcd1234
+  assert x.read_field( 'len'  ) == MemMsg.HALF
+  assert x.read_field( 'type_') == MemMsg.READ
+  assert x == (0xbeef << 34) | (MemMsg.HALF << 32) | 0xabcd1234
+  assert isinstance( x.read_field( 'addr' ), (int, long) )
+
+  with pytest.raises( ValueError ):
+    x.write_field( 'len', 4 )
+  with pytest.raises( ValueError ):
+    x.addr = 0x10000
+
+#-----------------------------------------------------------------------
+# Test pack/unpack
+#-----------------------------------------------------------------------
+
+def test_bitstruct_pack_unpack():
+
+  dtype = MemMsg( 16, 32 )
+
+  x = dtype.pack( type_=1, addr=0xbeef, len=2, data=0xabcd1234 )
+  assert type( x ) is type( dtype )
+  assert x.type_ == 1
+  assert x.addr  == 0xbeef
+  assert x.len   == 2
+  assert x.data  == 0xabcd1234
+
+  # Positional arguments are in order of declaration, omitted fields and
+  # Bits arguments are allowed
+  y = dtype.pack( 1, Bits( 16, 0xbeef ), 2 )
+  assert y == x & ~Bits( x.nbits, 0xffffffff )
+  assert type( dtype ).pack( data=-1 ).data == 0xffffffff
+
+  # Unpack returns a namedtuple of ints
+  fields = x.unpack()
+  assert fields == ( 1, 0xbeef, 2, 0xabcd1234 )
+  assert fields.addr == 0xbeef
+  assert fields._fields == ( 'type_', 'addr', 'len', 'data' )
+  assert dtype.pack( *fields ) == x
+
+  with pytest.raises( ValueError ):
+    dtype.pack( len=4 )
+
+#-----------------------------------------------------------------------
+# Test pack with field names used by the generated code
+#-----------------------------------------------------------------------
+
+class NamesMsg( BitStructDefinition ):
+
+  def __init__( s ):
+    s.cls  = BitField( 4 )
+    s.inst = BitField( 4 )
+    s.int  = BitField( 4 )
+
+def test_bitstruct_pack_field_names():
+
+  dtype = NamesMsg()
+
+  x = dtype.pack( cls=1, inst=2, int=3 )
+  assert x.cls  == 1
+  assert x.inst == 2
+  assert x.int  == 3
+  assert x.unpack() == ( 1, 2, 3 )
+  assert dtype.pack( 4, 5 ).unpack() == ( 4, 5, 0 )
+
+  with pytest.raises( ValueError ):
+    dtype.pack( inst=16 )
+
 #-----------------------------------------------------------------------
 # Test two instances with same params
 #-----------------------------------------------------------------------
-import pytest
-@pytest.mark.xfail
-def test_bitstruct_call():
+def test_bitstruct_same_params():
 
   bits_a = Bits( 8 )
   bits_b = Bits( 8 )
@@ -135,10 +245,36 @@ def test_bitstruct_call():
 
   type_a = MemMsg( 16, 32 )
   type_b = MemMsg( 16, 32 )
+  type_c = MemMsg( 16, 64 )
 
-  # Fails.  Each call to MemMsg uses metaclassed to build a new class.
-  # Possible fixes: caching?
+  # Identical parameterizations share the cached BitStruct class, but
+  # still return separate instances.
   assert type( type_a ) == type( type_b )
+  assert type( type_a ) != type( type_c )
+  assert type_a is not type_b
+  assert isinstance( type_b(), type( type_a ) )
+  assert type_b._instantiate == 'MemMsg(16, 32)'
+
+#-----------------------------------------------------------------------
+# Test the BitStruct class cache
+#-----------------------------------------------------------------------
+
+def test_bitstruct_cache():
+
+  clear_bitstruct_cache()
+  assert bitstruct_cache_info() == ( 0, 0, 0 )
+
+  type_a = MemMsg( 8, 32 )
+  type_b = MemMsg( 8, 32 )
+  type_c = MemMsg( 8, 64 )
+  assert bitstruct_cache_info() == ( 1, 2, 2 )
+  assert bitstruct_cache_info().hits == 1
+
+  # After clearing, a new class is created
+  clear_bitstruct_cache()
+  type_d = MemMsg( 8, 32 )
+  assert type( type_d ) != type( type_a )
+  assert bitstruct_cache_info() == ( 0, 1, 1 )
 
 #-----------------------------------------------------------------------
 # Check Combinational Logic
@@ -5,8 +5,6 @@
 
 from SignalValue import SignalValue
 
-import copy
-
 #-----------------------------------------------------------------------
 # _get_nbits
 #-----------------------------------------------------------------------
@@ -15,43 +13,144 @@ def _get_nbits( N ):
   if N > 0: return N.bit_length()
   else:     return N.bit_length() + 1
 
+#-----------------------------------------------------------------------
+# _new_bits
+#-----------------------------------------------------------------------
+# Fast constructor used by the operators. Creates a Bits object from a
+# width descriptor and an int without validating the value, the value is
+# simply truncated to the width.
+_object_new = object.__new__
+def _new_bits( width, value ):
+  inst        = _object_new( Bits )
+  inst.nbits  = width.nbits
+  inst._width = width
+  inst._uint  = value & width.mask
+  return inst
+
+#-----------------------------------------------------------------------
+# _new_slice
+#-----------------------------------------------------------------------
+# Fast constructor for BitSlices used by __getitem__, the indices must
+# already have been checked.
+def _new_slice( target_bits, offset, width ):
+  inst              = _object_new( BitSlice )
+  inst.nbits        = width.nbits
+  inst._width       = width
+  inst._uint        = (target_bits._uint >> offset) & width.mask
+  inst._target_bits = target_bits
+  inst._offset      = offset
+  inst.notify_sim_comb_update = target_bits.notify_sim_comb_update
+  inst.notify_sim_seq_update  = target_bits.notify_sim_seq_update
+  return inst
+
+_int_types = ( int, long )
+
+#-----------------------------------------------------------------------
+# _BitsWidth
+#-----------------------------------------------------------------------
+# Descriptor holding the constants derived from a bitwidth. Descriptors
+# are shared by all Bits objects of the same width (see _get_width), so
+# creating a Bits object does not need to recompute them.
+class _BitsWidth( object ):
+
+  __slots__ = ( 'nbits', 'mask', 'min', 'max' )
+
+  def __init__( self, nbits ):
+    self.nbits = nbits
+    self.mask  = ( 1 << nbits ) - 1
+    self.max   = self.mask
+    self.min   = -( 1 << (nbits - 1) ) if nbits > 1 else 0
+
+#-----------------------------------------------------------------------
+# _get_width
+#-----------------------------------------------------------------------
+# Return the shared _BitsWidth descriptor for the given bitwidth.
+_width_table = {}
+def _get_width( nbits ):
+  try:
+    return _width_table[ nbits ]
+  except KeyError:
+    pass
+
+  nbits = int( nbits )
+
+  # Make sure width is non-zero and that we have space for the value
+  if not (nbits > 0 ):
+    raise ValueError('The value of nbits must be > 0!')
+
+  width = _width_table.get( nbits )
+  if width is None:
+    width = _width_table[ nbits ] = _BitsWidth( nbits )
+  return width
+
+_bit_width = _get_width( 1 )
+
 #-----------------------------------------------------------------------
 # Bits
 #-----------------------------------------------------------------------
+# The nbits, value and width descriptor of each Bits object are stored in
+# __slots__. Bits objects still have a __dict__ (from SignalValue) for
+# attributes attached by the simulator and BitStructs, but it is only
+# allocated when such an attribute is set, so temporaries created by the
+# operators below never allocate one.
 class Bits( SignalValue ):
   'Class emulating limited precision values of a fixed bitwidth.'
 
+  __slots__ = ( 'nbits', '_uint', '_width' )
+
+  # The slice of the target Bits object this object represents
+  slice = slice( None )
+
   #---------------------------------------------------------------------
   # __init__
   #---------------------------------------------------------------------
   def __init__( self, nbits, value = 0, trunc = False ):
 
-    value = int( value )
-    nbits = int( nbits )
-
-    # Make sure width is non-zero and that we have space for the value
-    if not (nbits > 0 ):
-      raise ValueError('The value of nbits must be > 0!')
+    try:
+      width = _width_table[ nbits ]
+    except (KeyError, TypeError):
+      width = _get_width( nbits )
 
-    # Set the nbits and bitmask (_mask) attributes
-    self.nbits = nbits
-    self._max  = (2**nbits)- 1
-    self._min  = -2**(nbits- 1) if nbits > 1 else 0
-    self._mask = ( 1 << self.nbits ) - 1
-    self.slice = slice( None )
+    value = int( value )
 
-    if not trunc and not (self._min <= value <= self._max):
+    if not trunc and not (width.min <= value <= width.max):
       raise ValueError(
         'Value is too big to be represented with Bits({})!\n'
         '({} bits are needed to represent value = {} in two\'s complement.)'
-        .format( self.nbits, _get_nbits(value), value )
+        .format( width.nbits, _get_nbits(value), value )
       )
 
-    # Convert negative values into unsigned ints and store them
-    value_uint = value if ( value >= 0 ) else ( ~(-value) + 1 )
-    self._uint = value_uint & self._mask
+    # Store the width descriptor and value, masking negative values
+    # yields their unsigned two's complement representation.
+    self.nbits  = width.nbits
+    self._width = width
+    self._uint  = value & width.mask
 
-    self._target_bits = self
+  #---------------------------------------------------------------------
+  # Width Constants
+  #---------------------------------------------------------------------
+  # Read-only accessors for the constants in the width descriptor.
+  @property
+  def _mask( self ):
+    return self._width.mask
+
+  @property
+  def _max( self ):
+    return self._width.max
+
+  @property
+  def _min( self ):
+    return self._width.min
+
+  #---------------------------------------------------------------------
+  # _target_bits
+  #---------------------------------------------------------------------
+  # The Bits object writes should be applied to, a Bits object is its own
+  # target (BitSlices override this). Implemented as a property to avoid
+  # a reference cycle in every Bits object.
+  @property
+  def _target_bits( self ):
+    return self
 
   #---------------------------------------------------------------------
   # __call__
@@ -60,6 +159,34 @@ class Bits( SignalValue ):
   def __call__( self ):
     return Bits( self.nbits )
 
+  #---------------------------------------------------------------------
+  # __copy__
+  #---------------------------------------------------------------------
+  # Copies (e.g., signal[:]) only copy the value. Attributes attached by
+  # the simulator (shadow values, callbacks) are not carried over, so
+  # writes to a copy can never trigger simulator updates.
+  def __copy__( self ):
+    inst        = _object_new( type( self ) )
+    inst.nbits  = self.nbits
+    inst._width = self._width
+    inst._uint  = self._uint
+    return inst
+
+  def __deepcopy__( self, memo ):
+    return self.__copy__()
+
+  #---------------------------------------------------------------------
+  # __getstate__/__setstate__
+  #---------------------------------------------------------------------
+  # Like copies, pickles only hold the value. Needed for pickle protocols
+  # 0 and 1, which cannot pickle classes with __slots__ otherwise.
+  def __getstate__( self ):
+    return ( self.nbits, self._uint )
+
+  def __setstate__( self, state ):
+    self.nbits, self._uint = state
+    self._width = _get_width( self.nbits )
+
   #---------------------------------------------------------------------
   # __int__
   #---------------------------------------------------------------------
@@ -93,9 +220,8 @@ class Bits( SignalValue ):
   #---------------------------------------------------------------------
   # Return the integer representation of the bits.
   def int( self ):
-    if self[ self.nbits - 1]:
-      twos_complement = ~self + 1
-      return -twos_complement._uint
+    if self._uint >> (self.nbits - 1):
+      return self._uint - (1 << self.nbits)
     else:
       return self._uint
 
@@ -105,13 +231,14 @@ class Bits( SignalValue ):
   # Implementing abstract write_value method defined by SignalValue.
   def write_value( self, value ):
     value = int( value )
-    if not (self._min <= value <= self._max):
+    width = self._width
+    if not (width.min <= value <= width.max):
       raise ValueError(
         'Value is too big to be represented with Bits({})!\n'
         '({} bits are needed to represent value = {} in two\'s complement.)'
         .format( self.nbits, _get_nbits(value), value )
       )
-    self._uint = (value & self._mask)
+    self._uint = (value & width.mask)
 
   #---------------------------------------------------------------------
   # write_next
@@ -119,13 +246,14 @@ class Bits( SignalValue ):
   # Implementing abstract write_next method defined by SignalValue.
   def write_next( self, value ):
     value = int( value )
-    if not (self._min <= value <= self._max):
+    width = self._width
+    if not (width.min <= value <= width.max):
       raise ValueError(
         'Value is too big to be represented with Bits({})!\n'
         '({} bits are needed to represent value = {} in two\'s complement.)'
         .format( self.nbits, _get_nbits(value), value )
       )
-    self._next._uint = (value & self._mask)
+    self._next._uint = (value & width.mask)
 
   #---------------------------------------------------------------------
   # bit_length
@@ -191,7 +319,7 @@ class Bits( SignalValue ):
 
       # Open-ended range ( [:] ), return a copy of self
       if start is None and stop is None:
-        return copy.copy( self )
+        return self.__copy__()
 
       # Open-ended range on left ( [:N] )
       elif start is None:
@@ -213,10 +341,7 @@ class Bits( SignalValue ):
                          .format(start, stop, self.nbits) )
 
       # Create a new Bits object containing the slice value and return it
-      nbits = stop - start
-      mask  = (1 << nbits) - 1
-      value = (self._uint & (mask << start)) >> start
-      return BitSlice( nbits, value, target_bits = self, offset = start )
+      return _new_slice( self, start, _get_width( stop - start ) )
 
     # Handle integers
     else:
@@ -229,8 +354,7 @@ class Bits( SignalValue ):
                          .format(addr, self.nbits) )
 
       # Create a new Bits object containing the bit value and return it
-      value = (self._uint & (1 << addr)) >> addr
-      return BitSlice( 1 , value, target_bits = self, offset = addr )
+      return _new_slice( self, addr, _bit_width )
 
   #----------------------------------------------------------------------
   # __setitem__
@@ -256,7 +380,8 @@ class Bits( SignalValue ):
 
       # Open-ended range ( [:] )
       if start is None and stop is None:
-        if not (self._min <= value <= self._max):
+        width = self._width
+        if not (width.min <= value <= width.max):
           raise ValueError(
             'Provided value is too big to be represented with Bits({})!\n'
             '({} bits are needed to represent value = {} in two\'s complement.)'
@@ -328,24 +453,41 @@ class Bits( SignalValue ):
   # For now, let's make the width equal to the max of the widths of the
   # two operands. These semantics match Verilog:
   # http://www1.pldworld.com/@xilinx/html/technote/TOOL/MANUAL/21i_doc/data/fndtn/ver/ver4_4.htm
+  #
+  # Operators dispatch on the type of the other operand instead of
+  # catching exceptions, and build their result with _new_bits() since
+  # the result is masked to the result width anyway. Operands which are
+  # neither Bits nor ints fall back to the validating constructor.
 
   def __invert__( self ):
-    return Bits( self.nbits, ~self._uint, trunc=True )
+    return _new_bits( self._width, ~self._uint )
 
   def __add__( self, other ):
-    try:    return Bits( max( self.nbits, other.nbits), self._uint + other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint + other,       trunc=True )
+    if isinstance( other, Bits ):
+      width = self._width if self.nbits >= other.nbits else other._width
+      return _new_bits( width, self._uint + other._uint )
+    if isinstance( other, _int_types ):
+      return _new_bits( self._width, self._uint + other )
+    return Bits( self.nbits, self._uint + other, trunc=True )
 
   def __sub__( self, other ):
-    try:    return Bits( max( self.nbits, other.nbits), self._uint - other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint - other,       trunc=True )
+    if isinstance( other, Bits ):
+      width = self._width if self.nbits >= other.nbits else other._width
+      return _new_bits( width, self._uint - other._uint )
+    if isinstance( other, _int_types ):
+      return _new_bits( self._width, self._uint - other )
+    return Bits( self.nbits, self._uint - other, trunc=True )
 
   # TODO: what about multiplying Bits object with an object of other type
   # where the bitwidth of the other type is larger than the bitwidth of the
   # Bits object? ( applies to every other operator as well.... )
   def __mul__( self, other ):
-    try:    return Bits( 2*max( self.nbits, other.nbits), self._uint * other._uint, trunc=True )
-    except: return Bits( 2*self.nbits,                    self._uint * other,       trunc=True )
+    if isinstance( other, Bits ):
+      width = _get_width( 2*max( self.nbits, other.nbits ) )
+      return _new_bits( width, self._uint * other._uint )
+    if isinstance( other, _int_types ):
+      return _new_bits( _get_width( 2*self.nbits ), self._uint * other )
+    return Bits( 2*self.nbits, self._uint * other, trunc=True )
 
   def __radd__( self, other ):
     return self.__add__( other )
@@ -357,16 +499,23 @@ class Bits( SignalValue ):
     return self.__mul__( other )
 
   def __div__(self, other):
-    try:    return Bits( 2*max( self.nbits, other.nbits), self._uint / other._uint, trunc=True )
-    except: return Bits( 2*self.nbits,                    self._uint / other,       trunc=True )
+    if isinstance( other, Bits ):
+      width = _get_width( 2*max( self.nbits, other.nbits ) )
+      return _new_bits( width, self._uint / other._uint )
+    if isinstance( other, _int_types ):
+      return _new_bits( _get_width( 2*self.nbits ), self._uint / other )
+    return Bits( 2*self.nbits, self._uint / other, trunc=True )
 
   def __floordiv__(self, other):
-    try:    return Bits( 2*max( self.nbits, other.nbits), self._uint / other._uint, trunc=True )
-    except: return Bits( 2*self.nbits,                    self._uint / other,       trunc=True )
+    return self.__div__( other )
 
   def __mod__(self, other):
-    try:    return Bits( 2*max( self.nbits, other.nbits), self._uint % other._uint, trunc=True )
-    except: return Bits( 2*self.nbits,                    self._uint % other,       trunc=True )
+    if isinstance( other, Bits ):
+      width = _get_width( 2*max( self.nbits, other.nbits ) )
+      return _new_bits( width, self._uint % other._uint )
+    if isinstance( other, _int_types ):
+      return _new_bits( _get_width( 2*self.nbits ), self._uint % other )
+    return Bits( 2*self.nbits, self._uint % other, trunc=True )
 
   # TODO: implement these?
   # def __divmod__(self, other)
@@ -377,12 +526,13 @@ class Bits( SignalValue ):
   #----------------------------------------------------------------------
 
   def __lshift__( self, other ):
+    shamt = int( other )
     # Optimization to return 0 if shift amount is greater than self.nbits
-    if int( other ) >= self.nbits: return Bits( self.nbits, 0 )
-    return Bits( self.nbits, self._uint << int( other ), trunc=True )
+    if shamt >= self.nbits: return _new_bits( self._width, 0 )
+    return _new_bits( self._width, self._uint << shamt )
 
   def __rshift__( self, other ):
-    return Bits( self.nbits, self._uint >> int( other ) )
+    return _new_bits( self._width, self._uint >> int( other ) )
 
   # TODO: Not implementing reflective operators because its not clear
   #       how to determine width of other object in case of lshift
@@ -396,19 +546,31 @@ class Bits( SignalValue ):
   #----------------------------------------------------------------------
 
   def __and__( self, other ):
+    if isinstance( other, Bits ):
+      width = self._width if self.nbits >= other.nbits else other._width
+      return _new_bits( width, self._uint & other._uint )
     assert other >= 0
-    try:    return Bits( max( self.nbits, other.nbits), self._uint & other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint & other,       trunc=True )
+    if isinstance( other, _int_types ):
+      return _new_bits( self._width, self._uint & other )
+    return Bits( self.nbits, self._uint & other, trunc=True )
 
   def __xor__( self, other ):
+    if isinstance( other, Bits ):
+      width = self._width if self.nbits >= other.nbits else other._width
+      return _new_bits( width, self._uint ^ other._uint )
     assert other >= 0
-    try:    return Bits( max( self.nbits, other.nbits), self._uint ^ other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint ^ other,       trunc=True )
+    if isinstance( other, _int_types ):
+      return _new_bits( self._width, self._uint ^ other )
+    return Bits( self.nbits, self._uint ^ other, trunc=True )
 
   def __or__( self, other ):
+    if isinstance( other, Bits ):
+      width = self._width if self.nbits >= other.nbits else other._width
+      return _new_bits( width, self._uint | other._uint )
     assert other >= 0
-    try:    return Bits( max( self.nbits, other.nbits), self._uint | other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint | other,       trunc=True )
+    if isinstance( other, _int_types ):
+      return _new_bits( self._width, self._uint | other )
+    return Bits( self.nbits, self._uint | other, trunc=True )
 
   def __rand__( self, other ):
     return self.__and__( other )
@@ -422,34 +584,61 @@ class Bits( SignalValue ):
   #----------------------------------------------------------------------
   # Comparison Operators
   #----------------------------------------------------------------------
+  # Comparisons against int constants are checked first since they are
+  # the most common. Bits operands are compared by value directly,
+  # avoiding the reflected comparisons (and asserts) on the other operand.
 
   def __nonzero__( self ):
     return self._uint != 0
 
   # TODO: allow comparison with negative numbers?
   def __eq__( self, other ):
+    if other.__class__ is int:
+      assert other >= 0
+      return self._uint == other
+    if isinstance( other, Bits ): return self._uint == other._uint
     if other is None: return False
     assert other >= 0
     return self._uint == other
 
   def __ne__( self, other ):
+    if other.__class__ is int:
+      assert other >= 0
+      return self._uint != other
+    if isinstance( other, Bits ): return self._uint != other._uint
     if other is None: return True
     assert other >= 0
     return self._uint != other
 
   def __lt__( self, other ):
+    if other.__class__ is int:
+      assert other >= 0
+      return self._uint <  other
+    if isinstance( other, Bits ): return self._uint <  other._uint
     assert other >= 0
     return self._uint <  other
 
   def __le__( self, other ):
+    if other.__class__ is int:
+      assert other >= 0
+      return self._uint <= other
+    if isinstance( other, Bits ): return self._uint <= other._uint
     assert other >= 0
     return self._uint <= other
 
   def __gt__( self, other ):
+    if other.__class__ is int:
+      assert other >= 0
+      return self._uint >  other
+    if isinstance( other, Bits ): return self._uint >  other._uint
     assert other >= 0
     return self._uint >  other
 
   def __ge__( self, other ):
+    if other.__class__ is int:
+      assert other >= 0
+      return self._uint >= other
+    if isinstance( other, Bits ): return self._uint >= other._uint
     assert other >= 0
     return self._uint >= other
 
@@ -475,6 +664,9 @@ class Bits( SignalValue ):
 # update the value of BitSlices that point to it!
 class BitSlice( Bits ):
 
+  __slots__ = ( '_target_bits', '_offset',
+                'notify_sim_comb_update', 'notify_sim_seq_update' )
+
   #---------------------------------------------------------------------
   # __init__
   #---------------------------------------------------------------------
@@ -488,7 +680,6 @@ class BitSlice( Bits ):
     # specific bits we are slicing.
     self._target_bits = target_bits
     self._offset      = offset
-    self.slice        = slice( offset, offset + nbits )
 
     # Take the notify_sim_* methods and the _slices function pointer list
     # from the original Bits instance. This ensures writes to the BitSlice
@@ -501,6 +692,31 @@ class BitSlice( Bits ):
   def _slices( self ):
     return self._target_bits._slices
 
+  @property
+  def slice( self ):
+    return slice( self._offset, self._offset + self.nbits )
+
+  #---------------------------------------------------------------------
+  # __copy__
+  #---------------------------------------------------------------------
+  # Copies of a BitSlice are plain Bits, detached from the target.
+  def __copy__( self ):
+    return _new_bits( self._width, self._uint )
+
+  #---------------------------------------------------------------------
+  # __getstate__/__setstate__
+  #---------------------------------------------------------------------
+  # Pickled BitSlices keep their target, the notify_sim_* hooks are taken
+  # from the target again when unpickling.
+  def __getstate__( self ):
+    return ( self.nbits, self._uint, self._target_bits, self._offset )
+
+  def __setstate__( self, state ):
+    self.nbits, self._uint, self._target_bits, self._offset = state
+    self._width = _get_width( self.nbits )
+    self.notify_sim_comb_update = self._target_bits.notify_sim_comb_update
+    self.notify_sim_seq_update  = self._target_bits.notify_sim_seq_update
+
   #---------------------------------------------------------------------
   # write_value
   #---------------------------------------------------------------------
@@ -509,17 +725,18 @@ class BitSlice( Bits ):
 
     # Get the updated value and update self.
     value = int( value )
-    if not (self._min <= value <= self._max):
+    width = self._width
+    if not (width.min <= value <= width.max):
       slc = self.slice
       raise ValueError(
         'Provided value is too big to fit in slice [{}:{}] ({} bits)!\n'
         '({} bits are needed to represent value = {} in two\'s complement.)'
         .format( slc.start, slc.stop, self.nbits, _get_nbits(value), value )
       )
-    self._uint = (value & self._mask)
+    self._uint = (value & width.mask)
 
     # Update target we are slicing. First clear the bits we want to set.
-    shifted_mask = ~( self._mask << self._offset )
+    shifted_mask = ~( width.mask << self._offset )
     cleared_val  = self._target_bits._uint & shifted_mask
 
     # Set the bits, write to the target.
@@ -535,17 +752,18 @@ class BitSlice( Bits ):
     # Get the updated value, but no don't update self (BitSlices contain
     # no shadow state).
     value = int( value )
-    if not (self._min <= value <= self._max):
+    width = self._width
+    if not (width.min <= value <= width.max):
       slc = self.slice
       raise ValueError(
         'Provided value is too big to fit in slice [{}:{}] ({} bits)!\n'
         '({} bits are needed to represent value = {} in two\'s complement.)'
         .format( slc.start, slc.stop, self.nbits, _get_nbits(value), value )
       )
-    value = (value & self._mask)
+    value = (value & width.mask)
 
     # Update target we are slicing. First clear the bits we want to set.
-    shifted_mask = ~( self._mask << self._offset )
+    shifted_mask = ~( width.mask << self._offset )
     cleared_val  = self._target_bits._next._uint & shifted_mask
 
     # Set the bits, write to the target's shadow state.
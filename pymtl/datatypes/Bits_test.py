@@ -3,6 +3,7 @@
 #=======================================================================
 # Tests for the Bits class.
 
+import pickle
 import pytest
 
 from   Bits import Bits
@@ -543,3 +544,78 @@ def test_slice_bits():
   assert data[ :x]   == 0b01
   with pytest.raises( IndexError ):
     assert data[x:x] == 0b1
+
+def test_width_descriptor():
+
+  a = Bits( 8, 3 )
+  b = Bits( Bits( 4, 8 ), 3 )
+  assert (a + 1)._width is a._width
+  assert (~a)._width    is a._width
+  assert b._width       is a._width
+  assert b.nbits == 8 and isinstance( b.nbits, int )
+  assert a._mask == 0xff
+  assert a._max  == 255
+  assert a._min  == -128
+  assert Bits( 1 )._min == 0
+
+  with pytest.raises( ValueError ): Bits( 0 )
+  with pytest.raises( ValueError ): Bits( -1 )
+
+def test_slots():
+
+  a = Bits( 8, 0b1101 )
+  assert a._target_bits is a
+  assert a.slice        == slice( None )
+
+  s = a[1:3]
+  assert s._target_bits is a
+  assert s.slice        == slice( 1, 3 )
+
+  # Simulator tools can still attach attributes to Bits objects
+  a._next = Bits( 8 )
+  assert a._next == 0
+
+def test_operator_dispatch():
+
+  a = Bits( 8, 0xf0 )
+  b = Bits( 4, 0x3 )
+
+  # Width of the result is the max width of Bits operands
+  assert (a + b).nbits == 8 and (a + b) == 0xf3
+  assert (b + a).nbits == 8 and (b + a) == 0xf3
+  assert (b + 1).nbits == 4
+  assert (b + 0xf)     == 0x2
+  assert (a * b).nbits == 16 and (a * b) == 0x2d0
+  assert (b - 4)       == 0xf
+  assert (b - 4L)      == 0xf
+  assert (a / b)       == 0x50
+  assert (a % 7)       == 0xf0 % 7
+  assert (a + 1.0)     == 0xf1
+
+  # Results of operators are plain Bits sharing the width descriptor
+  assert type( a & b ) is Bits
+  assert (a | b)._width is a._width
+
+  # Comparisons between Bits compare values
+  assert Bits( 8, 3 ) == Bits( 4, 3 )
+  assert Bits( 8, 3 ) != Bits( 4, 2 )
+  assert Bits( 4, 2 ) <  Bits( 8, 3 )
+  assert Bits( 8, 3 ) >= Bits( 4, 3 )
+
+def test_pickle():
+
+  a = Bits( 8, 0xf5 )
+  for protocol in range( pickle.HIGHEST_PROTOCOL + 1 ):
+
+    b = pickle.loads( pickle.dumps( a, protocol ) )
+    assert type( b ) is Bits
+    assert b.nbits == 8 and b == 0xf5
+    assert b._width is a._width
+
+    # Slices keep their target
+    c = pickle.loads( pickle.dumps( a[4:8], protocol ) )
+    assert c.nbits == 4 and c == 0xf
+    assert c.slice == slice( 4, 8 )
+    assert c._target_bits == 0xf5
+    c.v = 0x3
+    assert c._target_bits == 0x35
@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+#=======================================================================
+# bits_bench.py
+#=======================================================================
+# Micro-benchmarks for the Bits datatype. Measures the throughput (in
+# operations per second) of the Bits operations which dominate the
+# profiles of message-heavy models.
+#
+# Usage:
+#
+#   python -m pymtl.datatypes.bits_bench [--nops N] [--save results.json]
+#                                        [--compare results.json]
+#
+# --save stores the results so a later run can --compare against them
+# and report the speedup of each benchmark.
+
+from __future__ import print_function
+
+import argparse
+import json
+import timeit
+
+#-----------------------------------------------------------------------
+# benchmarks
+#-----------------------------------------------------------------------
+# Each benchmark is a (name, setup, statement) tuple, the statement is
+# timed by timeit and counted as a single operation.
+
+_setup = '''
+from pymtl.datatypes.Bits      import Bits
+from pymtl.datatypes.helpers   import concat
+from pymtl.datatypes.BitStruct import BitStructDefinition, BitField
+a = Bits( 32, 0xdeadbeef )
+b = Bits( 32, 0x0badf00d )
+c = Bits( 16, 0x1234 )
+
+class BenchMsg( BitStructDefinition ):
+  def __init__( s ):
+    s.type_ = BitField( 3 )
+    s.addr  = BitField( 32 )
+    s.data  = BitField( 32 )
+
+msg = BenchMsg()
+'''
+
+benchmarks = [
+  ( 'construct',     _setup, 'Bits( 32, 42 )'           ),
+  ( 'add_bits',      _setup, 'a + b'                    ),
+  ( 'add_int',       _setup, 'a + 1'                    ),
+  ( 'and_mixed',     _setup, 'a & c'                    ),
+  ( 'invert',        _setup, '~a'                       ),
+  ( 'slice_read',    _setup, 'a[8:24]'                  ),
+  ( 'index_read',    _setup, 'a[3]'                     ),
+  ( 'slice_write',   _setup, 'a[8:24] = 0x55'           ),
+  ( 'copy',          _setup, 'a[:]'                     ),
+  ( 'concat',        _setup, 'concat( a, c, b )'        ),
+  ( 'eq_bits',       _setup, 'a == b'                   ),
+  ( 'eq_int',        _setup, 'a == 42'                  ),
+  ( 'lt_bits',       _setup, 'a < b'                    ),
+  ( 'field_read',    _setup, 'msg.addr'                 ),
+  ( 'field_int',     _setup, "msg.read_field( 'addr' )" ),
+  ( 'field_write',   _setup, 'msg.addr = 0x1000'        ),
+  ( 'pack',          _setup, 'msg.pack( 1, 0x1000, 3 )' ),
+  ( 'unpack',        _setup, 'msg.unpack()'             ),
+]
+
+#-----------------------------------------------------------------------
+# run_benchmarks
+#-----------------------------------------------------------------------
+# Run each benchmark for nops operations, keeping the best of repeat
+# runs. Returns a dictionary mapping benchmark names to ops/sec.
+def run_benchmarks( nops = 100000, repeat = 3, names = None ):
+
+  results = {}
+  for name, setup, stmt in benchmarks:
+    if names and name not in names:
+      continue
+    best = min( timeit.repeat( stmt, setup, repeat=repeat, number=nops ) )
+    results[ name ] = nops / best if best > 0 else float( 'inf' )
+
+  return results
+
+#-----------------------------------------------------------------------
+# print_results
+#-----------------------------------------------------------------------
+def print_results( results, baseline = None ):
+
+  for name, setup, stmt in benchmarks:
+    if name not in results:
+      continue
+    line = '{:14} {:14,.0f} ops/sec'.format( name, results[ name ] )
+    if baseline and name in baseline:
+      line += '  {:6.2f}x'.format( results[ name ] / baseline[ name ] )
+    print( line )
+
+#-----------------------------------------------------------------------
+# main
+#-----------------------------------------------------------------------
+def main():
+
+  p = argparse.ArgumentParser( description='Bits micro-benchmarks' )
+  p.add_argument( '--nops',    type=int, default=100000 )
+  p.add_argument( '--repeat',  type=int, default=3 )
+  p.add_argument( '--save',    metavar='FILE' )
+  p.add_argument( '--compare', metavar='FILE' )
+  p.add_argument( 'names',     nargs='*' )
+  opts = p.parse_args()
+
+  results  = run_benchmarks( opts.nops, opts.repeat, opts.names )
+
+  baseline = None
+  if opts.compare:
+    with open( opts.compare ) as fp:
+      baseline = json.load( fp )
+
+  print_results( results, baseline )
+
+  if opts.save:
+    with open( opts.save, 'w' ) as fp:
+      json.dump( results, fp, indent=2, sort_keys=True )
+
+if __name__ == "__main__":
+  main()
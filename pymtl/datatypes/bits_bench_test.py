@@ -0,0 +1,19 @@
+#=======================================================================
+# bits_bench_test.py
+#=======================================================================
+# Smoke tests for the Bits micro-benchmarks.
+
+import pytest
+
+from bits_bench import benchmarks, run_benchmarks
+
+def test_run_benchmarks():
+
+  results = run_benchmarks( nops=10, repeat=1 )
+  assert sorted( results ) == sorted( name for name, _, _ in benchmarks )
+  assert all( ops > 0 for ops in results.values() )
+
+def test_run_benchmarks_subset():
+
+  results = run_benchmarks( nops=10, repeat=1, names=[ 'add_bits', 'concat' ] )
+  assert sorted( results ) == [ 'add_bits', 'concat' ]
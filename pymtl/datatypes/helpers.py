@@ -50,18 +50,14 @@ def concat( *args ):
 
   assert isinstance( args[0], Bits.Bits )
 
-  # Calculate total new bitwidth
-  nbits = sum( [ x.nbits for x in args ] )
+  # Shift each value into place, most significant argument first
+  nbits = 0
+  value = 0
+  for bits in args:
+    value  = (value << bits.nbits) | bits._uint
+    nbits += bits.nbits
 
-  # Create new Bits and add each bits from bits_list to it
-  concat_bits = Bits.Bits( nbits )
-
-  begin = 0
-  for bits in reversed( args ):
-    concat_bits[ begin : begin+bits.nbits ] = bits
-    begin += bits.nbits
-
-  return concat_bits
+  return Bits._new_bits( Bits._get_width( nbits ), value )
 
 #-----------------------------------------------------------------------
 # reduce_and
@@ -12,6 +12,7 @@ translation into HDLs, etc).
 from metaclasses    import MetaCollectArgs
 from ConnectionEdge import ConnectionEdge, PyMTLConnectError
 from signals        import Signal, InPort, OutPort, Wire, Constant
+from signals        import union_nets
 from signal_lists   import PortList, WireList
 from PortBundle     import PortBundle
 from ..datatypes    import Bits
@@ -697,6 +698,10 @@ class Model( object ):
       raise Exception( "Invalid Connection!")
     self._connections.add( connection_edge )
 
+    # Signals connected without slicing belong to the same net
+    if connection_edge.src_slice is None and connection_edge.dest_slice is None:
+      union_nets( connection_edge.src_node, connection_edge.dest_node )
+
   #-----------------------------------------------------------------------
   # _connect_bundle
   #-----------------------------------------------------------------------
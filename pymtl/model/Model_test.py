@@ -478,3 +478,46 @@ def test_ClassNameCollision():
 #   model2.elaborate()
 #   assert model1.class_name != model2.class_name
 
+
+#-----------------------------------------------------------------------
+# Nets
+#-----------------------------------------------------------------------
+
+from signals import find_net, union_nets
+from ..tools.simulation.sim_utils import collect_signals, signals_to_nets
+
+class Nets( Model ):
+  def __init__( s ):
+    s.in_  = InPort ( 8 )
+    s.out  = OutPort( 8 )
+    s.mid  = Wire   ( 8 )
+    s.hi   = OutPort( 4 )
+    s.zero = OutPort( 8 )
+    s.connect( s.in_, s.mid )
+    s.connect( s.out, s.mid )
+    s.connect( s.hi,  s.in_[4:8] )
+    s.connect( s.zero, 0 )
+
+def test_Nets():
+  m = inst_elab_model( Nets )
+
+  # Unsliced connections are merged as they are made
+  assert find_net( m.in_ ) is find_net( m.out )
+  assert find_net( m.in_ ) is find_net( m.mid )
+  assert find_net( m.in_ ) is not find_net( m.hi )
+
+  nets, slice_connects = signals_to_nets( collect_signals( m ) )
+  nets = sorted( sorted( x.name for x in net ) for net in nets )
+  assert nets == [ ["8'd0", 'zero'], ['clk'], ['hi'], ['in_', 'mid', 'out'],
+                   ['reset'] ]
+  assert len( slice_connects ) == 1
+
+def test_UnionNets():
+  a, b, c, d = [ Wire( 1 ) for _ in range( 4 ) ]
+  union_nets( a, b )
+  union_nets( c, d )
+  assert find_net( a ) is find_net( b )
+  assert find_net( a ) is not find_net( c )
+  root = union_nets( b, d )
+  assert all( find_net( x ) is root for x in [ a, b, c, d ] )
+  assert all( x._net_parent is root for x in [ a, b, c, d ] )
@@ -45,6 +45,10 @@ class Signal( object ):
     self._signal       = self
     self._signalvalue  = None
 
+    # Union-find state for net construction, see find_net()
+    self._net_parent   = self
+    self._net_rank     = 0
+
   #---------------------------------------------------------------------
   # __getattr__
   #---------------------------------------------------------------------
@@ -219,6 +223,46 @@ class Constant( Signal ):
     """Not sure why this equality check is needed..."""
     return self._signalvalue == other._signalvalue
 
+#-----------------------------------------------------------------------
+# find_net
+#-----------------------------------------------------------------------
+# Signals structurally connected without slicing form a net. Nets are
+# tracked with a union-find structure stored on the Signals themselves,
+# it is filled in as connections are made (see Model._connect_signal).
+def find_net( signal ):
+  """Return the representative Signal of the net containing signal."""
+
+  root = signal
+  while root._net_parent is not root:
+    root = root._net_parent
+
+  # Path compression
+  while signal is not root:
+    signal._net_parent, signal = root, signal._net_parent
+
+  return root
+
+#-----------------------------------------------------------------------
+# union_nets
+#-----------------------------------------------------------------------
+def union_nets( signal_a, signal_b ):
+  """Merge the nets containing signal_a and signal_b, returns the
+  representative Signal of the merged net."""
+
+  root_a = find_net( signal_a )
+  root_b = find_net( signal_b )
+  if root_a is root_b:
+    return root_a
+
+  # Union by rank
+  if root_a._net_rank < root_b._net_rank:
+    root_a, root_b = root_b, root_a
+  root_b._net_parent = root_a
+  if root_a._net_rank == root_b._net_rank:
+    root_a._net_rank += 1
+
+  return root_a
+
 #-----------------------------------------------------------------------
 # _SignalSlice
 #-----------------------------------------------------------------------
@@ -4,8 +4,15 @@
 
 from __future__ import print_function
 
+import os
+import atexit
+import hashlib
 import inspect
+import linecache
 import ast, _ast
+import cPickle as pickle
+
+from collections import namedtuple
 
 #-----------------------------------------------------------------------
 # print_ast
@@ -96,15 +103,235 @@ def print_simple_ast(node, indent=' ', show_lineno=False ):
 # In order to parse class methods and inner functions, we need to fix the
 # indentation whitespace or else the ast parser throws an "unexpected
 # ident" error.
+#
+# Returns a freshly parsed tree which the caller is free to transform.
+# The source itself comes from the AST cache (see below).
 import re
 p = re.compile('( *(@|def))')
 def get_method_ast( func ):
 
-  src = inspect.getsource( func )
-  new_src = p.sub( r'\2', src )
+  new_src = _get_entry( func ).src
   tree = ast.parse( new_src )
   return tree, new_src
 
+#-----------------------------------------------------------------------
+# get_cached_method_ast
+#-----------------------------------------------------------------------
+# Like get_method_ast, but returns the tree shared by every function with
+# the same code object (i.e. every instance of a model). Callers must not
+# modify the returned tree.
+def get_cached_method_ast( func ):
+
+  entry = _get_entry( func )
+  return entry.tree, entry.src
+
+#-----------------------------------------------------------------------
+# get_method_analysis
+#-----------------------------------------------------------------------
+# Return the result of analyze( tree ) for the shared tree of func. The
+# result is cached under key, so analyze must only depend on the tree
+# (not on the closure of a particular instance) and its result must not
+# be modified by the caller. Results are persisted with the disk cache,
+# so they should be picklable. If analyze raises nothing is cached.
+def get_method_analysis( func, key, analyze ):
+
+  entry = _get_entry( func )
+  try:
+    return entry.results[ key ]
+  except KeyError:
+    result = entry.results[ key ] = analyze( entry.tree )
+    _mark_dirty( entry )
+    return result
+
+#=======================================================================
+# AST Cache
+#=======================================================================
+# Every instance of a model shares the code objects of its concurrent
+# blocks, so the source and parsed tree of each block are cached by code
+# object rather than re-extracted and re-parsed per instance.
+#
+# The cache can optionally be persisted to disk by setting the
+# PYMTL_AST_CACHE environment variable (or calling set_ast_cache_dir) to
+# a directory. One pickle is kept per source file, holding the source
+# and analysis results of its blocks; it is discarded when the mtime of
+# the source file changes. Trees themselves are not persisted since
+# unpickling a tree is no faster than parsing it.
+
+_ast_cache   = {}
+_cache_hits   = 0
+_cache_misses = 0
+
+_disk_dir    = os.environ.get( 'PYMTL_AST_CACHE' ) or None
+_disk_files  = {}       # source filename -> ( mtime, { key: entry } )
+_disk_dirty  = set()    # source filenames with unsaved entries
+
+ASTCacheInfo = namedtuple( 'ASTCacheInfo', [ 'hits', 'misses', 'size' ] )
+
+#-----------------------------------------------------------------------
+# _MethodEntry
+#-----------------------------------------------------------------------
+# Cached source, lazily parsed tree and analysis results of a function.
+class _MethodEntry( object ):
+
+  __slots__ = ( 'src', 'results', 'filename', '_tree' )
+
+  def __init__( self, src, results, filename ):
+    self.src      = src
+    self.results  = results
+    self.filename = filename
+    self._tree    = None
+
+  @property
+  def tree( self ):
+    if self._tree is None:
+      self._tree = ast.parse( self.src )
+    return self._tree
+
+#-----------------------------------------------------------------------
+# _get_entry
+#-----------------------------------------------------------------------
+def _get_entry( func ):
+  global _cache_hits, _cache_misses
+
+  code = getattr( func, '__code__', func )
+
+  entry = _ast_cache.get( code )
+  if entry is not None:
+    _cache_hits += 1
+    return entry
+
+  entry = _load_entry( code )
+  if entry is None:
+    _cache_misses += 1
+    # inspect does not notice modified files on its own
+    linecache.checkcache( getattr( code, 'co_filename', None ) )
+    src   = p.sub( r'\2', inspect.getsource( func ) )
+    entry = _MethodEntry( src, {}, getattr( code, 'co_filename', None ) )
+    _store_entry( code, entry )
+  else:
+    _cache_hits += 1
+
+  _ast_cache[ code ] = entry
+  return entry
+
+#-----------------------------------------------------------------------
+# _disk_key
+#-----------------------------------------------------------------------
+def _disk_key( code ):
+  return ( code.co_firstlineno, code.co_name )
+
+#-----------------------------------------------------------------------
+# _disk_entries
+#-----------------------------------------------------------------------
+# Return the (possibly empty) dictionary of entries persisted for a
+# source file, or None if the disk cache is disabled or the file does
+# not exist.
+def _disk_entries( filename ):
+
+  if _disk_dir is None or filename is None:
+    return None
+
+  try:
+    mtime = os.path.getmtime( filename )
+  except OSError:
+    return None
+
+  cached = _disk_files.get( filename )
+  if cached is not None and cached[0] == mtime:
+    return cached[1]
+
+  entries = {}
+  try:
+    with open( _disk_path( filename ), 'rb' ) as fp:
+      saved_mtime, saved = pickle.load( fp )
+    if saved_mtime == mtime:
+      entries = dict( ( key, _MethodEntry( src, results, filename ) )
+                      for key, ( src, results ) in saved.items() )
+  except Exception:
+    pass
+
+  _disk_files[ filename ] = ( mtime, entries )
+  return entries
+
+def _disk_path( filename ):
+  name = hashlib.sha1( os.path.abspath( filename ) ).hexdigest()
+  return os.path.join( _disk_dir, name + '.pkl' )
+
+def _load_entry( code ):
+  entries = _disk_entries( getattr( code, 'co_filename', None ) )
+  if entries:
+    return entries.get( _disk_key( code ) )
+
+def _store_entry( code, entry ):
+  entries = _disk_entries( entry.filename )
+  if entries is not None:
+    entries[ _disk_key( code ) ] = entry
+    _disk_dirty.add( entry.filename )
+
+def _mark_dirty( entry ):
+  if entry.filename in _disk_files:
+    _disk_dirty.add( entry.filename )
+
+#-----------------------------------------------------------------------
+# save_ast_cache
+#-----------------------------------------------------------------------
+# Write out all modified source files of the disk cache. Called
+# automatically at exit when the disk cache is enabled.
+def save_ast_cache():
+
+  if _disk_dir is None:
+    return
+
+  if _disk_dirty and not os.path.isdir( _disk_dir ):
+    os.makedirs( _disk_dir )
+
+  for filename in _disk_dirty:
+    mtime, entries = _disk_files[ filename ]
+    saved = dict( ( key, ( entry.src, entry.results ) )
+                  for key, entry in entries.items() )
+    path  = _disk_path( filename )
+    tmp   = '{}.{}'.format( path, os.getpid() )
+    with open( tmp, 'wb' ) as fp:
+      pickle.dump( ( mtime, saved ), fp, pickle.HIGHEST_PROTOCOL )
+    os.rename( tmp, path )
+
+  _disk_dirty.clear()
+
+atexit.register( save_ast_cache )
+
+#-----------------------------------------------------------------------
+# set_ast_cache_dir
+#-----------------------------------------------------------------------
+# Enable (or with None, disable) the disk cache. Pending entries of a
+# previously enabled directory are saved first.
+def set_ast_cache_dir( path ):
+  global _disk_dir
+  save_ast_cache()
+  _disk_dir = path
+  _disk_files.clear()
+
+#-----------------------------------------------------------------------
+# ast_cache_info
+#-----------------------------------------------------------------------
+# Return the number of cache hits, misses (sources extracted) and the
+# number of cached functions.
+def ast_cache_info():
+  return ASTCacheInfo( _cache_hits, _cache_misses, len( _ast_cache ) )
+
+#-----------------------------------------------------------------------
+# clear_ast_cache
+#-----------------------------------------------------------------------
+# Clear the in-memory cache and reset its counters. Pending entries are
+# saved to the disk cache (if enabled) first.
+def clear_ast_cache():
+  global _cache_hits, _cache_misses
+  save_ast_cache()
+  _ast_cache.clear()
+  _disk_files.clear()
+  _disk_dirty.clear()
+  _cache_hits   = 0
+  _cache_misses = 0
+
 #-----------------------------------------------------------------------
 # get_closure_dict
 #-----------------------------------------------------------------------
@@ -0,0 +1,117 @@
+#=======================================================================
+# ast_helpers_test.py
+#=======================================================================
+
+import os
+import ast
+import imp
+import pytest
+
+import ast_helpers
+from ast_helpers import ( get_method_ast, get_cached_method_ast,
+                          get_method_analysis, ast_cache_info,
+                          clear_ast_cache, set_ast_cache_dir )
+
+#-----------------------------------------------------------------------
+# fixtures
+#-----------------------------------------------------------------------
+
+@pytest.fixture
+def clean_cache( request ):
+  clear_ast_cache()
+  def fin():
+    set_ast_cache_dir( None )
+    clear_ast_cache()
+  request.addfinalizer( fin )
+
+def mk_block( n ):
+  def block():
+    x = n + 1
+  return block
+
+def num_assigns( tree ):
+  return len( [ x for x in ast.walk( tree ) if isinstance( x, ast.Assign ) ] )
+
+#-----------------------------------------------------------------------
+# test_cached_method_ast
+#-----------------------------------------------------------------------
+
+def test_cached_method_ast( clean_cache ):
+
+  a, b = mk_block( 1 ), mk_block( 2 )
+
+  tree_a, src_a = get_cached_method_ast( a )
+  tree_b, src_b = get_cached_method_ast( b )
+  assert tree_a is tree_b
+  assert src_a.startswith( 'def block' )
+  assert ast_cache_info() == ( 1, 1, 1 )
+
+  # get_method_ast returns a fresh tree the caller can modify
+  tree, src = get_method_ast( a )
+  assert tree is not tree_a
+  assert src == src_a
+
+#-----------------------------------------------------------------------
+# test_method_analysis
+#-----------------------------------------------------------------------
+
+def test_method_analysis( clean_cache ):
+
+  calls = []
+  def analyze( tree ):
+    calls.append( tree )
+    return num_assigns( tree )
+
+  for n in range( 4 ):
+    assert get_method_analysis( mk_block( n ), 'assigns', analyze ) == 1
+  assert len( calls ) == 1
+
+  # Failed analyses are not cached
+  def fail( tree ):
+    calls.append( tree )
+    raise ValueError()
+
+  for n in range( 2 ):
+    with pytest.raises( ValueError ):
+      get_method_analysis( mk_block( n ), 'fail', fail )
+  assert len( calls ) == 3
+
+#-----------------------------------------------------------------------
+# test_disk_cache
+#-----------------------------------------------------------------------
+
+src_template = '''
+def mk_block():
+  def block():
+    {}
+  return block
+'''
+
+def test_disk_cache( clean_cache, tmpdir ):
+
+  srcfile = tmpdir.join( 'blocks.py' )
+  srcfile.write( src_template.format( 'x = 1' ) )
+  set_ast_cache_dir( str( tmpdir.join( 'cache' ) ) )
+
+  def load():
+    clear_ast_cache()
+    module = imp.load_source( 'ast_helpers_test_blocks', str( srcfile ) )
+    return module.mk_block()
+
+  # First run extracts the source and saves it
+  block = load()
+  assert get_method_analysis( block, 'assigns', num_assigns ) == 1
+  assert ast_cache_info().misses == 1
+
+  # Second run loads the source and analysis from disk
+  block = load()
+  assert get_method_analysis( block, 'assigns', lambda tree: 0 ) == 1
+  assert ast_cache_info().misses == 0
+
+  # Modifying the source file invalidates the cache
+  srcfile.write( src_template.format( 'x = 1; y = 2' ) )
+  stat = os.stat( str( srcfile ) )
+  os.utime( str( srcfile ), ( stat.st_atime, stat.st_mtime + 10 ) )
+  block = load()
+  assert get_method_analysis( block, 'assigns', num_assigns ) == 2
+  assert ast_cache_info().misses == 1
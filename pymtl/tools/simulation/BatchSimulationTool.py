@@ -0,0 +1,259 @@
+#=======================================================================
+# BatchSimulationTool.py
+#=======================================================================
+# Simulates N copies (lanes) of one elaborated model in lockstep. Every
+# net is stored as a NumPy uint64 array with one element per lane, and
+# the @combinational and @posedge_clk blocks of the model are translated
+# into vectorized functions which update all lanes at once (see
+# batch_logic.py). Typical use is to apply a different stimulus stream to
+# each lane:
+#
+#   model = MyModel()
+#   model.elaborate()
+#   sim = BatchSimulationTool( model, 1000 )
+#   sim.reset()
+#   sim[ model.in_ ] = test_inputs        # one value per lane
+#   sim.cycle()
+#   assert ( sim[ model.out ] == expected ).all()
+#
+# Only models built entirely from translatable blocks with nets of at
+# most 64 bits are supported; @tick blocks raise a BatchTranslationError.
+# The model itself is left untouched, lane values are only accessible
+# through the simulator.
+
+from __future__ import print_function
+
+import numpy as np
+
+import sim_utils as sim
+
+from batch_logic      import translate_batch_block, BatchTranslationError
+from ...model.signals import Signal
+
+#-----------------------------------------------------------------------
+# BatchSimulationTool
+#-----------------------------------------------------------------------
+class BatchSimulationTool( object ):
+
+  #---------------------------------------------------------------------
+  # __init__
+  #---------------------------------------------------------------------
+  def __init__( self, model, nlanes ):
+
+    if not model.is_elaborated():
+      raise Exception( "cannot initialize {0} tool.\n"
+                       "Provided model has not been elaborated yet!!!"
+                       "".format( self.__class__.__name__ ) )
+
+    if not isinstance( model.reset, Signal ):
+      raise Exception( "cannot initialize {0} tool.\n"
+                       "Provided model is already being simulated!!!"
+                       "".format( self.__class__.__name__ ) )
+
+    if nlanes < 1:
+      raise ValueError( "nlanes must be positive, got {}".format( nlanes ) )
+
+    self.model   = model
+    self.nlanes  = nlanes
+    self.ncycles = 0
+
+    # Allocate one lane array per net, signals are mapped to the array
+    # of their net by id
+
+    signals              = sim.collect_signals( model )
+    nets, slice_connects = sim.signals_to_nets( signals )
+
+    self._arrays = {}
+    self._nbits  = {}
+    self._next   = {}   # id( array ) -> ( array, next state array )
+
+    for net in nets:
+      nbits = next( iter( net ) ).nbits
+      if nbits > 64:
+        continue
+      arr = np.zeros( nlanes, dtype=np.uint64 )
+      for x in net:
+        if isinstance( x._signalvalue, int ):
+          arr[:] = x._signalvalue
+        self._arrays[ id( x ) ] = arr
+      self._nbits[ id( arr ) ] = nbits
+
+    # Translate all logic blocks
+
+    self._sequential_blocks = []
+    comb_blocks             = []
+
+    def translate( m ):
+      if m.get_tick_blocks():
+        raise BatchTranslationError(
+          "{} has @tick blocks, only @combinational and @posedge_clk "
+          "blocks can be simulated in batch mode!".format( m.class_name ) )
+      for func in m.get_posedge_clk_blocks():
+        self._sequential_blocks.append(
+          translate_batch_block( m, func, self, sequential=True ) )
+      for func in m.get_combinational_blocks():
+        comb_blocks.append(
+          translate_batch_block( m, func, self, sequential=False ) )
+      for sub in m.get_submodules():
+        translate( sub )
+
+    translate( model )
+    slice_blocks = self._create_slice_blocks( slice_connects )
+
+    # Registers: nets written by sequential blocks, flopped every cycle
+
+    self._registers = self._next.values()
+
+    # Levelize all combinational blocks, blocks in combinational cycles
+    # are re-evaluated until their outputs settle
+
+    blocks = comb_blocks + slice_blocks
+    senses = dict( ( f, f._senses ) for f in blocks )
+    stores = dict( ( f, f._stores ) for f in blocks )
+
+    schedule, nlevels, cyclic = \
+      sim.levelize_comb_blocks( blocks, senses, stores )
+
+    self._schedule = schedule
+    self._cyclic   = [ f for f in schedule if f in cyclic ]
+
+  #---------------------------------------------------------------------
+  # array
+  #---------------------------------------------------------------------
+  # Return the lane array of the net of signal.
+  def array( self, signal ):
+    return self._arrays[ id( signal ) ]
+
+  #---------------------------------------------------------------------
+  # next_array
+  #---------------------------------------------------------------------
+  # Return the array holding the next state of the net of signal, which
+  # sequential blocks write and which is flopped at the end of a cycle.
+  def next_array( self, signal ):
+    arr = self.array( signal )
+    if id( arr ) not in self._next:
+      self._next[ id( arr ) ] = ( arr, arr.copy() )
+    return self._next[ id( arr ) ][1]
+
+  #---------------------------------------------------------------------
+  # _create_slice_blocks
+  #---------------------------------------------------------------------
+  # Structural connections between slices of signals become blocks
+  # copying the bits of the source net into the destination net.
+  def _create_slice_blocks( self, slice_connects ):
+
+    def bit_range( addr, nbits ):
+      if addr is None:             return 0, nbits
+      if isinstance( addr, slice ): return addr.start, addr.stop - addr.start
+      return addr, 1
+
+    slice_blocks = []
+
+    for c in slice_connects:
+
+      if c.dest_node.nbits > 64 or c.src_node.nbits > 64:
+        raise BatchTranslationError(
+          "Slice connection {} involves signals wider than 64 bits!"
+          "".format( c ) )
+
+      dest            = self.array( c.dest_node )
+      dest_lo, nbits  = bit_range( c.dest_slice, c.dest_node.nbits )
+      src_lo, _       = bit_range( c.src_slice,  c.src_node.nbits  )
+      mask            = np.uint64( ( 1 << nbits ) - 1 )
+      dest_mask       = ~( mask << np.uint64( dest_lo ) )
+
+      # Constants are written once
+      src_value = c.src_node._signalvalue
+      if isinstance( src_value, int ):
+        value     = ( src_value >> src_lo ) & int( mask )
+        dest[:]   = ( dest & dest_mask ) | np.uint64( value << dest_lo )
+        continue
+
+      src = self.array( c.src_node )
+
+      def slice_block( src=src, dest=dest, src_lo=np.uint64( src_lo ),
+                       dest_lo=np.uint64( dest_lo ), mask=mask,
+                       dest_mask=dest_mask ):
+        value = ( ( src >> src_lo ) & mask ) << dest_lo
+        np.bitwise_or( dest & dest_mask, value, out=dest )
+
+      slice_block._senses = [ src  ]
+      slice_block._stores = [ dest ]
+      slice_blocks.append( slice_block )
+
+    return slice_blocks
+
+  #---------------------------------------------------------------------
+  # __getitem__ / __setitem__
+  #---------------------------------------------------------------------
+  # sim[ signal ] is the (live) lane array of signal, assigning to it
+  # sets the value of each lane (values are broadcast and truncated to
+  # the bitwidth of the signal).
+  def __getitem__( self, signal ):
+    try:
+      return self.array( signal )
+    except KeyError:
+      raise KeyError( "Signal '{}' is not simulated in batch mode (only "
+                      "signals of at most 64 bits are)".format( signal.name ) )
+
+  def __setitem__( self, signal, values ):
+    arr  = self[ signal ]
+    mask = np.uint64( ( 1 << self._nbits[ id( arr ) ] ) - 1 )
+    np.copyto( arr, np.asarray( values, dtype=np.uint64 ) & mask )
+
+  #---------------------------------------------------------------------
+  # reset
+  #---------------------------------------------------------------------
+  # Sets the reset signal high and cycles the simulator.
+  def reset( self ):
+    self[ self.model.reset ] = 1
+    self.cycle()
+    self.cycle()
+    self[ self.model.reset ] = 0
+
+  #---------------------------------------------------------------------
+  # cycle
+  #---------------------------------------------------------------------
+  # Advances all lanes by a single clock cycle: settle the combinational
+  # logic, evaluate all @posedge_clk blocks into the next-state arrays,
+  # flop them, and settle the combinational logic again.
+  def cycle( self ):
+
+    self.eval_combinational()
+
+    for cur, nxt in self._registers:
+      np.copyto( nxt, cur )
+
+    for func in self._sequential_blocks:
+      func()
+
+    for cur, nxt in self._registers:
+      np.copyto( cur, nxt )
+
+    self.eval_combinational()
+
+    self.ncycles += 1
+
+  #---------------------------------------------------------------------
+  # eval_combinational
+  #---------------------------------------------------------------------
+  # Evaluate all combinational blocks in levelized order. Blocks which
+  # are part of a combinational cycle are then re-evaluated until none
+  # of the nets they write change anymore.
+  def eval_combinational( self ):
+
+    for func in self._schedule:
+      func()
+
+    if not self._cyclic:
+      return
+
+    stores = [ a for func in self._cyclic for a in func._stores ]
+    for i in range( 64 * len( self._cyclic ) ):
+      before = [ a.copy() for a in stores ]
+      for func in self._cyclic:
+        func()
+      if all( np.array_equal( a, b ) for a, b in zip( stores, before ) ):
+        return
+
+    raise Exception( "Combinational cycle did not settle!" )
@@ -0,0 +1,248 @@
+#=======================================================================
+# BatchSimulationTool_test.py
+#=======================================================================
+# Each model is simulated with random stimulus in every lane of a
+# BatchSimulationTool and, lane by lane, with the SimulationTool. The
+# outputs of both must match in every cycle.
+
+import pytest
+import random
+
+np = pytest.importorskip( 'numpy' )
+
+from pymtl import *
+
+from BatchSimulationTool import BatchSimulationTool
+from batch_logic         import BatchTranslationError
+
+from pclib.rtl import ( Mux, RegEn, RegRst, RegEnRst, Adder, Subtractor,
+                        Incrementer, ZeroExtender, SignExtender,
+                        LtComparator, EqComparator, LeftLogicalShifter,
+                        RightLogicalShifter, Decoder, RoundRobinArbiter,
+                        RegisterFile )
+
+#-----------------------------------------------------------------------
+# run_lockstep
+#-----------------------------------------------------------------------
+def run_lockstep( mk_model, nlanes=8, ncycles=20, seed=0xfeed ):
+
+  rng = random.Random( seed )
+
+  model = mk_model()
+  model.elaborate()
+  bsim  = BatchSimulationTool( model, nlanes )
+
+  refs = []
+  for lane in range( nlanes ):
+    ref = mk_model()
+    ref.elaborate()
+    refs.append( ( ref, SimulationTool( ref ) ) )
+
+  inports  = [ p for p in model.get_inports()
+               if p.name not in ( 'clk', 'reset' ) ]
+  outports = model.get_outports()
+
+  def ports( ref ):
+    return dict( ( p.name, p._signalvalue ) for p in ref.get_ports() )
+
+  def check():
+    for lane, ( ref, sim ) in enumerate( refs ):
+      ref_ports = ports( ref )
+      for p in outports:
+        assert int( bsim[ p ][ lane ] ) == int( ref_ports[ p.name ] ), \
+          'lane {} port {} cycle {}'.format( lane, p.name, bsim.ncycles )
+
+  bsim.reset()
+  for ref, sim in refs:
+    sim.reset()
+
+  for cycle in range( ncycles ):
+
+    for p in inports:
+      values = [ rng.getrandbits( p.nbits ) for lane in range( nlanes ) ]
+      bsim[ p ] = values
+      for lane, ( ref, sim ) in enumerate( refs ):
+        ports( ref )[ p.name ].value = values[ lane ]
+
+    bsim.eval_combinational()
+    for ref, sim in refs:
+      sim.eval_combinational()
+    check()
+
+    bsim.cycle()
+    for ref, sim in refs:
+      sim.cycle()
+    check()
+
+  return bsim
+
+#-----------------------------------------------------------------------
+# Combinational logic
+#-----------------------------------------------------------------------
+class CombOps( Model ):
+  def __init__( s, nbits ):
+    s.a   = InPort ( nbits )
+    s.b   = InPort ( nbits )
+    s.op  = InPort ( 3 )
+    s.out = OutPort( nbits )
+    s.flg = OutPort( 4 )
+    s.cat = OutPort( 2*nbits )
+    s.ext = OutPort( 16 )
+
+    @s.combinational
+    def logic():
+      if   s.op == 0: s.out.value = s.a + s.b
+      elif s.op == 1: s.out.value = s.a - s.b
+      elif s.op == 2: s.out.value = s.a & ~s.b
+      elif s.op == 3: s.out.value = ( s.a << 1 ) | ( s.b >> 2 )
+      elif s.op == 4: s.out.value = s.a if s.a < s.b else s.b
+      else:           s.out.value = s.a ^ s.b
+
+      s.flg.value = concat( reduce_and( s.a ), reduce_or( s.b ),
+                            reduce_xor( s.a ),
+                            Bits( 1, s.a == s.b and not s.op ) )
+      s.cat.value = concat( s.a, s.b )
+      s.ext.value = sext( s.a[0:4], 16 ) + zext( s.b[2:6], 16 )
+
+def test_CombOps():
+  run_lockstep( lambda: CombOps( 8 ) )
+
+#-----------------------------------------------------------------------
+# Sequential logic
+#-----------------------------------------------------------------------
+class Counter( Model ):
+  def __init__( s ):
+    s.en    = InPort ( 1 )
+    s.load  = InPort ( 4 )
+    s.count = OutPort( 8 )
+
+    @s.posedge_clk
+    def seq():
+      if s.reset:
+        s.count.next = 0
+      elif s.en:
+        s.count.next = s.count + 1
+      else:
+        s.count.next      = s.count
+        s.count.next[4:8] = s.load
+
+def test_Counter():
+  bsim = run_lockstep( Counter, ncycles=40 )
+  assert bsim.ncycles == 42
+
+#-----------------------------------------------------------------------
+# Lists of ports, loops and temporaries
+#-----------------------------------------------------------------------
+class ListOps( Model ):
+  def __init__( s, nports ):
+    s.in_ = InPort [ nports ]( 8 )
+    s.sel = InPort ( clog2( nports ) )
+    s.mux = OutPort( 8 )
+    s.sum = OutPort( 8 )
+    s.out = OutPort[ nports ]( 8 )
+    s.regs = Wire[ nports ]( 8 )
+
+    @s.combinational
+    def comb():
+      s.mux.value = s.in_[ s.sel ]
+      total = 0
+      for i in range( nports ):
+        if s.in_[i] > 100:
+          total = total + s.in_[i]
+        s.out[i].value = 0
+      s.sum.value = total
+      s.out[ s.sel ].value = s.regs[ s.sel ]
+
+    @s.posedge_clk
+    def seq():
+      for i in range( nports ):
+        s.regs[i].next = s.regs[i] + s.in_[i]
+
+def test_ListOps():
+  run_lockstep( lambda: ListOps( 4 ) )
+
+#-----------------------------------------------------------------------
+# BitStruct fields
+#-----------------------------------------------------------------------
+class MsgType( BitStructDefinition ):
+  def __init__( s ):
+    s.type_ = BitField( 2 )
+    s.data  = BitField( 8 )
+
+class FieldOps( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( MsgType() )
+    s.out = OutPort( MsgType() )
+
+    @s.combinational
+    def comb():
+      s.out.type_.value = s.in_.type_ + 1
+      if s.in_.type_ == 0:
+        s.out.data.value = s.in_.data
+      else:
+        s.out.data.value = s.in_.data[0:4]
+
+def test_FieldOps():
+  run_lockstep( FieldOps )
+
+#-----------------------------------------------------------------------
+# Library components (submodules, slice and constant connections)
+#-----------------------------------------------------------------------
+@pytest.mark.parametrize( 'mk_model', [
+  lambda: Mux( 8, 4 ),
+  lambda: RegEn( 8 ),
+  lambda: RegRst( 8, reset_value=5 ),
+  lambda: RegEnRst( 8 ),
+  lambda: Adder( 8 ),
+  lambda: Subtractor( 8 ),
+  lambda: Incrementer( 8, 3 ),
+  lambda: ZeroExtender( 4, 8 ),
+  lambda: SignExtender( 4, 8 ),
+  lambda: LtComparator( 8 ),
+  lambda: EqComparator( 8 ),
+  lambda: LeftLogicalShifter( 8, 3 ),
+  lambda: RightLogicalShifter( 8, 3 ),
+  lambda: Decoder( 3, 8 ),
+  lambda: RoundRobinArbiter( 4 ),
+  lambda: RegisterFile( 8, 8, 2, 1 ),
+  lambda: RegisterFile( 8, 64, 2, 1 ),
+])
+def test_pclib( mk_model ):
+  run_lockstep( mk_model )
+
+#-----------------------------------------------------------------------
+# Errors
+#-----------------------------------------------------------------------
+class TickModel( Model ):
+  def __init__( s ):
+    s.out = OutPort( 8 )
+
+    @s.tick
+    def logic():
+      s.out.next = s.out + 1
+
+def test_TickBlocks():
+  model = TickModel()
+  model.elaborate()
+  with pytest.raises( BatchTranslationError ):
+    BatchSimulationTool( model, 4 )
+
+class PrintModel( Model ):
+  def __init__( s ):
+    s.out = OutPort( 8 )
+
+    @s.combinational
+    def logic():
+      while s.out < 4:
+        s.out.value = s.out + 1
+
+def test_Unsupported():
+  model = PrintModel()
+  model.elaborate()
+  with pytest.raises( BatchTranslationError ) as e:
+    BatchSimulationTool( model, 4 )
+  assert 'While' in str( e.value )
+
+def test_Unelaborated():
+  with pytest.raises( Exception ):
+    BatchSimulationTool( Counter(), 4 )
@@ -25,6 +25,9 @@ class SimulationMetrics( object ):
     self.num_posedge_clk_blocks                  = 0
     self.num_combinational_blocks                = 0
     self.num_slice_blocks                        = 0
+    self.num_sched_blocks                        = 0
+    self.num_sched_levels                        = 0
+    self.num_cyclic_blocks                       = 0
     self.input_add_events_per_cycle              = [ 0 ]
     self.clock_add_events_per_cycle              = [ 0 ]
     self.input_add_callbk_per_cycle              = [ 0 ]
@@ -52,6 +55,30 @@ class SimulationMetrics( object ):
     return [ x+y for x,y in zip( self.input_add_events_per_cycle,
                                  self.clock_add_events_per_cycle ) ]
 
+  #-----------------------------------------------------------------------
+  # avg_comb_evals_per_cycle
+  #-----------------------------------------------------------------------
+  # Average number of combinational blocks evaluated per cycle. Compare
+  # this between schedulers to see the reduction in block evaluations.
+  @property
+  def avg_comb_evals_per_cycle( self ):
+    if not self._ncycles:
+      return 0.0
+    return sum( self.comb_evals_per_cycle[:self._ncycles] ) \
+           / float( self._ncycles )
+
+  #-----------------------------------------------------------------------
+  # comb_evals_reduction
+  #-----------------------------------------------------------------------
+  # Fraction of combinational block evaluations per cycle saved relative
+  # to the metrics collected from a baseline simulation (e.g., the same
+  # model simulated with the event-driven scheduler).
+  def comb_evals_reduction( self, baseline ):
+    base = baseline.avg_comb_evals_per_cycle
+    if not base:
+      return 0.0
+    return 1.0 - self.avg_comb_evals_per_cycle / base
+
   #-----------------------------------------------------------------------
   # reg_model
   #-----------------------------------------------------------------------
@@ -72,6 +99,15 @@ class SimulationMetrics( object ):
     if is_slice:
       self.num_slice_blocks += 1
 
+  #-----------------------------------------------------------------------
+  # reg_schedule
+  #-----------------------------------------------------------------------
+  # Register the static schedule created for the design.
+  def reg_schedule( self, nblocks, nlevels, ncyclic ):
+    self.num_sched_blocks  = nblocks
+    self.num_sched_levels  = nlevels
+    self.num_cyclic_blocks = ncyclic
+
   #-----------------------------------------------------------------------
   # incr_metrics_cycle
   #-----------------------------------------------------------------------
@@ -102,8 +138,9 @@ class SimulationMetrics( object ):
   #-----------------------------------------------------------------------
   # incr_add_events
   #-----------------------------------------------------------------------
-  # Increment the number of times add_event() was called.
-  def incr_add_events( self ):
+  # Increment the number of times add_event() was called for the
+  # SignalValue svalue.
+  def incr_add_events( self, svalue = None ):
     if self._pre_tick:
       self.input_add_events_per_cycle[ self._ncycles ] += 1
     else:
@@ -113,8 +150,8 @@ class SimulationMetrics( object ):
   # incr_add_events
   #-----------------------------------------------------------------------
   # Increment the number of callbacks we attempted to place on the event
-  # queue.
-  def incr_add_callbk( self ):
+  # queue (func is the callback).
+  def incr_add_callbk( self, func = None ):
     if self._pre_tick:
       self.input_add_callbk_per_cycle[ self._ncycles ] += 1
     else:
@@ -153,6 +190,11 @@ class SimulationMetrics( object ):
     print("@posedge_clk blocks:   {:4}".format(self.num_posedge_clk_blocks  ))
     print("@combinational blocks: {:4}".format(self.num_combinational_blocks))
     print("slice blocks:          {:4}".format(self.num_slice_blocks        ))
+    if self.num_sched_blocks:
+      print("scheduled blocks:      {:4}".format(self.num_sched_blocks      ))
+      print("schedule levels:       {:4}".format(self.num_sched_levels      ))
+      print("cyclic blocks:         {:4}".format(self.num_cyclic_blocks     ))
+    print("comb evals per cycle:  {:7.2f}".format(self.avg_comb_evals_per_cycle))
     print("-"*72)
     if not detailed:
       return
@@ -195,8 +237,9 @@ class DummyMetrics( object ):
 
   def reg_model( self, model ): pass
   def reg_eval( self, eval, is_slice = False ): pass
+  def reg_schedule( self, nblocks, nlevels, ncyclic ): pass
   def incr_metrics_cycle( self ): pass
   def start_tick( self ): pass
-  def incr_add_events( self ): pass
-  def incr_add_callbk( self ): pass
+  def incr_add_events( self, svalue = None ): pass
+  def incr_add_callbk( self, func = None ): pass
   def incr_comb_evals( self, eval ): pass
@@ -10,12 +10,17 @@ from __future__ import print_function
 
 import pprint
 import collections
+import heapq
 import inspect
 import warnings
 import sim_utils as sim
 
 from sys               import flags
+from timeit            import default_timer as profiler_timer
 from SimulationMetrics import SimulationMetrics, DummyMetrics
+from net_storage       import NetStorage
+from swapping          import ( create_route_callbacks, get_models,
+                                get_inactive_models, set_comb_blocks_enabled )
 
 #-----------------------------------------------------------------------
 # SimulationTool
@@ -30,7 +35,39 @@ class SimulationTool( object ):
   # __init__
   #---------------------------------------------------------------------
   # Construct a simulator based on the provided model.
-  def __init__( self, model, collect_metrics = False ):
+  #
+  # The sched parameter selects how @combinational blocks are
+  # scheduled:
+  #
+  # - 'event':  blocks are placed on a FIFO event queue whenever a
+  #             signal in their sensitivity list changes (default).
+  # - 'static': blocks are levelized once at construction time using
+  #             the signals they read and write, then always evaluated
+  #             in that fixed order. Each block evaluates at most once
+  #             per call to eval_combinational(), unless it is part of
+  #             a combinational cycle.
+  # - 'compiled': uses the static schedule, and additionally generates
+  #             flat cycle() and eval_combinational() functions with all
+  #             sequential blocks and simulator state bound up front.
+  #
+  # The storage parameter selects how net values are stored:
+  #
+  # - 'object': each net is a separate SignalValue object (default).
+  # - 'array':  the values of all nets up to 64 bits are stored in
+  #             contiguous arrays indexed by net id (see net_storage.py),
+  #             model attributes become thin views into those arrays.
+  #
+  # If profile is set, the wall time spent in each sequential block,
+  # combinational block and slice callback is measured and available in
+  # self.profiler (see profiler.py). Profiling uses its own cycle() and
+  # eval_combinational() implementations (the compiled scheduler falls
+  # back to the static one), which do not affect the regular ones.
+  #
+  # If trace_evals is set, metrics are collected with EvalTraceMetrics,
+  # which additionally trace which signal writes trigger each
+  # combinational evaluation (see eval_trace.py).
+  def __init__( self, model, collect_metrics = False, sched = 'event',
+                storage = 'object', profile = False, trace_evals = False ):
 
     # Check that the model has been elaborated
     if not model.is_elaborated():
@@ -38,8 +75,17 @@ class SimulationTool( object ):
                        "Provided model has not been elaborated yet!!!"
                        "".format( self.__class__.__name__ ) )
 
+    if sched not in ( 'event', 'static', 'compiled' ):
+      raise ValueError( "Unknown scheduler '{}', expected 'event', "
+                        "'static' or 'compiled'!".format( sched ) )
+
+    if storage not in ( 'object', 'array' ):
+      raise ValueError( "Unknown storage '{}', expected 'object' or "
+                        "'array'!".format( storage ) )
+
     self.model                = model
     self.ncycles              = 0
+    self.sched                = sched
 
     self._event_queue         = EventQueue()
     self._sequential_blocks   = []
@@ -47,6 +93,13 @@ class SimulationTool( object ):
     self._current_func        = None
 
     self._nets                = None # TODO: remove me
+    self._net_storage         = NetStorage() if storage == 'array' else None
+    self._flop_registers      = ( self._net_storage.flop_registers
+                                  if self._net_storage is not None
+                                  else flop_registers )
+
+    self.profiler             = None
+    self.vcd_writer           = None
 
     #self._DEBUG_signal_cbs    = collections.defaultdict(list)
 
@@ -54,7 +107,10 @@ class SimulationTool( object ):
     # Only collect metrics if they are enabled, otherwise replace
     # with a dummy collection class.
 
-    if collect_metrics:
+    if trace_evals:
+      from eval_trace import EvalTraceMetrics
+      self.metrics            = EvalTraceMetrics( self )
+    elif collect_metrics:
       self.metrics            = SimulationMetrics()
     else:
       self.metrics            = DummyMetrics()
@@ -76,14 +132,34 @@ class SimulationTool( object ):
     nets, slice_connections = sim.signals_to_nets( signals )
     sequential_blocks       = sim.register_seq_blocks( model )
 
-    sim.insert_signal_values( self, nets )
+    sim.insert_signal_values( self, nets, self._net_storage )
 
-    sim.register_comb_blocks  ( model, self._event_queue )
-    sim.create_slice_callbacks( slice_connections, self._event_queue )
+    comb_stores  = {} if sched != 'event' else None
+    comb_blocks  = sim.register_comb_blocks  ( model, self._event_queue,
+                                               comb_stores )
+    slice_blocks = sim.create_slice_callbacks( slice_connections,
+                                               self._event_queue )
+    route_blocks, self._impl_routes = \
+                   create_route_callbacks( model, self._event_queue )
+    slice_blocks += route_blocks
     sim.register_cffi_updates ( model )
 
+    for func in comb_blocks:
+      self.metrics.reg_eval( func )
+    for func in slice_blocks:
+      self.metrics.reg_eval( func, is_slice = True )
+
     self._nets              = nets
-    self._sequential_blocks = sequential_blocks
+    self._comb_blocks       = comb_blocks + slice_blocks
+
+    # Only simulate the active implementation of SwappableModels
+
+    inactive = get_inactive_models( model )
+    set_comb_blocks_enabled( inactive, False, self._event_queue )
+
+    self._all_sequential_blocks = sequential_blocks
+    self._sequential_blocks     = [ func for func in sequential_blocks
+                                    if func._model not in inactive ]
 
     # Setup vcd dumping if it's configured
 
@@ -91,6 +167,209 @@ class SimulationTool( object ):
       from vcd import VCDUtil
       VCDUtil( self, model.vcd_file )
 
+    # Replace the event queue with a levelized queue if the static
+    # scheduler was requested, and generate the flat cycle function if
+    # the compiled scheduler was requested.
+
+    compiled = sched == 'compiled' and not profile
+
+    if sched != 'event':
+      self._create_static_schedule( comb_blocks, slice_blocks, comb_stores,
+                                    compiled, inactive )
+
+    if compiled:
+      self._create_compiled_cycle( dev = not flags.optimize )
+
+    # Wrap all blocks for profiling if requested
+
+    if profile:
+      from profiler import SimulationProfiler
+      self.profiler = SimulationProfiler( model, sequential_blocks,
+                                          comb_blocks, slice_blocks )
+      self.cycle              = self._profile_cycle
+      self.eval_combinational = self._profile_eval
+
+  #---------------------------------------------------------------------
+  # _create_static_schedule
+  #---------------------------------------------------------------------
+  # Levelize all combinational blocks and slice callbacks, then swap the
+  # FIFO event queue for a LevelizedEventQueue which always dequeues the
+  # pending block with the lowest level first. Blocks in combinational
+  # cycles share consecutive ranks and simply get re-enqueued until
+  # their values settle, as with the dynamic event queue. The compiled
+  # scheduler uses a CompiledEventQueue instead.
+  def _create_static_schedule( self, comb_blocks, slice_blocks, comb_stores,
+                               compiled=False, inactive=() ):
+
+    senses, stores = {}, {}
+    for func in comb_blocks:
+      senses[ func ] = func._model._newsenses[ func ]
+      stores[ func ] = comb_stores.get( func, [] )
+    for func in slice_blocks:
+      senses[ func ] = func._senses
+      stores[ func ] = func._stores
+
+    blocks = comb_blocks + slice_blocks
+    schedule, nlevels, cyclic = \
+      sim.levelize_comb_blocks( blocks, senses, stores )
+
+    if cyclic and self.model._debug:
+      warnings.warn( "{} combinational blocks are part of a combinational "
+                     "cycle and will be scheduled dynamically."
+                     "".format( len( cyclic ) ), Warning )
+
+    # Prime the new queue with every block, just like the event queue,
+    # except for the disabled blocks of the inactive models
+
+    disabled = set( func for m in inactive for func in m._newsenses )
+
+    queue_class       = CompiledEventQueue if compiled else LevelizedEventQueue
+    self._event_queue = queue_class( schedule )
+    for func in schedule:
+      if func not in disabled:
+        self._event_queue.enq( func.cb, func.id )
+
+    self._schedule    = schedule
+    self._cyclic      = cyclic
+    self.metrics.reg_schedule( len( schedule ), nlevels, len( cyclic ) )
+
+  #---------------------------------------------------------------------
+  # _create_compiled_cycle
+  #---------------------------------------------------------------------
+  # Generate and exec() a flat implementation of cycle() and
+  # eval_combinational(). Every sequential block is called directly
+  # (unrolled), and every scheduled combinational block is called inline
+  # in levelized order, guarded by its pending flag in the
+  # CompiledEventQueue. The pass is repeated while any block is pending,
+  # which settles combinational cycles and picks up blocks enqueued out
+  # of order. The register queue and all other simulator state are bound
+  # as closure variables, avoiding the attribute lookups and method
+  # dispatch of _perf_cycle. The dev version additionally toggles the
+  # clock and updates metrics and the VCD trace, like _dev_cycle. The
+  # generated source is kept in self._cycle_src.
+  def _create_compiled_cycle( self, dev ):
+
+    nblocks = len( self._event_queue.funcs )
+    nticks  = len( self._sequential_blocks )
+
+    # Inlined combinational blocks
+
+    eval_src = [ 'while True in func_bv:' ]
+    for i in range( nblocks ):
+      eval_src += [
+        '  if func_bv[{}]:'.format( i ),
+        '    func_bv[{}] = False'.format( i ),
+        '    sim._current_func = comb_{}'.format( i ),
+        '    incr_comb_evals( comb_{} )'.format( i ) if dev else None,
+        '    comb_{}()'.format( i ),
+      ]
+    if not nblocks:
+      eval_src += [ '  pass' ]
+    eval_src += [ 'sim._current_func = None' ]
+    eval_src  = [ x for x in eval_src if x is not None ]
+
+    cycle_src = [ 'eval_combinational()' ]
+    if dev:
+      cycle_src += [ 'clk.value = 0', 'clk.value = 1', 'start_tick()' ]
+    cycle_src += [ 'tick_{}()'.format( i ) for i in range( nticks ) ]
+    cycle_src += [
+      'flop_registers( reg_queue )',
+      'eval_combinational()',
+      'sim.ncycles += 1',
+    ]
+    if dev:
+      cycle_src += [ 'incr_metrics_cycle()' ]
+    if dev and self.vcd_writer:
+      cycle_src += [ 'vcd_end_cycle()' ]
+
+    bindings  = [ 'tick_{0} = ticks[{0}]'.format( i ) for i in range( nticks ) ]
+    bindings += [ 'comb_{0} = funcs[{0}]'.format( i ) for i in range( nblocks ) ]
+    if dev and self.vcd_writer:
+      bindings += [ 'vcd_end_cycle = sim.vcd_writer.end_cycle' ]
+
+    src = '\n'.join(
+      [ 'def create_cycle( sim, ticks ):',
+        '  funcs              = sim._event_queue.funcs',
+        '  func_bv            = sim._event_queue.func_bv',
+        '  reg_queue          = sim._register_queue',
+        '  flop_registers     = sim._flop_registers',
+        '  clk                = sim.model.clk',
+        '  start_tick         = sim.metrics.start_tick',
+        '  incr_comb_evals    = sim.metrics.incr_comb_evals',
+        '  incr_metrics_cycle = sim.metrics.incr_metrics_cycle', ]
+      + [ '  ' + x for x in bindings ]
+      + [ '  def eval_combinational():' ]
+      + [ '    ' + x for x in eval_src ]
+      + [ '  def cycle():' ]
+      + [ '    ' + x for x in cycle_src ]
+      + [ '  return cycle, eval_combinational', '' ]
+    )
+
+    namespace = {}
+    exec( compile( src, '<compiled cycle>', 'exec' ), namespace )
+
+    self._cycle_src = src
+    self.cycle, self.eval_combinational = \
+      namespace['create_cycle']( self, list( self._sequential_blocks ) )
+
+  #---------------------------------------------------------------------
+  # swap
+  #---------------------------------------------------------------------
+  # Switch the SwappableModel model to the implementation for level
+  # (e.g., 'fl', 'cl' or 'rtl') between two cycles. transfer( old, new )
+  # is called first to transfer the architectural state from the old to
+  # the new implementation. If no transfer function is given and the new
+  # implementation has a transfer_state( old ) method, it is called
+  # instead. See swapping.py for details.
+  def swap( self, model, level, transfer=None ):
+
+    old = model.get_impl()
+    new = model.get_impl( level )
+    if new is old:
+      return
+
+    if transfer is not None:
+      transfer( old, new )
+    elif hasattr( new, 'transfer_state' ):
+      new.transfer_state( old )
+
+    self._set_level( model, level )
+
+  #---------------------------------------------------------------------
+  # _set_level
+  #---------------------------------------------------------------------
+  # Make the implementation for level the active implementation of the
+  # SwappableModel model without transferring any state. Also used to
+  # restore the levels saved in a checkpoint.
+  def _set_level( self, model, level ):
+
+    old = model.get_impl()
+    new = model.get_impl( level )
+    if new is old:
+      return
+
+    model._active = model.levels.index( level )
+
+    # Disable the blocks of the old implementation and enable the blocks
+    # of the new one (except for inactive implementations of nested
+    # SwappableModels)
+
+    inactive = get_inactive_models( self.model )
+    set_comb_blocks_enabled( get_models( old ), False, self._event_queue )
+    set_comb_blocks_enabled( get_models( new ) - inactive, True,
+                             self._event_queue )
+
+    self._sequential_blocks[:] = [ func for func in self._all_sequential_blocks
+                                   if func._model not in inactive ]
+
+    # Route the current outputs of the new implementation
+
+    for func in self._impl_routes.get( new, [] ):
+      func()
+
+    if self.sched == 'compiled' and not self.profiler:
+      self._create_compiled_cycle( dev = not flags.optimize )
+
   #---------------------------------------------------------------------
   # reset
   #---------------------------------------------------------------------
@@ -101,6 +380,25 @@ class SimulationTool( object ):
     self.cycle()
     self.model.reset.v = 0
 
+  #---------------------------------------------------------------------
+  # checkpoint
+  #---------------------------------------------------------------------
+  # Save the complete simulator state (all net values, pending register
+  # updates, the cycle count and the Python-side state of all models) to
+  # the file at path. See checkpoint.py for details.
+  def checkpoint( self, path ):
+    from checkpoint import save_checkpoint
+    save_checkpoint( self, path )
+
+  #---------------------------------------------------------------------
+  # restore
+  #---------------------------------------------------------------------
+  # Restore the state saved by checkpoint(), the simulator must simulate
+  # the same design as the one the checkpoint was taken from.
+  def restore( self, path ):
+    from checkpoint import load_checkpoint
+    load_checkpoint( self, path )
+
   #---------------------------------------------------------------------
   # print_line_trace
   #---------------------------------------------------------------------
@@ -108,6 +406,80 @@ class SimulationTool( object ):
   def print_line_trace( self ):
     print( "{:>3}:".format( self.ncycles ), self.model.line_trace() )
 
+  #---------------------------------------------------------------------
+  # get_stimulus_ports
+  #---------------------------------------------------------------------
+  # The top-level input ports (except clk) set by the stimulus records
+  # of step(), in record order (sorted by name).
+  def get_stimulus_ports( self ):
+    names = getattr( self.model, '_stim_ports', None )
+    if names is None:
+      return [ port._signalvalue for port in
+               sorted( self.model.get_inports(), key=lambda x: x.name )
+               if port.name != 'clk' ]
+    return [ sim._get_attr_path( self.model, sim._parse_attr_path( name ) )
+             for name in names ]
+
+  #---------------------------------------------------------------------
+  # step
+  #---------------------------------------------------------------------
+  # Advances the simulator by ncycles clock cycles. The inputs are held
+  # constant, or, if stimulus is given, set before each cycle from one
+  # record per cycle holding the values of get_stimulus_ports(). For
+  # verilated models, stimulus may also be a buffer returned by the
+  # pack_stimulus() method of the model.
+  #
+  # If the whole design is a verilated model (see verilator_sim.py), all
+  # cycles are simulated in C without returning to Python, and only the
+  # final output values are visible (e.g., no PyMTL VCD dumping of the
+  # intermediate cycles, so VCD dumping falls back to cycle()).
+  # Otherwise this is the same as calling cycle() ncycles times.
+  def step( self, ncycles, stimulus=None ):
+
+    # Records are read from packed buffers with unpack_stimulus(), which
+    # also checks the length of the buffer
+
+    if stimulus is None:
+      get_record = None
+    elif hasattr( self.model, 'unpack_stimulus' ) and \
+         isinstance( stimulus, self.model.ffi.CData ):
+      get_record = lambda i: self.model.unpack_stimulus( stimulus, i )
+      if ncycles:
+        get_record( ncycles-1 )
+    else:
+      get_record = stimulus.__getitem__
+      if len( stimulus ) < ncycles:
+        raise ValueError( "stimulus holds less than {} cycles"
+                          "".format( ncycles ) )
+
+    ports = self.get_stimulus_ports()
+
+    if ( hasattr( self.model, '_stim_ports' ) and not self.profiler
+         and self.vcd_writer is None ):
+
+      self.eval_combinational()
+      self.model.step( ncycles, stimulus )
+      self.ncycles += ncycles
+
+      # Leave the inputs at the last record, as cycle() would
+
+      if get_record is not None and ncycles:
+        for port, value in zip( ports, get_record( ncycles-1 ) ):
+          port.value = value
+
+      self.eval_combinational()
+      return
+
+    for i in xrange( ncycles ):
+      if get_record is not None:
+        record = get_record( i )
+        if len( record ) != len( ports ):
+          raise ValueError( "stimulus record {} does not match the input "
+                            "ports".format( record ) )
+        for port, value in zip( ports, record ):
+          port.value = value
+      self.cycle()
+
   #---------------------------------------------------------------------
   # cycle
   #---------------------------------------------------------------------
@@ -142,9 +514,7 @@ class SimulationTool( object ):
       func()
 
     # Then flop the shadow state on all registers
-    while self._register_queue:
-      reg = self._register_queue.pop()
-      reg.flop()
+    self._flop_registers( self._register_queue )
 
     # Call all events generated by synchronous logic
     self.eval_combinational()
@@ -155,6 +525,10 @@ class SimulationTool( object ):
     # Tell the metrics module to prepare for the next cycle
     self.metrics.incr_metrics_cycle()
 
+    # Record the changes of this cycle in the VCD trace
+    if self.vcd_writer:
+      self.vcd_writer.end_cycle()
+
   #---------------------------------------------------------------------
   # _perf_cycle
   #---------------------------------------------------------------------
@@ -169,9 +543,7 @@ class SimulationTool( object ):
       func()
 
     # Then flop the shadow state on all registers
-    while self._register_queue:
-      reg = self._register_queue.pop()
-      reg.flop()
+    self._flop_registers( self._register_queue )
 
     # Call all events generated by synchronous logic
     self.eval_combinational()
@@ -179,6 +551,39 @@ class SimulationTool( object ):
     # Increment the simulator cycle count
     self.ncycles += 1
 
+  #---------------------------------------------------------------------
+  # _profile_cycle
+  #---------------------------------------------------------------------
+  # Implementation of cycle() for use when profiling, same as _dev_cycle
+  # but calls the profiled version of each sequential block.
+  def _profile_cycle( self ):
+
+    start    = profiler_timer()
+    wrappers = self.profiler.wrappers
+
+    self.eval_combinational()
+
+    self.model.clk.value = 0
+    self.model.clk.value = 1
+
+    self.metrics.start_tick()
+
+    for func in self._sequential_blocks:
+      wrappers[ func ]()
+
+    self._flop_registers( self._register_queue )
+
+    self.eval_combinational()
+
+    self.ncycles += 1
+
+    self.metrics.incr_metrics_cycle()
+
+    if self.vcd_writer:
+      self.vcd_writer.end_cycle()
+
+    self.profiler.add_cycle( profiler_timer() - start )
+
   #---------------------------------------------------------------------
   # eval_combinational
   #---------------------------------------------------------------------
@@ -209,6 +614,18 @@ class SimulationTool( object ):
       func()
       self._current_func = None
 
+  #---------------------------------------------------------------------
+  # _profile_eval
+  #---------------------------------------------------------------------
+  # Implementation of eval_combinational() for use when profiling.
+  def _profile_eval( self ):
+    wrappers = self.profiler.wrappers
+    while self._event_queue.len():
+      self._current_func = func = self._event_queue.deq()
+      self.metrics.incr_comb_evals( func )
+      wrappers[ func ]()
+      self._current_func = None
+
   #---------------------------------------------------------------------
   # add_event
   #---------------------------------------------------------------------
@@ -224,15 +641,25 @@ class SimulationTool( object ):
     #print([x.fullname for x in signal_value._DEBUG_signal_names], end='')
     #print(self._DEBUG_signal_cbs[signal_value])
 
-    self.metrics.incr_add_events()
+    self.metrics.incr_add_events( signal_value )
 
     # Place all other callbacks in the event queue for execution later
 
     for func in signal_value._callbacks:
-      self.metrics.incr_add_callbk()
+      self.metrics.incr_add_callbk( func )
       if func != self._current_func:
         self._event_queue.enq( func.cb, func.id )
 
+#-----------------------------------------------------------------------
+# flop_registers
+#-----------------------------------------------------------------------
+# Flop all registers in the register queue and empty it. Used with the
+# object net storage, NetStorage.flop_registers() replaces it with array
+# storage.
+def flop_registers( queue ):
+  while queue:
+    queue.pop().flop()
+
 #-----------------------------------------------------------------------
 # EventQueue
 #-----------------------------------------------------------------------
@@ -253,6 +680,11 @@ class EventQueue( object ):
     self.func_bv[ event.id ] = False
     return event
 
+  def discard( self, event, id ):
+    if self.func_bv[ id ]:
+      self.func_bv[ id ] = False
+      self.fifo.remove( event )
+
   def len( self ):
     return len( self.fifo )
 
@@ -265,3 +697,67 @@ class EventQueue( object ):
     if self.func_ids > len( self.func_bv ):
       self.func_bv.extend( [ False ] * 1000 )
     return id
+
+#-----------------------------------------------------------------------
+# LevelizedEventQueue
+#-----------------------------------------------------------------------
+# Event queue used by the static scheduler. Each block's id is replaced
+# by its rank in the static schedule, and pending ids are kept in a
+# heap so that blocks are always evaluated in levelized order. Provides
+# the same interface as EventQueue.
+class LevelizedEventQueue( object ):
+
+  def __init__( self, schedule ):
+    self.heap     = []
+    self.funcs    = list( schedule )
+    self.func_bv  = [ False ] * len( schedule )
+    for rank, func in enumerate( schedule ):
+      func.id = rank
+
+  def enq( self, event, id ):
+    if not self.func_bv[ id ]:
+      self.func_bv[ id ] = True
+      heapq.heappush( self.heap, id )
+
+  def deq( self ):
+    id = heapq.heappop( self.heap )
+    self.func_bv[ id ] = False
+    return self.funcs[ id ]
+
+  def discard( self, event, id ):
+    if self.func_bv[ id ]:
+      self.func_bv[ id ] = False
+      self.heap.remove( id )
+      heapq.heapify( self.heap )
+
+  def len( self ):
+    return len( self.heap )
+
+  def __len__( self ):
+    return len( self.heap )
+
+#-----------------------------------------------------------------------
+# CompiledEventQueue
+#-----------------------------------------------------------------------
+# Event queue used by the compiled scheduler. Pending blocks are only
+# flagged in func_bv, the generated eval_combinational() checks the
+# flags in schedule order and calls the pending blocks inline. Provides
+# the same interface as EventQueue.
+class CompiledEventQueue( LevelizedEventQueue ):
+
+  def enq( self, event, id ):
+    self.func_bv[ id ] = True
+
+  def deq( self ):
+    id = self.func_bv.index( True )
+    self.func_bv[ id ] = False
+    return self.funcs[ id ]
+
+  def discard( self, event, id ):
+    self.func_bv[ id ] = False
+
+  def len( self ):
+    return self.func_bv.count( True )
+
+  def __len__( self ):
+    return self.func_bv.count( True )
@@ -0,0 +1,148 @@
+#=======================================================================
+# SimulationTool_array_test.py
+#=======================================================================
+# Tests for the array-backed net storage of the SimulationTool.
+
+import pytest
+
+from copy  import copy, deepcopy
+from array import array
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use array net storage.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+from net_storage import NetStorage, NetView
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using array net storage
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, storage='array' )
+  return model, sim
+
+#=======================================================================
+# Net Storage Tests
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# Delay
+#-----------------------------------------------------------------------
+class Delay( Model ):
+  def __init__( s ):
+    s.in_  = InPort ( 16 )
+    s.out  = OutPort( 16 )
+    s.wide = OutPort( 80 )
+
+    @s.tick
+    def logic():
+      s.out.next  = s.in_
+      s.wide.next = s.in_
+
+def test_ArrayStorageLayout():
+  model = Delay()
+  model.elaborate()
+  sim   = SimulationTool( model, storage='array' )
+  store = sim._net_storage
+  assert isinstance( store, NetStorage )
+  assert isinstance( model.in_, NetView )
+  assert isinstance( model.out, NetView )
+  # Nets wider than a machine word keep the object representation
+  assert not isinstance( model.wide, NetView )
+  assert any( net is model.out  for net in store.nets )
+  assert not any( net is model.wide for net in store.nets )
+
+def test_ArrayStorageSlots():
+  model = Delay()
+  model.elaborate()
+  sim   = SimulationTool( model, storage='array' )
+  sim.reset()
+  model.in_.value = 3
+  sim.cycle()
+  # Views keep all attributes (including the simulator's) in slots
+  for net in sim._net_storage.nets:
+    assert vars( net ) == {}
+    assert vars( net._next ) == {}
+
+def test_ArrayStorageWidth():
+  # Array slots are C unsigned longs, wider nets are not supported
+  store = NetStorage()
+  assert store.max_nbits == array( 'L' ).itemsize * 8
+  assert     store.supports( Bits( store.max_nbits ) )
+  assert not store.supports( Bits( store.max_nbits + 1 ) )
+
+def test_ArrayStorageFlop():
+  model = Delay()
+  model.elaborate()
+  sim   = SimulationTool( model, storage='array' )
+  store = sim._net_storage
+  sim.reset()
+  for i in range( 10 ):
+    model.in_.value = i
+    sim.cycle()
+    assert model.out  == i
+    assert model.wide == i
+    assert store.values[ model.out._idx ] == i
+
+def test_ArrayStorageFlopRegisters():
+  model = Delay()
+  model.elaborate()
+  sim   = SimulationTool( model, storage='array' )
+  store = sim._net_storage
+  sim.reset()
+  notified = []
+  model.out.notify_sim_comb_update = lambda: notified.append( 'out' )
+  model.in_.notify_sim_comb_update = lambda: notified.append( 'in_' )
+  # Queued registers (including duplicates and wide nets) are flopped,
+  # changed ones are notified once
+  model.out .next = 5
+  model.wide.next = 6
+  model.in_ .next = 0
+  queue = [ model.out, model.wide, model.in_, model.out ]
+  store.flop_registers( queue )
+  assert queue    == []
+  assert notified == [ 'out' ]
+  assert model.out == 5 and model.wide == 6
+  # Registers which are not queued keep their value, even if their next
+  # value is stale
+  model.in_.value = 7
+  store.flop_registers( [ model.out ] )
+  assert model.in_ == 7
+
+def test_ArrayStorageCopies():
+  model = Delay()
+  model.elaborate()
+  sim   = SimulationTool( model, storage='array' )
+  sim.reset()
+  model.in_.value = 3
+  for snapshot in [ model.in_[:], copy( model.in_ ), deepcopy( model.in_ ),
+                    model.in_() ]:
+    assert not isinstance( snapshot, NetView )
+    assert type( snapshot ) is Bits
+  saved = model.in_[:]
+  model.in_.value = 4
+  assert saved      == 3
+  assert model.in_  == 4
+
+def test_InvalidStorage():
+  model = Delay()
+  model.elaborate()
+  with pytest.raises( ValueError ):
+    SimulationTool( model, storage='heap' )
@@ -0,0 +1,95 @@
+#=======================================================================
+# SimulationTool_compiled_test.py
+#=======================================================================
+# Tests for the compiled scheduler of the SimulationTool.
+
+import pytest
+
+from sys import flags
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use the compiled
+# scheduler.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using the compiled
+#   scheduler
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, sched='compiled' )
+  return model, sim
+
+#=======================================================================
+# Compiled Cycle Tests
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# TwoStage
+#-----------------------------------------------------------------------
+class TwoStage( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+    s.r0  = Wire   ( 8 )
+    s.r1  = Wire   ( 8 )
+
+    @s.tick
+    def stage0():
+      s.r0.next = s.in_
+
+    @s.posedge_clk
+    def stage1():
+      s.r1.next = s.r0
+
+    @s.combinational
+    def comb():
+      s.out.value = s.r1 + 1
+
+def test_CompiledCycleSource():
+  model = TwoStage()
+  model.elaborate()
+  sim   = SimulationTool( model, sched='compiled' )
+  assert 'tick_0()' in sim._cycle_src
+  assert 'tick_1()' in sim._cycle_src
+  assert 'tick_2()' not in sim._cycle_src
+
+  # Combinational blocks are called inline, guarded by their flags
+  assert 'comb_0()' in sim._cycle_src
+  assert 'if func_bv[0]:' in sim._cycle_src
+  assert 'heappop' not in sim._cycle_src
+
+def test_CompiledCycleMatchesEvent():
+  outs = {}
+  for sched in [ 'event', 'compiled' ]:
+    model = TwoStage()
+    model.elaborate()
+    sim   = SimulationTool( model, collect_metrics=True, sched=sched )
+    sim.reset()
+    outs[ sched ] = []
+    for i in range( 8 ):
+      model.in_.value = i
+      sim.cycle()
+      outs[ sched ].append( int( model.out ) )
+    assert sim.ncycles == 10
+    # Metrics are only collected by the dev (non -O) cycle
+    assert sim.metrics._ncycles == ( 0 if flags.optimize else 10 )
+  assert outs['compiled'] == outs['event']
+  assert outs['compiled'][2:] == [ 2, 3, 4, 5, 6, 7 ]
@@ -0,0 +1,133 @@
+#=======================================================================
+# SimulationTool_sched_test.py
+#=======================================================================
+# Tests for the static (levelized) scheduler of the SimulationTool.
+
+import pytest
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use the static scheduler.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using the static
+#   scheduler
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, sched='static' )
+  return model, sim
+
+#=======================================================================
+# Scheduler Tests
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# Reconverge
+#-----------------------------------------------------------------------
+# The output block is declared first and is sensitive to both a and b,
+# so the event queue may evaluate it before b has been updated.
+class Reconverge( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+    s.a   = Wire   ( 8 )
+    s.b   = Wire   ( 8 )
+
+    @s.combinational
+    def comb_out():
+      s.out.value = s.a + s.b
+
+    @s.combinational
+    def comb_b():
+      s.b.value = s.a + 1
+
+    @s.combinational
+    def comb_a():
+      s.a.value = s.in_ + 1
+
+def test_StaticScheduleOrder():
+  model = Reconverge()
+  model.elaborate()
+  sim   = SimulationTool( model, sched='static' )
+  names = [ func.__name__ for func in sim._schedule ]
+  assert names == [ 'comb_a', 'comb_b', 'comb_out' ]
+  assert not sim._cyclic
+
+def test_StaticScheduleMetrics():
+  metrics = {}
+  for sched in [ 'event', 'static' ]:
+    model = Reconverge()
+    model.elaborate()
+    sim   = SimulationTool( model, collect_metrics=True, sched=sched )
+    sim.reset()
+    for i in range( 10 ):
+      model.in_.value = i
+      sim.cycle()
+      assert model.out == 2*i + 3
+    metrics[ sched ] = sim.metrics
+
+  static, event = metrics['static'], metrics['event']
+  assert static.num_sched_blocks == 3
+  assert static.num_sched_levels == 3
+  assert sum( static.redun_comb_evals_per_cycle ) == 0
+  assert static.avg_comb_evals_per_cycle <= event.avg_comb_evals_per_cycle
+  assert static.comb_evals_reduction( event ) >= 0.0
+
+#-----------------------------------------------------------------------
+# CombLoop
+#-----------------------------------------------------------------------
+# Two blocks which read each others outputs (but settle), these must be
+# scheduled dynamically.
+class CombLoop( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 4 )
+    s.out = OutPort( 4 )
+    s.x   = Wire   ( 4 )
+    s.y   = Wire   ( 4 )
+
+    @s.combinational
+    def comb_x():
+      s.x.value = s.in_ | ( s.y & 1 )
+
+    @s.combinational
+    def comb_y():
+      s.y.value = s.x & 0b1110
+
+    @s.combinational
+    def comb_out():
+      s.out.value = s.y
+
+def test_StaticScheduleCycle():
+  model = CombLoop()
+  model.elaborate()
+  sim   = SimulationTool( model, sched='static' )
+  assert sorted( f.__name__ for f in sim._cyclic ) == [ 'comb_x', 'comb_y' ]
+  assert sim._schedule[-1].__name__ == 'comb_out'
+  sim.reset()
+  for i in range( 16 ):
+    model.in_.value = i
+    sim.eval_combinational()
+    assert model.out == i & 0b1110
+
+def test_InvalidSched():
+  model = Reconverge()
+  model.elaborate()
+  with pytest.raises( ValueError ):
+    SimulationTool( model, sched='magic' )
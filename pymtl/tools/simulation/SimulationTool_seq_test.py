@@ -475,3 +475,41 @@ def test_GetMSB( setup_sim ):
   model.in_.value = 0b10000; sim.cycle(); assert model.out == 1
   model.in_.value = 0b00001; sim.cycle(); assert model.out == 0
 
+
+#-----------------------------------------------------------------------
+# step
+#-----------------------------------------------------------------------
+# Multi-cycle stepping with held inputs and with stimulus records.
+class Accumulator( Model ):
+  def __init__( s, nbits ):
+    s.in_ = InPort ( nbits )
+    s.out = OutPort( nbits )
+
+  def elaborate_logic( s ):
+    @s.posedge_clk
+    def logic():
+      if s.reset: s.out.next = 0
+      else:       s.out.next = s.out + s.in_
+
+def test_step( setup_sim ):
+  model      = Accumulator( 8 )
+  model, sim = setup_sim( model )
+
+  sim.reset()
+  ports = sim.get_stimulus_ports()
+  assert map( id, ports ) == [ id( model.in_ ), id( model.reset ) ]
+
+  model.in_.value = 2
+  sim.step( 5 )
+  assert model.out == 10
+  assert sim.ncycles == 7
+
+  sim.step( 4, [ ( 1, 0 ), ( 3, 0 ), ( 0, 1 ), ( 5, 0 ) ] )
+  assert model.out == 5
+  assert model.in_ == 5
+  assert sim.ncycles == 11
+
+  with pytest.raises( ValueError ):
+    sim.step( 2, [ ( 1, 0 ) ] )
+  with pytest.raises( ValueError ):
+    sim.step( 1, [ ( 1, ) ] )
@@ -6,6 +6,8 @@
 import ast, _ast
 import inspect
 
+from copy import deepcopy
+
 from pymtl               import PyMTLError
 from pymtl.model.signals import Signal
 from ..ast_helpers       import get_closure_dict
@@ -49,7 +51,16 @@ class DetectMissingValueNext( ast.NodeVisitor ):
     self.func   = func
     self.dict_  = get_closure_dict( func )
 
-    self.src, self.funclineno = inspect.getsourcelines( self.func )
+  # The source lines are only needed for error messages, so they are
+  # looked up lazily rather than for every block of every instance.
+
+  @property
+  def src( self ):
+    return inspect.getsourcelines( self.func )[0]
+
+  @property
+  def funclineno( self ):
+    return inspect.getsourcelines( self.func )[1]
 
   def visit_Assign( self, node ):
 
@@ -107,9 +118,10 @@ class DetectMissingValueNext( ast.NodeVisitor ):
 
         # In order to handle lists of Signals, we replace all complex
         # Indexes with the value zero. This will return the first element
-        # in the list.
+        # in the list. The AST is shared with other instances so the
+        # target is copied before being modified.
         try:
-          lhs     = ReplaceIndexesWithZero().visit( lhs )
+          lhs     = ReplaceIndexesWithZero().visit( deepcopy( lhs ) )
           lhs.ctx = ast.Load()
           _code   = compile( ast.Expression( lhs ), '<ast>', 'eval' )
           _temp   = eval( _code, self.dict_ )
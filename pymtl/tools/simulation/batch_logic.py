@@ -0,0 +1,908 @@
+#=======================================================================
+# batch_logic.py
+#=======================================================================
+# Translation of @combinational and @posedge_clk blocks into vectorized
+# Python functions for the BatchSimulationTool. Every net is a NumPy
+# uint64 array with one element per lane, and the generated code
+# evaluates a block for all lanes at once:
+#
+# - expressions become array operations, truncated to the bitwidth the
+#   equivalent Bits operation would produce;
+# - if statements with lane-dependent conditions are predicated: both
+#   branches are evaluated under a lane mask and writes only update the
+#   lanes whose mask is set;
+# - for loops over constant ranges stay Python loops;
+# - lists of signals indexed by lane-dependent values become gathers
+#   and scatters.
+#
+# Only the translatable subset of Python is supported (the same subset
+# accepted by the Verilog translation), anything else raises a
+# BatchTranslationError.
+
+from __future__ import print_function
+
+import ast, _ast
+import inspect
+import __builtin__
+
+import numpy as np
+
+from ..ast_helpers            import get_cached_method_ast, get_closure_dict
+from ...model.signals         import Signal
+from ...model.Model           import Model
+from ...datatypes             import helpers
+from ...datatypes.Bits        import Bits
+from ...datatypes.BitStruct   import BitStruct
+
+#-----------------------------------------------------------------------
+# BatchTranslationError
+#-----------------------------------------------------------------------
+class BatchTranslationError( Exception ):
+  def __init__( self, message, lineno=None ):
+    super( BatchTranslationError, self ).__init__( message )
+    self.lineno = lineno
+
+#-----------------------------------------------------------------------
+# Runtime helpers
+#-----------------------------------------------------------------------
+# Helpers called by the generated code. All lane values are uint64
+# arrays (or bool arrays for comparisons), constants and loop variables
+# are plain Python ints.
+
+_u64 = np.uint64
+
+def _u( x ):
+  if isinstance( x, np.ndarray ):
+    return x.astype( _u64, copy=False )
+  return _u64( x )
+
+def _store( a, v, p ):
+  if p is None: np.copyto( a, v, casting='unsafe' )
+  else:         np.copyto( a, v, casting='unsafe', where=p )
+
+def _bits( x, lo, mask ):
+  return ( _u( x ) >> _u( lo ) ) & _u64( mask )
+
+def _insert( a, v, lo, mask ):
+  m = _u64( mask ) << _u( lo )
+  return ( a & ~m ) | ( ( _u( v ) << _u( lo ) ) & m )
+
+def _sel( c, a, b ):
+  return np.where( c, _u( a ), _u( b ) )
+
+def _gather( lst, idx ):
+  choices = np.stack( np.broadcast_arrays( *lst ) )
+  idx     = np.minimum( _u( idx ), _u64( len( lst ) - 1 ) ).astype( np.intp )
+  return choices[ idx, np.arange( choices.shape[1] ) ]
+
+def _scatter( lst, idx, v, p, lo=None, mask=None ):
+  idx = _u( idx )
+  for i, a in enumerate( lst ):
+    q = ( idx == i ) if p is None else ( ( idx == i ) & p )
+    _store( a, v if lo is None else _insert( a, v, lo, mask ), q )
+
+def _parity( x ):
+  x = _u( x )
+  for shamt in ( 32, 16, 8, 4, 2, 1 ):
+    x = x ^ ( x >> _u64( shamt ) )
+  return x & _u64( 1 )
+
+def _sext( x, nbits, new_nbits ):
+  sign = _u64( 1 << ( nbits - 1 ) )
+  return ( ( _u( x ) ^ sign ) - sign ) & _u64( ( 1 << new_nbits ) - 1 )
+
+_runtime = {
+  'np'       : np,
+  '_u'       : _u,
+  '_store'   : _store,
+  '_bits'    : _bits,
+  '_insert'  : _insert,
+  '_sel'     : _sel,
+  '_gather'  : _gather,
+  '_scatter' : _scatter,
+  '_parity'  : _parity,
+  '_sext'    : _sext,
+}
+
+#-----------------------------------------------------------------------
+# translate_batch_block
+#-----------------------------------------------------------------------
+# Translate a logic block of model into a vectorized function. nets maps
+# signals to their lane arrays (see BatchSimulationTool). Sequential
+# blocks write the next-state arrays of the nets they store to. The
+# returned function has the lists of arrays it reads and writes in its
+# _senses and _stores attributes, and its generated source in _src.
+def translate_batch_block( model, func, nets, sequential ):
+
+  tree, src = get_cached_method_ast( func )
+
+  visitor = _TranslateBatchBlock( model, func, nets, sequential )
+  try:
+    body = visitor.translate( tree.body[0] )
+  except BatchTranslationError as e:
+    lines, filelineno = inspect.getsourcelines( func )
+    lineno = getattr( e, 'lineno', None )
+    if lineno is not None:
+      e.args = ( '{}\n\n> {}File:     {}\nFunction: {}\nLine:     {}\n'
+                 .format( e.args[0], lines[ lineno-1 ],
+                          inspect.getfile( func ), func.func_name,
+                          filelineno + lineno - 1 ), )
+    raise
+
+  name   = '_batch_' + func.func_name
+  source = '\n'.join( [ 'def {}():'.format( name ) ] + body + [ '' ] )
+
+  namespace = dict( _runtime )
+  namespace.update( visitor.namespace )
+  exec compile( source, '<batch {}>'.format( func.func_name ), 'exec' ) \
+    in namespace
+
+  block          = namespace[ name ]
+  block._src     = source
+  block._senses  = visitor.reads.values()
+  block._stores  = visitor.writes.values()
+  block._func    = func
+  return block
+
+#-----------------------------------------------------------------------
+# _Expr
+#-----------------------------------------------------------------------
+# Result of translating an expression. kind is one of:
+#
+# - 'obj':  a Python object known at translation time (the model, lists,
+#           signals before they are read, parameters ...) in obj;
+# - 'dyn':  element idx (an _Expr) of the list of objects in obj, where
+#           the index is only known at runtime;
+# - 'int':  a Python int, code evaluates to it;
+# - 'vec':  a uint64 lane array of nbits bits, code evaluates to it;
+# - 'bool': a bool lane array, code evaluates to it.
+#
+# Values read from signals remember the signal (and bit range) in tgt so
+# that the same expression can be used as the target of a store.
+class _Expr( object ):
+
+  __slots__ = ( 'kind', 'code', 'nbits', 'obj', 'idx', 'dtype', 'tgt' )
+
+  def __init__( self, kind, code=None, nbits=None, obj=None, idx=None,
+                dtype=None, tgt=None ):
+    self.kind  = kind
+    self.code  = code
+    self.nbits = nbits
+    self.obj   = obj
+    self.idx   = idx
+    self.dtype = dtype
+    self.tgt   = tgt
+
+#-----------------------------------------------------------------------
+# _Target
+#-----------------------------------------------------------------------
+# Storage location of a value: a signal (or a runtime index into a list
+# of signals) and optionally the bit range [lo, lo+nbits) within it.
+class _Target( object ):
+
+  __slots__ = ( 'signals', 'idx', 'lo', 'nbits' )
+
+  def __init__( self, signals, idx=None, lo=None, nbits=None ):
+    self.signals = signals
+    self.idx     = idx
+    self.lo      = lo
+    self.nbits   = nbits
+
+_binops = {
+  _ast.Add      : '+',  _ast.Sub      : '-',  _ast.Mult     : '*',
+  _ast.Div      : '//', _ast.FloorDiv : '//', _ast.Mod      : '%',
+  _ast.LShift   : '<<', _ast.RShift   : '>>', _ast.BitAnd   : '&',
+  _ast.BitOr    : '|',  _ast.BitXor   : '^',
+}
+
+_cmpops = {
+  _ast.Eq : '==', _ast.NotEq : '!=', _ast.Lt : '<',
+  _ast.LtE: '<=', _ast.Gt    : '>',  _ast.GtE: '>=',
+}
+
+def _mask( nbits ):
+  return ( 1 << nbits ) - 1
+
+#-----------------------------------------------------------------------
+# _TranslateBatchBlock
+#-----------------------------------------------------------------------
+class _TranslateBatchBlock( ast.NodeVisitor ):
+
+  def __init__( self, model, func, nets, sequential ):
+
+    self.model      = model
+    self.func       = func
+    self.nets       = nets
+    self.sequential = sequential
+    self.closure    = get_closure_dict( func ) if func.func_closure else {}
+    self.globals    = func.func_globals
+
+    self.namespace  = {}     # objects referenced by the generated code
+    self.names      = {}     # id( object ) -> name in namespace
+    self.reads      = {}     # id( array ) -> array
+    self.writes     = {}     # id( array ) -> array
+    self.temps      = {}     # local name -> _Expr describing its value
+    self.loopvars   = set()
+
+    self.lines      = []
+    self.indent     = '  '
+    self.pred       = None
+    self.storing    = False
+    self.ntmps      = 0
+
+  #---------------------------------------------------------------------
+  # helpers
+  #---------------------------------------------------------------------
+
+  def error( self, msg, node ):
+    raise BatchTranslationError( msg, getattr( node, 'lineno', None ) )
+
+  def emit( self, line ):
+    self.lines.append( self.indent + line )
+
+  def tmp( self, prefix ):
+    self.ntmps += 1
+    return '_{}{}'.format( prefix, self.ntmps )
+
+  def bind( self, prefix, obj ):
+    try:
+      return self.names[ id( obj ) ]
+    except KeyError:
+      name = '_{}{}'.format( prefix, len( self.names ) )
+      self.names[ id( obj ) ] = name
+      self.namespace[ name ]  = obj
+      return name
+
+  def array( self, signal, node, write=False ):
+    try:
+      arr = self.nets.array( signal )
+    except KeyError:
+      self.error( 'Signal "{}" of {} bits cannot be simulated in batch '
+                  'mode!'.format( signal.name, signal.nbits ), node )
+    if write:
+      self.writes[ id( arr ) ] = arr
+      if self.sequential:
+        return self.nets.next_array( signal )
+    elif not self.storing:
+      self.reads[ id( arr ) ] = arr
+    return arr
+
+  def translate( self, node ):
+    if not isinstance( node, _ast.FunctionDef ):
+      self.error( 'Expected a function definition!', node )
+    self.stmts( node.body )
+    if not self.lines:
+      self.emit( 'pass' )
+    return self.lines
+
+  def stmts( self, body ):
+    for stmt in body:
+      self.visit( stmt )
+
+  #---------------------------------------------------------------------
+  # value conversions
+  #---------------------------------------------------------------------
+
+  # Convert obj/dyn expressions to their value (int, vec or bool)
+  def value( self, e, node ):
+
+    if e.kind == 'obj':
+      obj = e.obj
+      if isinstance( obj, Signal ):
+        arr = self.array( obj, node )
+        return _Expr( 'vec', self.bind( 'n', arr ), obj.nbits,
+                      dtype=obj.dtype, tgt=_Target( [ obj ] ) )
+      if isinstance( obj, Bits ):
+        return _Expr( 'int', repr( obj.uint() ), obj.nbits, obj=int( obj ) )
+      if isinstance( obj, ( bool, int, long ) ):
+        return _Expr( 'int', repr( int( obj ) ), obj=int( obj ) )
+      self.error( 'Cannot use object of type {} as a value in batch mode!'
+                  .format( type( obj ).__name__ ), node )
+
+    if e.kind == 'dyn':
+      objs = e.obj
+      if all( isinstance( x, Signal ) for x in objs ):
+        arrs  = [ self.array( x, node ) for x in objs ]
+        lst   = self.bind( 'l', arrs )
+        nbits = objs[0].nbits
+        tgt   = _Target( objs, e.idx )
+        if e.idx.kind == 'int':
+          return _Expr( 'vec', '{}[{}]'.format( lst, e.idx.code ), nbits,
+                        dtype=objs[0].dtype, tgt=tgt )
+        return _Expr( 'vec', '_gather({}, {})'.format( lst, e.idx.code ),
+                      nbits, dtype=objs[0].dtype, tgt=tgt )
+      if all( isinstance( x, ( bool, int, long, Bits ) ) for x in objs ):
+        values = [ int( x ) for x in objs ]
+        nbits  = max( x.nbits if isinstance( x, Bits ) else 0 for x in objs )
+        nbits  = nbits or None
+        if e.idx.kind == 'int':
+          return _Expr( 'int', '{}[{}]'.format( self.bind( 't', values ),
+                        e.idx.code ), nbits )
+        table = self.bind( 't', np.array( values, dtype=np.uint64 ) )
+        return _Expr( 'vec', '{}[_u({}).astype(np.intp)]'.format(
+                      table, e.idx.code ), nbits )
+      self.error( 'Cannot index a list of {} in batch mode!'
+                  .format( type( objs[0] ).__name__ ), node )
+
+    return e
+
+  # Value of e as a uint64 array expression (or an int)
+  def as_vec( self, e ):
+    if e.kind == 'bool':
+      return _Expr( 'vec', '({}).astype(np.uint64)'.format( e.code ), 1 )
+    if e.kind == 'int' and e.obj is not None and e.obj < 0:
+      return _Expr( 'int', repr( e.obj % ( 1 << 64 ) ), e.nbits,
+                    obj=e.obj % ( 1 << 64 ) )
+    return e
+
+  # Value of e as a lane condition (bool array) or int
+  def as_cond( self, e ):
+    if e.kind == 'vec':
+      return _Expr( 'bool', '({} != 0)'.format( e.code ), 1 )
+    return e
+
+  # Truncate the value of e to nbits
+  def trunc( self, code, kind, nbits ):
+    if nbits is None or nbits >= 64:
+      return _Expr( kind, code, nbits )
+    return _Expr( kind, '(({}) & {})'.format( code, _mask( nbits ) ), nbits )
+
+  #---------------------------------------------------------------------
+  # statements
+  #---------------------------------------------------------------------
+
+  def visit_Pass( self, node ):
+    self.emit( 'pass' )
+
+  def visit_Assert( self, node ):
+    pass
+
+  def visit_Expr( self, node ):
+    # Docstrings
+    if isinstance( node.value, _ast.Str ):
+      return
+    self.error( 'Expression statements are not supported in batch '
+                'mode!', node )
+
+  def visit_Assign( self, node ):
+    if len( node.targets ) != 1 or \
+       isinstance( node.targets[0], ( _ast.Tuple, _ast.List ) ):
+      self.error( 'Assignments can only have one item on the left-hand '
+                  'side!', node )
+    self.store( node.targets[0], self.visit( node.value ), node )
+
+  def visit_AugAssign( self, node ):
+    binop = ast.BinOp( node.target, node.op, node.value )
+    ast.copy_location( binop, node )
+    self.store( node.target, self.visit_BinOp( binop ), node )
+
+  #---------------------------------------------------------------------
+  # store
+  #---------------------------------------------------------------------
+
+  def store( self, target, e, node ):
+
+    e = self.as_vec( self.value( e, node ) )
+
+    # Local temporaries: lanes which are masked off keep their previous
+    # value (if there was one)
+    if isinstance( target, _ast.Name ) and self.is_local( target.id ):
+      name = 'v_' + target.id
+      if target.id in self.loopvars:
+        self.error( 'Cannot assign to loop variable "{}"!'
+                    .format( target.id ), node )
+      if self.pred is None:
+        self.emit( '{} = {}'.format( name, e.code ) )
+        kind = e.kind
+      else:
+        prev = name if target.id in self.temps else e.code
+        self.emit( '{} = _sel({}, {}, {})'.format( name, self.pred,
+                                                    e.code, prev ) )
+        kind = 'vec'
+      self.temps[ target.id ] = _Expr( kind, name, e.nbits, dtype=e.dtype )
+      return
+
+    # Signals
+    self.storing = True
+    try:
+      t = self.visit( target )
+    finally:
+      self.storing = False
+
+    t = self.value( t, node )
+    if t.tgt is None:
+      self.error( 'Cannot assign to this expression in batch mode!', node )
+
+    tgt   = t.tgt
+    arrs  = [ self.array( x, node, write=True ) for x in tgt.signals ]
+    nbits = tgt.nbits if tgt.nbits is not None else tgt.signals[0].nbits
+    mask  = _mask( nbits )
+    pred  = self.pred or 'None'
+    value = e.code if e.nbits is not None and e.nbits <= nbits \
+            else '({}) & {}'.format( e.code, mask )
+
+    if tgt.idx is None:
+      arr = self.bind( 'n', arrs[0] )
+      if tgt.lo is not None:
+        value = '_insert({}, {}, {}, {})'.format( arr, value, tgt.lo, mask )
+      self.emit( '_store({}, {}, {})'.format( arr, value, pred ) )
+
+    elif tgt.idx.kind == 'int':
+      arr = '{}[{}]'.format( self.bind( 'l', arrs ), tgt.idx.code )
+      if tgt.lo is not None:
+        value = '_insert({}, {}, {}, {})'.format( arr, value, tgt.lo, mask )
+      self.emit( '_store({}, {}, {})'.format( arr, value, pred ) )
+
+    else:
+      lst = self.bind( 'l', arrs )
+      if tgt.lo is None:
+        self.emit( '_scatter({}, {}, {}, {})'.format(
+                   lst, tgt.idx.code, value, pred ) )
+      else:
+        self.emit( '_scatter({}, {}, {}, {}, {}, {})'.format(
+                   lst, tgt.idx.code, value, pred, tgt.lo, mask ) )
+
+  def is_local( self, name ):
+    return ( name in self.temps or name in self.loopvars or
+             ( name not in self.closure and name not in self.globals ) )
+
+  #---------------------------------------------------------------------
+  # visit_If
+  #---------------------------------------------------------------------
+  # Conditions known for all lanes (Python ints) become Python if
+  # statements, lane conditions predicate both branches.
+
+  def visit_If( self, node ):
+
+    cond = self.as_cond( self.value( self.visit( node.test ), node ) )
+
+    if cond.kind == 'int':
+      self.emit( 'if {}:'.format( cond.code ) )
+      self.block( node.body )
+      if node.orelse:
+        self.emit( 'else:' )
+        self.block( node.orelse )
+      return
+
+    c      = self.tmp( 'c' )
+    outer  = self.pred
+    self.emit( '{} = {}'.format( c, cond.code ) )
+
+    for body, test in [ ( node.body, c ), ( node.orelse, '~' + c ) ]:
+      if not body:
+        continue
+      p = self.tmp( 'p' )
+      self.emit( '{} = {}'.format( p, test if outer is None else
+                                   '{} & {}'.format( outer, test ) ) )
+      self.emit( 'if {}.any():'.format( p ) )
+      self.pred = p
+      self.block( body )
+      self.pred = outer
+
+  def block( self, body ):
+    self.indent += '  '
+    n = len( self.lines )
+    self.stmts( body )
+    if len( self.lines ) == n:
+      self.emit( 'pass' )
+    self.indent = self.indent[:-2]
+
+  #---------------------------------------------------------------------
+  # visit_For
+  #---------------------------------------------------------------------
+
+  def visit_For( self, node ):
+
+    if not isinstance( node.target, _ast.Name ):
+      self.error( 'Loop variables must be simple names!', node )
+    if node.orelse:
+      self.error( 'Loops with else clauses are not supported!', node )
+
+    it = node.iter
+    if not ( isinstance( it, _ast.Call ) and isinstance( it.func, _ast.Name )
+             and it.func.id in ( 'range', 'xrange' ) ):
+      self.error( 'Only loops over range() are supported in batch mode!',
+                  node )
+
+    args = [ self.value( self.visit( x ), node ) for x in it.args ]
+    if any( x.kind != 'int' for x in args ):
+      self.error( 'Loop bounds must be the same in all lanes!', node )
+
+    name = node.target.id
+    self.loopvars.add( name )
+    self.emit( 'for v_{} in range({}):'.format( name,
+               ', '.join( x.code for x in args ) ) )
+    self.block( node.body )
+
+  #---------------------------------------------------------------------
+  # unsupported statements
+  #---------------------------------------------------------------------
+
+  def generic_visit( self, node ):
+    self.error( '{} is not supported in batch mode!'
+                .format( type( node ).__name__ ), node )
+
+  #---------------------------------------------------------------------
+  # names and attributes
+  #---------------------------------------------------------------------
+
+  def visit_Name( self, node ):
+
+    name = node.id
+
+    if name in self.loopvars:
+      return _Expr( 'int', 'v_' + name )
+    if name in self.temps:
+      t = self.temps[ name ]
+      return _Expr( t.kind, t.code, t.nbits, dtype=t.dtype )
+    if name in self.closure:
+      return _Expr( 'obj', obj=self.closure[ name ] )
+    if name in self.globals:
+      return _Expr( 'obj', obj=self.globals[ name ] )
+    if name in ( 'True', 'False' ):
+      return _Expr( 'int', name, 1, obj=int( name == 'True' ) )
+    if name in ( 'len', 'int' ):
+      return _Expr( 'obj', obj=getattr( __builtin__, name ) )
+
+    self.error( 'Unknown name "{}"!'.format( name ), node )
+
+  def visit_Attribute( self, node ):
+
+    base = self.visit( node.value )
+    attr = node.attr
+
+    # .value/.next (and .v/.n) just select the signal itself
+    if attr in ( 'value', 'next', 'v', 'n' ) and \
+       self.is_signal_expr( base ):
+      return base
+
+    # Fields of BitStruct signals are bit slices
+    dtype = self.dtype_of( base )
+    if isinstance( dtype, BitStruct ) and attr in dtype._bitfields:
+      value = self.value( base, node )
+      addr  = dtype._bitfields[ attr ]
+      if isinstance( addr, slice ):
+        return self.slice_bits( value, addr.start, addr.stop - addr.start,
+                                node )
+      return self.slice_bits( value, addr, 1, node )
+
+    if base.kind == 'obj':
+      try:
+        return _Expr( 'obj', obj=getattr( base.obj, attr ) )
+      except AttributeError:
+        self.error( 'Unknown attribute "{}"!'.format( attr ), node )
+
+    if base.kind == 'dyn':
+      try:
+        return _Expr( 'dyn', obj=[ getattr( x, attr ) for x in base.obj ],
+                      idx=base.idx )
+      except AttributeError:
+        self.error( 'Unknown attribute "{}"!'.format( attr ), node )
+
+    self.error( 'Unknown attribute "{}"!'.format( attr ), node )
+
+  def dtype_of( self, e ):
+    if e.kind == 'obj' and isinstance( e.obj, Signal ):
+      return e.obj.dtype
+    if e.kind == 'dyn' and e.obj and isinstance( e.obj[0], Signal ):
+      return e.obj[0].dtype
+    return e.dtype
+
+  def is_signal_expr( self, e ):
+    return ( ( e.kind == 'obj' and isinstance( e.obj, Signal ) ) or
+             ( e.kind == 'dyn' and e.obj and
+               isinstance( e.obj[0], Signal ) ) or
+             ( e.kind == 'vec' and e.tgt is not None ) )
+
+  #---------------------------------------------------------------------
+  # visit_Subscript
+  #---------------------------------------------------------------------
+
+  def visit_Subscript( self, node ):
+
+    base = self.visit( node.value )
+
+    # Indexes are always read, even in the target of a store
+    storing, self.storing = self.storing, False
+    try:
+      if isinstance( node.slice, _ast.Index ):
+        idx = self.value( self.visit( node.slice.value ), node )
+        lo = hi = None
+      elif isinstance( node.slice, _ast.Slice ) and not node.slice.step:
+        idx = None
+        lo  = node.slice.lower and self.value( self.visit( node.slice.lower ),
+                                               node )
+        hi  = node.slice.upper and self.value( self.visit( node.slice.upper ),
+                                               node )
+      else:
+        self.error( 'Unsupported subscript!', node )
+    finally:
+      self.storing = storing
+
+    # Indexing lists of objects
+
+    if idx is not None and base.kind in ( 'obj', 'dyn' ) and \
+       isinstance( self.first( base ), ( list, tuple ) ):
+
+      if base.kind == 'obj':
+        if idx.obj is not None:
+          return _Expr( 'obj', obj=base.obj[ idx.obj ] )
+        return _Expr( 'dyn', obj=list( base.obj ), idx=self.as_vec( idx ) )
+
+      # Nested lists indexed at runtime are flattened
+      n = len( base.obj[0] )
+      if any( len( x ) != n for x in base.obj ):
+        self.error( 'Nested lists must have the same length!', node )
+      flat  = [ y for x in base.obj for y in x ]
+      outer = self.as_vec( base.idx )
+      idx   = self.as_vec( idx )
+      kind  = 'int' if outer.kind == idx.kind == 'int' else 'vec'
+      code  = '(({}) * {} + ({}))'.format( outer.code, n, idx.code )
+      return _Expr( 'dyn', obj=flat, idx=_Expr( kind, code ) )
+
+    # Bit slices of values
+
+    value = self.value( base, node )
+
+    if idx is not None:
+      return self.slice_bits( value, idx, 1, node )
+
+    if lo is None:
+      lo = _Expr( 'int', '0', obj=0 )
+    if hi is None:
+      if value.nbits is None:
+        self.error( 'Open slices need a value of known bitwidth!', node )
+      hi = _Expr( 'int', repr( value.nbits ), obj=value.nbits )
+
+    if lo.obj is not None and hi.obj is not None:
+      return self.slice_bits( value, lo, hi.obj - lo.obj, node )
+
+    # Variable part-selects of the form [x:x+N]
+    up = node.slice.upper
+    if isinstance( up, _ast.BinOp ) and isinstance( up.op, _ast.Add ) and \
+       ast.dump( up.left ) == ast.dump( node.slice.lower ):
+      width = self.value( self.visit( up.right ), node )
+      if width.obj is not None:
+        return self.slice_bits( value, lo, width.obj, node )
+
+    self.error( 'Variable slices must be of the form [x:x+N] with a '
+                'constant N!', node )
+
+  def first( self, e ):
+    return e.obj if e.kind == 'obj' else e.obj[0]
+
+  # Select nbits bits starting at lo (an int or an _Expr) from value
+  def slice_bits( self, value, lo, nbits, node ):
+
+    if not isinstance( lo, _Expr ):
+      lo = _Expr( 'int', repr( lo ), obj=lo )
+    lo   = self.as_vec( lo )
+    mask = _mask( nbits )
+
+    # Constant fold
+    if value.kind == 'int' and value.obj is not None and lo.obj is not None:
+      v = ( value.obj >> lo.obj ) & mask
+      return _Expr( 'int', repr( v ), nbits, obj=v )
+
+    if value.kind == 'vec' and lo.kind == 'int':
+      code = '(({} >> {}) & {})'.format( value.code, lo.code, mask )
+    else:
+      code = '_bits({}, {}, {})'.format( value.code, lo.code, mask )
+
+    tgt = None
+    if value.tgt is not None:
+      t = value.tgt
+      if t.lo is None: newlo = lo.code
+      else:            newlo = '({} + {})'.format( t.lo, lo.code )
+      tgt = _Target( t.signals, t.idx, newlo, nbits )
+
+    return _Expr( 'vec', code, nbits, tgt=tgt )
+
+  #---------------------------------------------------------------------
+  # constants
+  #---------------------------------------------------------------------
+
+  def visit_Num( self, node ):
+    return _Expr( 'int', repr( node.n ), obj=node.n )
+
+  #---------------------------------------------------------------------
+  # operators
+  #---------------------------------------------------------------------
+
+  def visit_BinOp( self, node ):
+
+    op = _binops.get( type( node.op ) )
+    if op is None:
+      self.error( 'Unsupported operator!', node )
+
+    l = self.as_vec( self.value( self.visit( node.left  ), node ) )
+    r = self.as_vec( self.value( self.visit( node.right ), node ) )
+
+    # Python ints (parameters, loop variables)
+    if l.kind == r.kind == 'int' and l.nbits is None and r.nbits is None:
+      code = '({} {} {})'.format( l.code, op, r.code )
+      obj  = None
+      if l.obj is not None and r.obj is not None:
+        obj  = eval( code )
+        code = repr( obj )
+      return _Expr( 'int', code, obj=obj )
+
+    # Bitwidth of the result of the equivalent Bits operation
+    widths = [ x.nbits for x in ( l, r ) if x.nbits is not None ]
+    if isinstance( node.op, ( _ast.LShift, _ast.RShift ) ):
+      nbits = l.nbits
+    elif isinstance( node.op, ( _ast.Mult, _ast.Div, _ast.FloorDiv,
+                                _ast.Mod ) ):
+      nbits = 2 * max( widths )
+    elif isinstance( node.op, _ast.Sub ) and l.nbits is None and \
+         l.obj is not None:
+      nbits = max( helpers.get_nbits( l.obj ), r.nbits )
+    else:
+      nbits = max( widths )
+
+    kind = 'int' if l.kind == r.kind == 'int' else 'vec'
+    left = l.code
+    if l.kind == 'int' and r.kind == 'vec':
+      left = '_u({})'.format( l.code )
+
+    return self.trunc( '{} {} {}'.format( left, op, r.code ), kind, nbits )
+
+  def visit_BoolOp( self, node ):
+
+    values = [ self.as_cond( self.value( self.visit( x ), node ) )
+               for x in node.values ]
+
+    if all( x.kind == 'int' for x in values ):
+      op = ' and ' if isinstance( node.op, _ast.And ) else ' or '
+      return _Expr( 'int', '({})'.format( op.join( x.code for x in values ) ) )
+
+    op = ' & ' if isinstance( node.op, _ast.And ) else ' | '
+    codes = [ x.code if x.kind == 'bool' else 'bool({})'.format( x.code )
+              for x in values ]
+    return _Expr( 'bool', '({})'.format( op.join( codes ) ), 1 )
+
+  def visit_UnaryOp( self, node ):
+
+    e = self.value( self.visit( node.operand ), node )
+
+    if isinstance( node.op, _ast.Not ):
+      e = self.as_cond( e )
+      if e.kind == 'int':
+        return _Expr( 'int', '(not {})'.format( e.code ) )
+      return _Expr( 'bool', '(~{})'.format( e.code ), 1 )
+
+    if isinstance( node.op, _ast.UAdd ):
+      return e
+
+    if e.kind == 'int' and e.nbits is None:
+      op = '-' if isinstance( node.op, _ast.USub ) else '~'
+      if e.obj is not None:
+        v = eval( op + repr( e.obj ) )
+        return _Expr( 'int', repr( v ), obj=v )
+      return _Expr( 'int', '({}{})'.format( op, e.code ) )
+
+    e = self.as_vec( e )
+    if e.nbits is None:
+      self.error( 'Cannot negate or invert a value of unknown bitwidth!',
+                  node )
+    if e.kind == 'int':
+      e = _Expr( 'vec', '_u({})'.format( e.code ), e.nbits )
+    op = '-' if isinstance( node.op, _ast.USub ) else '~'
+    return self.trunc( '{}{}'.format( op, e.code ), 'vec', e.nbits )
+
+  def visit_Compare( self, node ):
+
+    if len( node.ops ) != 1:
+      self.error( 'Chained comparisons are not supported!', node )
+
+    op = _cmpops.get( type( node.ops[0] ) )
+    if op is None:
+      self.error( 'Unsupported comparison!', node )
+
+    l = self.as_vec( self.value( self.visit( node.left ), node ) )
+    r = self.as_vec( self.value( self.visit( node.comparators[0] ), node ) )
+    code = '({} {} {})'.format( l.code, op, r.code )
+
+    if l.kind == r.kind == 'int':
+      return _Expr( 'int', code, 1 )
+    return _Expr( 'bool', code, 1 )
+
+  def visit_IfExp( self, node ):
+
+    c = self.as_cond( self.value( self.visit( node.test   ), node ) )
+    a = self.as_vec ( self.value( self.visit( node.body   ), node ) )
+    b = self.as_vec ( self.value( self.visit( node.orelse ), node ) )
+
+    widths = [ x.nbits for x in ( a, b ) if x.nbits is not None ]
+    nbits  = max( widths ) if widths else None
+
+    if c.kind == 'int':
+      kind = 'int' if a.kind == b.kind == 'int' else 'vec'
+      if kind == 'vec':
+        return _Expr( 'vec', '_sel({}, {}, {})'.format(
+                      'np.bool_({})'.format( c.code ), a.code, b.code ), nbits )
+      return _Expr( 'int', '({} if {} else {})'.format(
+                    a.code, c.code, b.code ), nbits )
+
+    return _Expr( 'vec', '_sel({}, {}, {})'.format( c.code, a.code, b.code ),
+                  nbits )
+
+  #---------------------------------------------------------------------
+  # visit_Call
+  #---------------------------------------------------------------------
+
+  def visit_Call( self, node ):
+
+    if node.keywords or node.starargs or node.kwargs:
+      self.error( 'Only positional arguments are supported!', node )
+
+    func = self.visit( node.func )
+    if func.kind != 'obj':
+      self.error( 'Unsupported function call!', node )
+    func = func.obj
+
+    if func is len:
+      n = len( self.value_obj( node.args[0] ) )
+      return _Expr( 'int', repr( n ), obj=n )
+
+    args = [ self.as_vec( self.value( self.visit( x ), node ) )
+             for x in node.args ]
+
+    def const( e ):
+      if e.obj is None:
+        self.error( 'Expected a constant argument!', node )
+      return e.obj
+
+    if func is Bits:
+      nbits = const( args[0] )
+      if len( args ) == 1:
+        return _Expr( 'int', '0', nbits, obj=0 )
+      v = args[1]
+      if v.obj is not None:
+        return _Expr( 'int', repr( v.obj & _mask( nbits ) ), nbits,
+                      obj=v.obj & _mask( nbits ) )
+      return self.trunc( v.code, v.kind, nbits )
+
+    if func is helpers.concat:
+      if any( x.nbits is None for x in args ):
+        self.error( 'concat() needs values of known bitwidth!', node )
+      nbits = sum( x.nbits for x in args )
+      terms, shamt = [], nbits
+      for x in args:
+        shamt -= x.nbits
+        code   = x.code if x.kind == 'vec' else '_u({})'.format( x.code )
+        terms.append( '({} << {})'.format( code, shamt ) if shamt else code )
+      return _Expr( 'vec', '({})'.format( ' | '.join( terms ) ), nbits )
+
+    if func is helpers.zext:
+      return _Expr( args[0].kind, args[0].code, const( args[1] ) )
+
+    if func is helpers.sext:
+      if args[0].nbits is None:
+        self.error( 'sext() needs a value of known bitwidth!', node )
+      return _Expr( 'vec', '_sext({}, {}, {})'.format(
+                    args[0].code, args[0].nbits, const( args[1] ) ),
+                    const( args[1] ) )
+
+    if func in ( helpers.reduce_and, helpers.reduce_or, helpers.reduce_xor ):
+      x = args[0]
+      if x.nbits is None:
+        self.error( 'Reductions need a value of known bitwidth!', node )
+      if func is helpers.reduce_and:
+        return _Expr( 'bool', '({} == {})'.format( x.code, _mask( x.nbits ) ),
+                      1 )
+      if func is helpers.reduce_or:
+        return _Expr( 'bool', '({} != 0)'.format( x.code ), 1 )
+      return _Expr( 'vec', '_parity({})'.format( x.code ), 1 )
+
+    if func is int:
+      return args[0]
+
+    self.error( 'Function "{}" is not supported in batch mode!'
+                .format( getattr( func, '__name__', func ) ), node )
+
+  def value_obj( self, node ):
+    e = self.visit( node )
+    if e.kind != 'obj':
+      self.error( 'Expected an object known at elaboration time!', node )
+    return e.obj
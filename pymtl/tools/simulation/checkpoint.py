@@ -0,0 +1,469 @@
+#=======================================================================
+# checkpoint.py
+#=======================================================================
+# Saving and restoring the complete state of a SimulationTool, used by
+# SimulationTool.checkpoint() and SimulationTool.restore().
+#
+# A checkpoint contains:
+#
+# - the current and next value of every net,
+# - the registers with pending .next writes (the register queue),
+# - the cycle count,
+# - the active level of every SwappableModel,
+# - the Python-side state of every model in the hierarchy, i.e., the
+#   values of its attributes which are not part of the structure of the
+#   design (ports, wires, submodules, methods, ...), including private
+#   attributes other than those owned by PyMTL itself. Containers
+#   such as lists, dicts, deques, bytearrays and plain helper objects
+#   (e.g., the adapters of TestMemory) are captured recursively, and
+#   random.Random generators are captured with their internal state.
+#   State kept outside of Python (e.g., in verilated models) cannot be
+#   captured.
+#
+# A checkpoint is restored into a freshly constructed simulator of the
+# same design, which makes it possible to simulate a warm-up once and
+# fork many runs from it (e.g., in the workers of a process pool).
+# Containers are restored in place, so any other references to them
+# (including references held by closures) remain valid. The saved levels
+# of SwappableModels are activated like by sim.swap(), but without
+# transferring any state. Combinational blocks are all re-evaluated on
+# the next call to eval_combinational() or cycle() after a restore
+# (except for those of inactive implementations of SwappableModels).
+#
+# File format: an 8 byte magic string, the length of the pickled header
+# as a little-endian 64-bit integer, the header itself, and finally the
+# raw contents of all captured bytearrays. Bytearrays are written as is
+# and read straight into the existing buffers of the model (readinto),
+# so large memories are never copied through intermediate strings.
+
+import io
+import struct
+import random
+import hashlib
+import cPickle as pickle
+
+from array       import array
+from collections import deque
+from types       import FunctionType, MethodType, BuiltinFunctionType, \
+                        ModuleType
+
+from pymtl                    import PyMTLError
+from pymtl.model.Model        import Model
+from pymtl.model.signals      import Signal
+from pymtl.model.PortBundle   import PortBundle
+from pymtl.datatypes.Bits     import Bits, BitSlice
+from pymtl.datatypes.BitStruct import find_bitstruct_class
+from swapping                 import get_swappable_models, \
+                                     get_inactive_models
+
+_MAGIC   = 'PYMTLCKP'
+_VERSION = 3
+
+# Model attributes which are owned by PyMTL: set up by the model, by
+# elaboration or by SwappableModel (the active level is saved
+# separately). All other attributes are captured.
+
+_model_skip = set([
+  'name', 'parent', 'class_name', '_args', '_auto_connects',
+  '_combinational_blocks', '_connections', '_hports', '_inports',
+  '_line_trace_en', '_model_classes', '_newsenses', '_outports',
+  '_posedge_clk_blocks', '_submodules', '_tick_blocks', '_wires',
+  '_levels', '_routes', '_active',
+])
+
+#-----------------------------------------------------------------------
+# Snapshot Values
+#-----------------------------------------------------------------------
+# Picklable stand-ins for values which cannot (or should not) be
+# pickled directly.
+
+class _Keep( object ):
+  """Structural references which are left untouched on restore."""
+  def __reduce__( self ):
+    return ( _get_keep, () )
+
+_KEEP = _Keep()
+
+def _get_keep():
+  return _KEEP
+
+class _NetRef( tuple ):
+  """Reference to the SignalValue of a net, by net index."""
+
+class _BitsValue( tuple ):
+  """Bits or BitStruct value: ( class key, nbits, uint )."""
+
+class _Blob( tuple ):
+  """bytearray stored in the blob section: ( offset, nbytes )."""
+
+class _Deque( tuple ):
+  """deque: ( maxlen, items )."""
+
+class _RandomState( tuple ):
+  """random.Random generator: ( internal state, )."""
+
+class _Object( dict ):
+  """Plain object, maps attribute names to snapshots."""
+
+#-----------------------------------------------------------------------
+# get_bits_class_key
+#-----------------------------------------------------------------------
+# Key identifying the class of a Bits value across processes: None for
+# Bits (and slices, which are restored as Bits), otherwise the module of
+# the class (of the BitStruct definition, for BitStruct classes) and the
+# class name.
+
+def get_bits_class_key( cls ):
+  if cls is Bits or cls is BitSlice:
+    return None
+  definition = getattr( cls, '_definition', cls )
+  return ( definition.__module__, cls.__name__ )
+
+#-----------------------------------------------------------------------
+# get_models
+#-----------------------------------------------------------------------
+# All models of the hierarchy in depth-first order, paired with their
+# hierarchical path (e.g., 'top.mem.resps_q').
+def get_models( model, path='top' ):
+  models = [ ( path, model ) ]
+  for sub in model.get_submodules():
+    models.extend( get_models( sub, path + '.' + sub.name ) )
+  return models
+
+#-----------------------------------------------------------------------
+# get_sorted_nets
+#-----------------------------------------------------------------------
+# Order the nets of a simulator by the smallest hierarchical name of the
+# signals they contain. Unlike the order produced by signals_to_nets,
+# this order is the same for every simulator of the same design. The
+# digest of all names identifies the design.
+def get_sorted_nets( sim, models ):
+
+  paths = dict( ( id( m ), path ) for path, m in models )
+  def name( x ):
+    if x.parent is None:
+      return x.name
+    return paths[ id( x.parent ) ] + '.' + x.name
+
+  keyed  = sorted( ( min( name( x ) for x in net ), net )
+                   for net in sim._nets )
+  names  = [ '{}:{}'.format( k, next( iter( net ) ).nbits )
+             for k, net in keyed ]
+  values = [ next( iter( net ) )._signalvalue for k, net in keyed ]
+  digest = hashlib.sha1( '\n'.join( names ) ).hexdigest()
+  return values, digest
+
+#-----------------------------------------------------------------------
+# _Snapshotter
+#-----------------------------------------------------------------------
+class _Snapshotter( object ):
+
+  def __init__( self, net_ids ):
+    self.net_ids = net_ids
+    self.blobs   = []
+    self.offset  = 0
+
+  def snapshot( self, value ):
+
+    if value is None or isinstance( value, ( bool, int, long, float,
+                                             basestring ) ):
+      return value
+
+    if id( value ) in self.net_ids:
+      return _NetRef( ( self.net_ids[ id( value ) ], ) )
+
+    if isinstance( value, ( Model, Signal, PortBundle, type, ModuleType,
+                            FunctionType, MethodType, BuiltinFunctionType ) ):
+      return _KEEP
+
+    if isinstance( value, Bits ):
+      return _BitsValue( ( get_bits_class_key( type( value ) ), value.nbits,
+                           int( value ) ) )
+
+    if isinstance( value, bytearray ):
+      blob = _Blob( ( self.offset, len( value ) ) )
+      self.blobs.append( value )
+      self.offset += len( value )
+      return blob
+
+    if isinstance( value, deque ):
+      return _Deque( ( value.maxlen, [ self.snapshot( x ) for x in value ] ) )
+
+    # Lists and tuples of ports, submodules, etc. are structural too
+
+    if isinstance( value, ( list, tuple ) ):
+      snaps = [ self.snapshot( x ) for x in value ]
+      if snaps and all( x is _KEEP or isinstance( x, _NetRef )
+                        for x in snaps ):
+        return _KEEP
+      return snaps if isinstance( value, list ) else tuple( snaps )
+
+    if isinstance( value, dict ):
+      return dict( ( k, self.snapshot( v ) ) for k, v in value.items() )
+
+    if isinstance( value, random.Random ):
+      return _RandomState( ( value.getstate(), ) )
+
+    if hasattr( value, '__dict__' ):
+      return _Object( ( k, self.snapshot( v ) )
+                      for k, v in vars( value ).items() )
+
+    return value
+
+#-----------------------------------------------------------------------
+# _Restorer
+#-----------------------------------------------------------------------
+class _Restorer( object ):
+
+  def __init__( self, nets, bits_classes, fp, blob_start ):
+    self.nets         = nets
+    self.bits_classes = bits_classes
+    self.fp           = fp
+    self.blob_start   = blob_start
+
+  # Return the restored value of snap, reusing (and updating in place)
+  # the current value where possible.
+
+  def restore( self, current, snap ):
+
+    if snap is _KEEP:
+      return current
+
+    if isinstance( snap, _NetRef ):
+      return self.nets[ snap[0] ]
+
+    if isinstance( snap, _BitsValue ):
+      key, nbits, value = snap
+      if key is None:
+        return Bits( nbits, value )
+      cls = self.bits_classes.get( key ) or find_bitstruct_class( *key )
+      if cls is None or getattr( cls, '_nbits', nbits ) != nbits:
+        raise PyMTLError( "Cannot restore a value of class {1} (from "
+                          "module {0}), the class is not used by the "
+                          "simulated design!".format( *key ) )
+      return cls( nbits, value )
+
+    if isinstance( snap, _Blob ):
+      offset, nbytes = snap
+      if not isinstance( current, bytearray ):
+        current = bytearray( nbytes )
+      elif len( current ) != nbytes:
+        current[:] = bytearray( nbytes )
+      self.fp.seek( self.blob_start + offset )
+      if self.fp.readinto( current ) != nbytes:
+        raise PyMTLError( "Checkpoint file is truncated!" )
+      return current
+
+    if isinstance( snap, _RandomState ):
+      if not isinstance( current, random.Random ):
+        current = random.Random()
+      current.setstate( snap[0] )
+      return current
+
+    if isinstance( snap, _Deque ):
+      maxlen, items = snap
+      items = [ self.restore( None, x ) for x in items ]
+      if isinstance( current, deque ) and current.maxlen == maxlen:
+        current.clear()
+        current.extend( items )
+        return current
+      return deque( items, maxlen )
+
+    if isinstance( snap, list ):
+      if isinstance( current, list ) and len( current ) == len( snap ):
+        for i, x in enumerate( snap ):
+          current[i] = self.restore( current[i], x )
+        return current
+      return [ self.restore( None, x ) for x in snap ]
+
+    if isinstance( snap, tuple ):
+      if not isinstance( current, tuple ) or len( current ) != len( snap ):
+        current = ( None, ) * len( snap )
+      return tuple( self.restore( c, x ) for c, x in zip( current, snap ) )
+
+    if isinstance( snap, _Object ):
+      if current is None or not hasattr( current, '__dict__' ):
+        raise PyMTLError( "Cannot restore an object which does not exist "
+                          "in the simulated model!" )
+      self.restore_attrs( current, snap )
+      return current
+
+    if isinstance( snap, dict ):
+      if not isinstance( current, dict ):
+        current = {}
+      restored = dict( ( k, self.restore( current.get( k ), v ) )
+                       for k, v in snap.items() )
+      current.clear()
+      current.update( restored )
+      return current
+
+    return snap
+
+  def restore_attrs( self, obj, snaps ):
+    for name in sorted( snaps ):
+      value = self.restore( getattr( obj, name, None ), snaps[ name ] )
+      if value is not getattr( obj, name, None ):
+        setattr( obj, name, value )
+
+#-----------------------------------------------------------------------
+# _get_net_value / _set_net_value
+#-----------------------------------------------------------------------
+# Nets which fit in a C unsigned long are stored as raw unsigned
+# integers, wider nets and non-Bits SignalValues are stored as arbitrary
+# Python values.
+
+_narrow_nbits = array( 'L' ).itemsize * 8
+
+def _get_net_value( svalue ):
+  if isinstance( svalue, Bits ):
+    return int( svalue._uint )
+  return svalue._data
+
+def _set_net_value( svalue, value ):
+  if isinstance( svalue, Bits ):
+    svalue._uint = value
+  else:
+    svalue._data = value
+
+#-----------------------------------------------------------------------
+# save_checkpoint
+#-----------------------------------------------------------------------
+def save_checkpoint( sim, path ):
+
+  models       = get_models( sim.model )
+  nets, digest = get_sorted_nets( sim, models )
+  net_ids      = dict( ( id( x ), i ) for i, x in enumerate( nets ) )
+
+  # Net values, narrow values are packed into arrays of unsigned longs
+
+  narrow = array( 'L' ), array( 'L' )
+  wide   = {}
+  for i, svalue in enumerate( nets ):
+    values = _get_net_value( svalue ), _get_net_value( svalue._next )
+    if isinstance( svalue, Bits ) and svalue.nbits <= _narrow_nbits:
+      narrow[0].append( values[0] )
+      narrow[1].append( values[1] )
+    else:
+      wide[ i ] = values
+
+  # Python-side model state
+
+  snapshotter = _Snapshotter( net_ids )
+  states      = []
+  for name, m in models:
+    attrs = {}
+    for attr, value in vars( m ).items():
+      if attr in _model_skip or id( value ) in net_ids:
+        continue
+      snap = snapshotter.snapshot( value )
+      if snap is not _KEEP:
+        attrs[ attr ] = snap
+    states.append( ( name, attrs ) )
+
+  header = {
+    'version'   : _VERSION,
+    'model'     : type( sim.model ).__name__,
+    'nets'      : digest,
+    'ncycles'   : sim.ncycles,
+    'narrow'    : ( narrow[0].tostring(), narrow[1].tostring() ),
+    'itemsize'  : narrow[0].itemsize,
+    'wide'      : wide,
+    'registers' : [ net_ids[ id( x ) ] for x in sim._register_queue ],
+    'levels'    : [ x.level for x in get_swappable_models( sim.model ) ],
+    'models'    : states,
+  }
+
+  try:
+    data = pickle.dumps( header, pickle.HIGHEST_PROTOCOL )
+  except ( pickle.PicklingError, TypeError ) as e:
+    raise PyMTLError( "Cannot checkpoint the state of {}: {}"
+                      "".format( type( sim.model ).__name__, e ) )
+
+  with io.open( path, 'wb' ) as fp:
+    fp.write( _MAGIC )
+    fp.write( struct.pack( '<Q', len( data ) ) )
+    fp.write( data )
+    for blob in snapshotter.blobs:
+      fp.write( blob )
+
+#-----------------------------------------------------------------------
+# load_checkpoint
+#-----------------------------------------------------------------------
+def load_checkpoint( sim, path ):
+
+  models       = get_models( sim.model )
+  nets, digest = get_sorted_nets( sim, models )
+
+  with io.open( path, 'rb' ) as fp:
+
+    if fp.read( len( _MAGIC ) ) != _MAGIC:
+      raise PyMTLError( "{} is not a simulator checkpoint!".format( path ) )
+
+    nbytes, = struct.unpack( '<Q', fp.read( 8 ) )
+    header  = pickle.loads( fp.read( nbytes ) )
+
+    if header['version'] != _VERSION:
+      raise PyMTLError( "Unsupported checkpoint version {}!"
+                        "".format( header['version'] ) )
+
+    if header['itemsize'] != array( 'L' ).itemsize:
+      raise PyMTLError( "Checkpoint was saved on a platform with a "
+                        "different word size!" )
+
+    if header['model'] != type( sim.model ).__name__ or \
+       header['nets'] != digest or \
+       [ p for p, m in models ] != [ p for p, attrs in header['models'] ]:
+      raise PyMTLError( "Checkpoint of {} does not match the simulated "
+                        "model {}!".format( header['model'],
+                                            type( sim.model ).__name__ ) )
+
+    # Active implementations of SwappableModels, activated first since
+    # this writes the outputs of the newly active implementations
+
+    for swappable, level in zip( get_swappable_models( sim.model ),
+                                 header['levels'] ):
+      sim._set_level( swappable, level )
+
+    # Net values
+
+    narrow = array( 'L' ), array( 'L' )
+    narrow[0].fromstring( header['narrow'][0] )
+    narrow[1].fromstring( header['narrow'][1] )
+    wide   = header['wide']
+
+    j = 0
+    for i, svalue in enumerate( nets ):
+      if i in wide:
+        values = wide[ i ]
+      else:
+        values = narrow[0][j], narrow[1][j]
+        j += 1
+      _set_net_value( svalue,       values[0] )
+      _set_net_value( svalue._next, values[1] )
+
+    # Python-side model state, BitStruct values are recreated using the
+    # dtypes of the model, or the BitStruct classes created so far
+
+    bits_classes = {}
+    for svalue in nets:
+      if isinstance( svalue, Bits ):
+        cls = getattr( svalue, '_base_cls', None ) or type( svalue )
+        bits_classes[ get_bits_class_key( cls ) ] = cls
+
+    restorer = _Restorer( nets, bits_classes, fp, len( _MAGIC ) + 8 + nbytes )
+    for ( name, m ), ( _, attrs ) in zip( models, header['models'] ):
+      restorer.restore_attrs( m, attrs )
+
+  # Simulator state, the register queue is updated in place as it may be
+  # bound by a compiled cycle function
+
+  sim.ncycles = header['ncycles']
+  sim._register_queue[:] = [ nets[ i ] for i in header['registers'] ]
+
+  # Re-evaluate all enabled combinational blocks
+
+  disabled = set( func for m in get_inactive_models( sim.model )
+                  for func in m._newsenses )
+  for func in sim._comb_blocks:
+    if func not in disabled:
+      sim._event_queue.enq( func.cb, func.id )
@@ -0,0 +1,239 @@
+#=======================================================================
+# checkpoint_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl      import *
+from pymtl      import PyMTLError
+from pclib.test import TestSource, TestSink, TestMemory
+from pclib.ifcs import MemMsg4B
+from pclib.rtl  import RegRst
+
+from pymtl.datatypes.BitStruct import clear_bitstruct_cache
+
+#-----------------------------------------------------------------------
+# TestHarness
+#-----------------------------------------------------------------------
+# Source -> TestMemory -> sink, with random source/sink delays and random
+# memory stalls so that the Python-side state (random generators, queues,
+# message indices and the memory itself) matters.
+class TestHarness( Model ):
+
+  def __init__( s, src_msgs, sink_msgs ):
+
+    mem_msgs = MemMsg4B()
+
+    s.src  = TestSource( mem_msgs.req,  src_msgs,  3 )
+    s.mem  = TestMemory( mem_msgs, 1, 0.3, 2, mem_nbytes=2**16 )
+    s.sink = TestSink  ( mem_msgs.resp, sink_msgs, 3 )
+    s.reg  = RegRst( 8 )
+
+    s.connect( s.src.out,  s.mem.reqs[0]  )
+    s.connect( s.sink.in_, s.mem.resps[0] )
+
+    @s.combinational
+    def comb():
+      s.reg.in_.value = s.reg.out + 1
+
+  def done( s ):
+    return s.src.done and s.sink.done
+
+  def line_trace( s ):
+    return "{} {} {} {}".format( s.src.line_trace(), s.mem.line_trace(),
+                                 s.sink.line_trace(), s.reg.out )
+
+def mk_harness():
+
+  mem_msgs = MemMsg4B()
+
+  src_msgs, sink_msgs = [], []
+  for i in range( 16 ):
+    src_msgs.extend([
+      mem_msgs.req .mk_wr( i, 0x100+4*i, 0, i*3 ),
+      mem_msgs.req .mk_rd( i, 0x100+4*i, 0 ),
+    ])
+    sink_msgs.extend([
+      mem_msgs.resp.mk_wr( i, 0 ),
+      mem_msgs.resp.mk_rd( i, 0, i*3 ),
+    ])
+
+  model = TestHarness( src_msgs, sink_msgs )
+  model.vcd_file = ''
+  model.elaborate()
+  return model
+
+def run_to_end( sim, model ):
+  traces = []
+  while not model.done() and sim.ncycles < 1000:
+    sim.cycle()
+    traces.append( model.line_trace() )
+  assert model.done()
+  return traces
+
+#-----------------------------------------------------------------------
+# test_checkpoint_restore
+#-----------------------------------------------------------------------
+@pytest.mark.parametrize( 'sched,storage', [
+  ( 'event',    'object' ),
+  ( 'static',   'object' ),
+  ( 'compiled', 'array'  ),
+])
+def test_checkpoint_restore( tmpdir, sched, storage ):
+
+  path = str( tmpdir.join( 'warm.ckpt' ) )
+
+  model = mk_harness()
+  sim   = SimulationTool( model, sched=sched, storage=storage )
+  sim.reset()
+  for i in range( 25 ):
+    sim.cycle()
+  sim.checkpoint( path )
+  expected = run_to_end( sim, model )
+  assert len( expected ) > 10
+
+  # Restore into several fresh simulators, each must continue exactly
+  # like the original one
+
+  for i in range( 2 ):
+    model2 = mk_harness()
+    sim2   = SimulationTool( model2, sched=sched, storage=storage )
+    mem    = model2.mem.mem
+    sim2.restore( path )
+    assert sim2.ncycles == 27
+    assert model2.mem.mem is mem
+    assert run_to_end( sim2, model2 ) == expected
+    assert sim2.ncycles == sim.ncycles
+    assert model2.mem.mem == model.mem.mem
+
+#-----------------------------------------------------------------------
+# test_restore_rewinds
+#-----------------------------------------------------------------------
+# Restoring into the simulator the checkpoint was taken from rewinds it.
+def test_restore_rewinds( tmpdir ):
+
+  path = str( tmpdir.join( 'warm.ckpt' ) )
+
+  model = mk_harness()
+  sim   = SimulationTool( model )
+  sim.reset()
+  sim.checkpoint( path )
+  expected = run_to_end( sim, model )
+
+  sim.restore( path )
+  assert run_to_end( sim, model ) == expected
+
+#-----------------------------------------------------------------------
+# test_private_state
+#-----------------------------------------------------------------------
+# State kept in private attributes of user models is captured too.
+class PrivateCounter( Model ):
+
+  def __init__( s ):
+    s.out     = OutPort( 8 )
+    s._count  = 0
+    s._counts = []
+
+    @s.tick
+    def tick():
+      s._count += 1
+      s._counts.append( s._count )
+      s.out.next = s._count
+
+def test_private_state( tmpdir ):
+
+  path = str( tmpdir.join( 'counter.ckpt' ) )
+
+  model = PrivateCounter()
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  for i in range( 3 ):
+    sim.cycle()
+  sim.checkpoint( path )
+
+  model2 = PrivateCounter()
+  model2.elaborate()
+  sim2 = SimulationTool( model2 )
+  sim2.restore( path )
+  assert model2._count  == 5
+  assert model2._counts == [ 1, 2, 3, 4, 5 ]
+
+  sim2.cycle()
+  assert model2.out == 6
+
+#-----------------------------------------------------------------------
+# test_bitstruct_state
+#-----------------------------------------------------------------------
+# BitStruct values kept in Python state are restored with their class,
+# even if it is not the dtype of any net.
+class PointMsg( BitStructDefinition ):
+
+  def __init__( s, nbits ):
+    s.x = BitField( nbits )
+    s.y = BitField( nbits )
+
+class PointState( Model ):
+
+  def __init__( s ):
+    s.out   = OutPort( 8 )
+    s.point = PointMsg( 8 )
+    s.small = None
+
+    @s.tick
+    def tick():
+      s.point.x = s.point.x + 1
+      s.small   = PointMsg( 4 )
+      s.out.next = s.point.x
+
+def test_bitstruct_state( tmpdir ):
+
+  path = str( tmpdir.join( 'point.ckpt' ) )
+
+  model = PointState()
+  model.elaborate()
+  sim = SimulationTool( model )
+  for i in range( 3 ):
+    sim.cycle()
+  sim.checkpoint( path )
+
+  model2 = PointState()
+  model2.elaborate()
+  SimulationTool( model2 ).restore( path )
+  assert type( model2.point ) is type( model.point )
+  assert model2.point.x == 3
+  assert type( model2.small ) is type( model.small )
+
+  # The class of small is only created by the tick, a design which has
+  # not simulated any cycle yet cannot resolve it
+
+  clear_bitstruct_cache()
+  model3 = PointState()
+  model3.elaborate()
+  with pytest.raises( PyMTLError ):
+    SimulationTool( model3 ).restore( path )
+
+#-----------------------------------------------------------------------
+# test_restore_mismatch
+#-----------------------------------------------------------------------
+def test_restore_mismatch( tmpdir ):
+
+  path = str( tmpdir.join( 'reg.ckpt' ) )
+
+  model = RegRst( 8 )
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  sim.checkpoint( path )
+
+  model = RegRst( 16 )
+  model.elaborate()
+  with pytest.raises( PyMTLError ):
+    SimulationTool( model ).restore( path )
+
+  with pytest.raises( PyMTLError ):
+    SimulationTool( mk_harness() ).restore( path )
+
+  tmpdir.join( 'bad.ckpt' ).write( 'not a checkpoint' )
+  with pytest.raises( PyMTLError ):
+    sim.restore( str( tmpdir.join( 'bad.ckpt' ) ) )
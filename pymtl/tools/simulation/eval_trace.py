@@ -0,0 +1,204 @@
+#=======================================================================
+# eval_trace.py
+#=======================================================================
+# Analysis of combinational block evaluations. When a simulator is
+# created with trace_evals=True, its metrics additionally record why
+# each combinational block (or slice callback) was evaluated: which
+# signal write put it on the event queue, and which block performed
+# that write. This reveals
+#
+# - blocks evaluated more than once per cycle (glitches), along with
+#   the signal writes that caused the re-evaluations, and
+# - signals whose writes trigger many callbacks (fan-out storms).
+#
+#   sim = SimulationTool( model, trace_evals=True )
+#   ...
+#   sim.metrics.print_offenders()
+#   for writer, signal, block in sim.metrics.get_cycle_trace( 42 ):
+#     print( writer, '->', signal, '->', block )
+#
+# Like all metrics, the trace is only collected by the dev (non -O)
+# cycle. Blocks and signals are named by their hierarchical path. Writes not
+# performed by a combinational block are attributed to '<input>' (before
+# the clock edge, e.g. test harness inputs) or '<clock>' (sequential
+# blocks and register updates).
+
+from __future__ import print_function
+
+import collections
+
+from SimulationMetrics import SimulationMetrics
+from profiler          import get_model_paths, get_block_path
+
+#-----------------------------------------------------------------------
+# EvalTraceMetrics
+#-----------------------------------------------------------------------
+# SimulationMetrics which additionally trace combinational evaluations.
+# The trigger chains of the last trace_cycles cycles are kept, counts
+# are accumulated over the whole simulation.
+class EvalTraceMetrics( SimulationMetrics ):
+
+  def __init__( self, sim, trace_cycles = 16 ):
+
+    super( EvalTraceMetrics, self ).__init__()
+
+    self._sim          = sim
+    self._names        = None
+
+    self.traces        = collections.OrderedDict()
+    self.trace_cycles  = trace_cycles
+    self._trace        = []
+
+    # Signals (Bits compare by value) are identified by their id
+
+    self._pending      = {}   # block -> ( writer, signal ) which enqueued it
+    self._writer       = None
+    self._signal       = None
+    self._cycle_evals  = collections.Counter()
+
+    self.block_evals   = collections.Counter()
+    self.block_redun   = collections.Counter()
+    self.signal_events = collections.Counter()
+    self.signal_callbk = collections.Counter()
+    self.signal_fanout = {}
+    self.redun_triggers = collections.Counter()
+
+  #---------------------------------------------------------------------
+  # Metrics Hooks
+  #---------------------------------------------------------------------
+
+  def _get_writer( self ):
+    func = self._sim._current_func
+    if func is not None:
+      return func
+    return '<input>' if self._pre_tick else '<clock>'
+
+  def incr_add_events( self, svalue = None ):
+    super( EvalTraceMetrics, self ).incr_add_events()
+    signal  = id( svalue )
+    nfanout = len( svalue._callbacks )
+    self.signal_events[ signal ] += 1
+    self.signal_callbk[ signal ] += nfanout
+    self.signal_fanout[ signal ]  = max( nfanout,
+                                         self.signal_fanout.get( signal, 0 ) )
+    self._writer = self._get_writer()
+    self._signal = signal
+
+  def incr_add_callbk( self, func = None ):
+    super( EvalTraceMetrics, self ).incr_add_callbk()
+    if func is not self._sim._current_func and func not in self._pending:
+      self._pending[ func ] = ( self._writer, self._signal )
+
+  def incr_comb_evals( self, eval ):
+    super( EvalTraceMetrics, self ).incr_comb_evals( eval )
+
+    writer, signal = self._pending.pop( eval, ( '<init>', None ) )
+    self._trace.append( ( writer, signal, eval ) )
+
+    self._cycle_evals[ eval ] += 1
+    self.block_evals [ eval ] += 1
+    if self._cycle_evals[ eval ] > 1:
+      self.block_redun   [ eval ] += 1
+      self.redun_triggers[ ( writer, signal, eval ) ] += 1
+
+  def incr_metrics_cycle( self ):
+    self.traces[ self._ncycles ] = self._trace
+    if len( self.traces ) > self.trace_cycles:
+      self.traces.popitem( last=False )
+    self._trace = []
+    self._cycle_evals.clear()
+    super( EvalTraceMetrics, self ).incr_metrics_cycle()
+
+  #---------------------------------------------------------------------
+  # Names
+  #---------------------------------------------------------------------
+  # Hierarchical names of blocks, and of signals (the smallest name of
+  # all signals in a net).
+
+  def _init_names( self ):
+
+    paths = get_model_paths( self._sim.model )
+    def signal_name( x ):
+      if x.parent is None:
+        return x.name
+      return paths[ x.parent ] + '.' + x.name
+
+    self._paths = paths
+    self._names = dict( ( id( next( iter( net ) )._signalvalue ),
+                          min( signal_name( x ) for x in net ) )
+                        for net in self._sim._nets )
+
+  def block_name( self, func ):
+    if isinstance( func, str ):
+      return func
+    if self._names is None:
+      self._init_names()
+    return get_block_path( self._paths, func )
+
+  def signal_name( self, signal ):
+    if signal is None:
+      return None
+    if self._names is None:
+      self._init_names()
+    return self._names[ signal ]
+
+  #---------------------------------------------------------------------
+  # get_cycle_trace
+  #---------------------------------------------------------------------
+  # Return the ( writer, signal, block ) trigger chain of all
+  # evaluations in the given (recorded) cycle, in evaluation order.
+  def get_cycle_trace( self, cycle ):
+    return [ ( self.block_name( w ), self.signal_name( s ),
+               self.block_name( b ) ) for w, s, b in self.traces[ cycle ] ]
+
+  #---------------------------------------------------------------------
+  # Offender Reports
+  #---------------------------------------------------------------------
+  # Lists of the most costly blocks, signals and triggers, sorted by the
+  # number of redundant evaluations or callbacks.
+
+  def redundant_blocks( self ):
+    return sorted( ( ( self.block_name( b ), self.block_evals[ b ], n )
+                     for b, n in self.block_redun.items() ),
+                   key=lambda x: ( -x[2], x[0] ) )
+
+  def fanout_signals( self ):
+    return sorted( ( ( self.signal_name( s ), self.signal_events[ s ], n,
+                       self.signal_fanout[ s ] )
+                     for s, n in self.signal_callbk.items() if n ),
+                   key=lambda x: ( -x[2], x[0] ) )
+
+  def redundant_triggers( self ):
+    return sorted( ( ( self.block_name( w ), self.signal_name( s ),
+                       self.block_name( b ), n )
+                     for ( w, s, b ), n in self.redun_triggers.items() ),
+                   key=lambda x: ( -x[3], x[:3] ) )
+
+  #---------------------------------------------------------------------
+  # print_offenders
+  #---------------------------------------------------------------------
+  # Print the n most costly offenders of each kind to the commandline.
+  def print_offenders( self, n = 10 ):
+
+    print("-"*72)
+    print("Combinational Evaluation Offenders")
+    print("-"*72)
+    print()
+    print("blocks evaluated more than once per cycle:")
+    print()
+    print("   evals   redun  block")
+    for name, evals, redun in self.redundant_blocks()[:n]:
+      print("{:8}{:8}  {}".format( evals, redun, name ))
+    print()
+    print("signal writes triggering redundant evaluations:")
+    print()
+    print("   redun  writer -> signal -> block")
+    for writer, signal, block, redun in self.redundant_triggers()[:n]:
+      print("{:8}  {} -> {} -> {}".format( redun, writer, signal, block ))
+    print()
+    print("signals with the most callbacks:")
+    print()
+    print("  writes  callbk  fanout  signal")
+    for name, events, callbk, fanout in self.fanout_signals()[:n]:
+      print("{:8}{:8}{:8}  {}".format( events, callbk, fanout, name ))
+    print("-"*72)
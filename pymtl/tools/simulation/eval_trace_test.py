@@ -0,0 +1,113 @@
+#=======================================================================
+# eval_trace_test.py
+#=======================================================================
+
+import pytest
+
+from sys   import flags
+from pymtl import *
+
+# Metrics are only collected by the dev (non -O) cycle
+
+pytestmark = pytest.mark.skipif( flags.optimize, reason='requires dev cycle' )
+
+#-----------------------------------------------------------------------
+# Models
+#-----------------------------------------------------------------------
+
+class Incr( Model ):
+
+  def __init__( s ):
+
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+
+    @s.combinational
+    def comb():
+      s.out.value = s.in_ + 1
+
+# The comb block is evaluated twice per cycle: once for the new input,
+# and once for the new register value after the clock edge. The input
+# also fans out to all incrementers.
+
+class Acc( Model ):
+
+  def __init__( s ):
+
+    s.in_  = InPort ( 8 )
+    s.out  = OutPort( 8 )
+    s.acc  = Wire   ( 8 )
+    s.incr = [ Incr() for i in range( 4 ) ]
+
+    for incr in s.incr:
+      s.connect( s.in_, incr.in_ )
+
+    @s.posedge_clk
+    def seq():
+      s.acc.next = s.out
+
+    @s.combinational
+    def comb():
+      s.out.value = s.acc + s.in_
+
+#-----------------------------------------------------------------------
+# test_eval_trace
+#-----------------------------------------------------------------------
+@pytest.mark.parametrize( 'sched', [ 'event', 'static' ] )
+def test_eval_trace( sched ):
+
+  model = Acc()
+  model.elaborate()
+  sim = SimulationTool( model, sched=sched, trace_evals=True )
+  sim.reset()
+  for i in range( 10 ):
+    model.in_.value = i + 1
+    sim.cycle()
+
+  metrics = sim.metrics
+  assert sum( metrics.redun_comb_evals_per_cycle ) >= 10
+
+  # Redundant evaluations of the comb block are caused by the register
+
+  blocks = dict( ( name, redun ) for name, evals, redun
+                 in metrics.redundant_blocks() )
+  assert blocks['top.comb'] >= 10
+  assert metrics.redundant_blocks()[0][0] == 'top.comb'
+
+  writer, signal, block, redun = metrics.redundant_triggers()[0]
+  assert ( writer, signal, block ) == ( '<clock>', 'top.acc', 'top.comb' )
+  assert redun >= 10
+
+  # The input has the largest fan-out
+
+  name, events, callbk, fanout = metrics.fanout_signals()[0]
+  assert ( name, fanout ) == ( 'top.in_', 5 )
+  assert callbk == 5 * events
+
+  # Trigger chain of a single cycle
+
+  trace = metrics.get_cycle_trace( 5 )
+  assert ( '<input>', 'top.in_', 'top.comb' ) in trace
+  assert ( '<input>', 'top.in_', 'top.incr[0].comb' ) in trace
+  assert trace[-1] == ( '<clock>', 'top.acc', 'top.comb' )
+  assert sorted( metrics.traces ) == range( 0, 12 )
+
+#-----------------------------------------------------------------------
+# test_eval_trace_window
+#-----------------------------------------------------------------------
+def test_eval_trace_window( capsys ):
+
+  model = Acc()
+  model.elaborate()
+  sim = SimulationTool( model, trace_evals=True )
+  sim.metrics.trace_cycles = 4
+  sim.reset()
+  for i in range( 10 ):
+    model.in_.value = i + 1
+    sim.cycle()
+
+  assert sorted( sim.metrics.traces ) == range( 8, 12 )
+
+  sim.metrics.print_offenders( 3 )
+  out, err = capsys.readouterr()
+  assert '<clock> -> top.acc -> top.comb' in out
@@ -0,0 +1,192 @@
+#=======================================================================
+# net_storage.py
+#=======================================================================
+# Array-backed storage for simulator nets.
+#
+# Instead of each net owning a Bits object plus a shadow Bits object for
+# its next value, NetStorage keeps the current and next values of all
+# nets that fit in a C unsigned long (64 bits on most platforms) in two
+# contiguous arrays indexed by net id. Wider nets keep the object
+# representation. The SignalValues inserted into the model are thin
+# views whose _uint attribute reads and writes the corresponding array
+# slot, so all of the existing Bits/BitStruct behavior keeps working
+# unmodified. Views store their attributes in __slots__, so they do not
+# allocate a __dict__.
+
+from array import array
+
+from ...datatypes.Bits import Bits
+
+#-----------------------------------------------------------------------
+# NetView
+#-----------------------------------------------------------------------
+# Mixin placed in front of a Bits subclass to redirect its value into a
+# NetStorage array slot. Concrete view classes are created per dtype
+# class by _get_view_class(), they hold the _view_slots (the mixin
+# itself cannot, the instance layouts of both bases would conflict).
+class NetView( object ):
+
+  __slots__ = ()
+
+  _base_cls = None
+
+  #---------------------------------------------------------------------
+  # _uint
+  #---------------------------------------------------------------------
+  def _get_uint( self ):
+    return self._values[ self._idx ]
+  def _set_uint( self, value ):
+    self._values[ self._idx ] = value
+  _uint = property( _get_uint, _set_uint )
+
+  #---------------------------------------------------------------------
+  # __call__
+  #---------------------------------------------------------------------
+  # Calling a net to create a new value must not create another view.
+  def __call__( self ):
+    return self._base_cls( self.nbits )
+
+  #---------------------------------------------------------------------
+  # __copy__
+  #---------------------------------------------------------------------
+  # Copies (e.g., signal[:]) return plain values, never aliases of the
+  # storage slot.
+  def __copy__( self ):
+    inst = self._base_cls( self.nbits )
+    inst._uint = self._values[ self._idx ]
+    return inst
+
+  def __deepcopy__( self, memo ):
+    return self.__copy__()
+
+  #---------------------------------------------------------------------
+  # flop
+  #---------------------------------------------------------------------
+  # Fast path for flopping registers, compares and copies the raw array
+  # slots instead of going through the Bits .value setter.
+  def flop( self ):
+    idx    = self._idx
+    values = self._values
+    new    = self._nexts[ idx ]
+    if values[ idx ] != new:
+      values[ idx ] = new
+      self.notify_sim_comb_update()
+      for func in self._slices: func()
+
+#-----------------------------------------------------------------------
+# _get_view_class
+#-----------------------------------------------------------------------
+# Create (and cache) a view class for a Bits subclass. The view keeps
+# the class name so BitStruct hashing is unchanged.
+
+# Attributes of views, including those set by the simulator. Slots shadow
+# the class-level defaults of SignalValue (_callbacks, _slices and the
+# notify_sim_* methods), so _new_view() initializes them.
+
+_view_slots = ( '_values', '_idx', '_next', '_nexts', '_ucb',
+                '_callbacks', '_slices',
+                'notify_sim_comb_update', 'notify_sim_seq_update' )
+
+def _notify_nothing():
+  pass
+
+_view_classes = {}
+def _get_view_class( cls ):
+  try:
+    return _view_classes[ cls ]
+  except KeyError:
+    view_cls = type( cls.__name__, ( NetView, cls ),
+                     { '_base_cls' : cls, '__slots__' : _view_slots } )
+    _view_classes[ cls ] = view_cls
+    return view_cls
+
+#-----------------------------------------------------------------------
+# NetStorage
+#-----------------------------------------------------------------------
+class NetStorage( object ):
+
+  # Widest net which fits in an array slot
+  max_nbits = array( 'L' ).itemsize * 8
+
+  def __init__( self ):
+    self.values = array( 'L' )
+    self.nexts  = array( 'L' )
+    self.nets   = []
+
+  #---------------------------------------------------------------------
+  # supports
+  #---------------------------------------------------------------------
+  # Returns True if nets of the provided dtype can be stored in arrays.
+  def supports( self, dtype ):
+    return isinstance( dtype, Bits ) and dtype.nbits <= self.max_nbits
+
+  #---------------------------------------------------------------------
+  # alloc
+  #---------------------------------------------------------------------
+  # Allocate a new net of the provided dtype, returns its SignalValue.
+  def alloc( self, dtype ):
+
+    idx = len( self.nets )
+    self.values.append( 0 )
+    self.nexts .append( 0 )
+
+    view_cls = _get_view_class( type( dtype ) )
+
+    svalue        = self._new_view( view_cls, dtype.nbits, self.values, idx )
+    svalue._next  = self._new_view( view_cls, dtype.nbits, self.nexts,  idx )
+    svalue._nexts = self.nexts
+
+    self.nets.append( svalue )
+    return svalue
+
+  #---------------------------------------------------------------------
+  # flop_registers
+  #---------------------------------------------------------------------
+  # Flop all registers in the register queue and empty it. The slots of
+  # all queued views are compared and copied in a single pass over the
+  # queue (newest first, like popping it), the changed nets are notified
+  # after the pass. Only the queued slots are copied: the nexts of other
+  # registers may be stale, e.g., when their .value was written directly.
+  # Queued nets which are not views (wide nets) are flopped one by one.
+  def flop_registers( self, queue ):
+
+    values = self.values
+    nexts  = self.nexts
+
+    while queue:
+      changed = []
+      for net in reversed( queue ):
+        try:
+          idx = net._idx
+        except AttributeError:
+          net.flop()
+          continue
+        new = nexts[ idx ]
+        if values[ idx ] != new:
+          values[ idx ] = new
+          changed.append( net )
+      del queue[:]
+
+      for net in changed:
+        net.notify_sim_comb_update()
+        for func in net._slices: func()
+
+  #---------------------------------------------------------------------
+  # _new_view
+  #---------------------------------------------------------------------
+  def _new_view( self, view_cls, nbits, values, idx ):
+    inst            = object.__new__( view_cls )
+    inst._values    = values
+    inst._idx       = idx
+    inst._callbacks = ()
+    inst._slices    = ()
+    inst.notify_sim_comb_update = _notify_nothing
+    inst.notify_sim_seq_update  = _notify_nothing
+    Bits.__init__( inst, nbits )
+    return inst
+
+  #---------------------------------------------------------------------
+  # __len__
+  #---------------------------------------------------------------------
+  def __len__( self ):
+    return len( self.nets )
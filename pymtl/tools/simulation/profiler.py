@@ -0,0 +1,194 @@
+#=======================================================================
+# profiler.py
+#=======================================================================
+# Per-block profiling support for SimulationTool. When a simulator is
+# created with profile=True, every @tick/@posedge_clk block, every
+# @combinational block and every slice (and SwappableModel route)
+# callback is timed individually:
+#
+#   sim = SimulationTool( model, profile=True )
+#   ...
+#   sim.profiler.print_report()
+#   sim.profiler.write_folded( 'sim.folded' )
+#
+# Blocks are keyed by the hierarchical path of their model and their
+# function name (e.g. 'top.core.alu.comb'). The time of a block
+# excludes the time spent in the slice callbacks it triggers, which are
+# accounted separately. The folded stack file can be turned into a
+# flamegraph (flamegraph.pl, speedscope, ...), with one frame for each
+# level of the model hierarchy so that time is aggregated by submodule.
+#
+# Profiling uses separate cycle() and eval_combinational()
+# implementations, so the regular (and -O) implementations are not
+# slowed down at all when profiling is disabled.
+
+from __future__ import print_function
+
+import timeit
+
+timer = timeit.default_timer
+
+#-----------------------------------------------------------------------
+# SimulationProfiler
+#-----------------------------------------------------------------------
+class SimulationProfiler( object ):
+
+  def __init__( self, model, seq_blocks, comb_blocks, slice_blocks ):
+
+    self.stats     = {}    # path -> [ calls, total time, self time ]
+    self.sim_time  = 0.0   # total time spent in cycle()
+    self.ncycles   = 0
+    self.wrappers  = {}    # block -> profiled version of block
+
+    self._children = []    # time of nested calls, per active call
+    self._paths    = get_model_paths( model )
+    self._top      = model.name
+
+    for func in seq_blocks + comb_blocks:
+      self._wrap( func, get_block_path( self._paths, func ) )
+
+    # Slice callbacks are called directly when their source changes, so
+    # replace them with their profiled version in the sources
+
+    for func in slice_blocks:
+      wrapper = self._wrap( func, get_block_path( self._paths, func ) )
+      for svalue in func._senses:
+        svalue._slices[:] = [ wrapper if x is func else x
+                              for x in svalue._slices ]
+
+  #---------------------------------------------------------------------
+  # _wrap
+  #---------------------------------------------------------------------
+  # Create the profiled version of func, which accumulates its number of
+  # calls, total and self time in the stats of path.
+  def _wrap( self, func, path ):
+
+    stats    = self.stats.setdefault( path, [ 0, 0.0, 0.0 ] )
+    children = self._children
+
+    def profiled():
+      children.append( 0.0 )
+      start = timer()
+      try:
+        func()
+      finally:
+        elapsed   = timer() - start
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += elapsed - children.pop()
+        if children:
+          children[-1] += elapsed
+
+    self.wrappers[ func ] = profiled
+    return profiled
+
+  #---------------------------------------------------------------------
+  # add_cycle
+  #---------------------------------------------------------------------
+  # Account the time of one complete call to cycle().
+  def add_cycle( self, elapsed ):
+    self.sim_time += elapsed
+    self.ncycles  += 1
+
+  #---------------------------------------------------------------------
+  # report
+  #---------------------------------------------------------------------
+  # Return ( path, calls, total time, self time ) tuples for all blocks
+  # which have been called at least once, most expensive first.
+  def report( self ):
+    rows = [ ( path, calls, total, self_time )
+             for path, ( calls, total, self_time ) in self.stats.items()
+             if calls ]
+    return sorted( rows, key=lambda x: ( -x[3], x[0] ) )
+
+  #---------------------------------------------------------------------
+  # print_report
+  #---------------------------------------------------------------------
+  # Print the report to the commandline, limited to the top n blocks.
+  def print_report( self, n=None ):
+
+    rows       = self.report()
+    block_time = sum( x[3] for x in rows )
+    other_time = max( self.sim_time - block_time, 0.0 )
+    total_time = max( self.sim_time, block_time ) or 1.0
+
+    print("-"*72)
+    print("Simulation Profile")
+    print("-"*72)
+    print()
+    print("ncycles:               {:4}".format( self.ncycles ))
+    print("simulation time:       {:7.3f}s".format( self.sim_time ))
+    print("scheduling/other:      {:7.3f}s".format( other_time ))
+    print()
+    print("  self %      self s     total s      calls  block")
+    print("--------  ----------  ----------  ---------  -----")
+    for path, calls, total, self_time in rows[:n]:
+      print("{:7.2f}%  {:10.6f}  {:10.6f}  {:9}  {}".format(
+              100.0 * self_time / total_time, self_time, total, calls, path ))
+    print("-"*72)
+
+  #---------------------------------------------------------------------
+  # write_folded
+  #---------------------------------------------------------------------
+  # Write the self time of all blocks in microseconds in the folded
+  # stack format used by flamegraph tools, e.g.
+  #
+  #   top;core;alu;comb 1234
+  #
+  # Time spent outside of blocks (scheduling) is reported as top;<sim>.
+  def write_folded( self, path ):
+
+    rows  = self.report()
+    other = self.sim_time - sum( x[3] for x in rows )
+
+    with open( path, 'w' ) as o:
+      for block, calls, total, self_time in rows:
+        usecs = int( round( self_time * 1e6 ) )
+        if usecs:
+          print( "{} {}".format( _fold( block ), usecs ), file=o )
+      if int( round( other * 1e6 ) ) > 0:
+        print( "{};<sim> {}".format( self._top, int( round( other * 1e6 ) ) ),
+               file=o )
+
+#-----------------------------------------------------------------------
+# get_model_paths
+#-----------------------------------------------------------------------
+# Map all models in the hierarchy of model to their hierarchical path.
+def get_model_paths( model, path=None ):
+  path  = model.name if path is None else path
+  paths = { model: path }
+  for sub in model.get_submodules():
+    paths.update( get_model_paths( sub, path + '.' + sub.name ) )
+  return paths
+
+#-----------------------------------------------------------------------
+# get_block_path
+#-----------------------------------------------------------------------
+# Hierarchical name of a sequential or combinational block, slice or
+# route callback, given the paths of all models, e.g. 'top.alu.comb' or
+# 'top.slice:out[0:8]'.
+def get_block_path( paths, func ):
+  if hasattr( func, '_connection' ):
+    c = func._connection
+    return '{}.slice:{}{}'.format( paths[ c.dest_node.parent ],
+                                   c.dest_node.name,
+                                   _format_addr( c.dest_slice ) )
+  if hasattr( func, '_dest' ):
+    return '{}.route:{}'.format( paths[ func._dest.parent ], func._dest.name )
+  return '{}.{}'.format( paths[ func._model ], func.__name__ )
+
+# Turn a hierarchical path into folded stack frames, dots within slice
+# addresses or bundle port names are kept in the last frame.
+
+def _fold( path ):
+  head, sep, tail = path.partition( ':' )
+  frames = head.split( '.' )
+  frames[-1] += sep + tail
+  return ';'.join( frames )
+
+def _format_addr( addr ):
+  if isinstance( addr, slice ):
+    return '[{}:{}]'.format( addr.start, addr.stop )
+  if addr is not None:
+    return '[{}]'.format( addr )
+  return ''
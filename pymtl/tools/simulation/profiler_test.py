@@ -0,0 +1,99 @@
+#=======================================================================
+# profiler_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl import *
+
+#-----------------------------------------------------------------------
+# Models
+#-----------------------------------------------------------------------
+
+class Incr( Model ):
+
+  def __init__( s ):
+
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+
+    @s.combinational
+    def comb():
+      s.out.value = s.in_ + 1
+
+class Top( Model ):
+
+  def __init__( s ):
+
+    s.in_  = InPort ( 8 )
+    s.out  = OutPort( 16 )
+    s.acc  = Wire   ( 16 )
+    s.incr = [ Incr() for i in range( 2 ) ]
+
+    s.connect( s.in_,         s.incr[0].in_ )
+    s.connect( s.incr[0].out, s.incr[1].in_ )
+    s.connect( s.out[0:8],    s.incr[1].out )
+    s.connect( s.out[8:16],   s.incr[0].out )
+
+    @s.posedge_clk
+    def seq():
+      s.acc.next = s.acc + s.out
+
+def run_top( ncycles, **kwargs ):
+  model = Top()
+  model.elaborate()
+  sim = SimulationTool( model, **kwargs )
+  sim.reset()
+  outs = []
+  for i in range( ncycles ):
+    model.in_.value = i
+    sim.cycle()
+    outs.append( ( int( model.out ), int( model.acc ) ) )
+  return sim, outs
+
+#-----------------------------------------------------------------------
+# test_profiler
+#-----------------------------------------------------------------------
+@pytest.mark.parametrize( 'sched', [ 'event', 'static', 'compiled' ] )
+def test_profiler( sched ):
+
+  sim, outs = run_top( 20, sched=sched, profile=True )
+  assert outs == run_top( 20, sched=sched )[1]
+
+  rows = { path: ( calls, total, self_time )
+           for path, calls, total, self_time in sim.profiler.report() }
+
+  assert set( rows ) == { 'top.seq', 'top.incr[0].comb', 'top.incr[1].comb',
+                          'top.slice:out[0:8]', 'top.slice:out[8:16]' }
+  assert rows['top.seq'][0] == sim.ncycles == sim.profiler.ncycles
+  assert rows['top.incr[0].comb'][0] >= 20
+
+  # Self time excludes the nested slice callbacks
+
+  for calls, total, self_time in rows.values():
+    assert 0.0 <= self_time <= total
+  assert sum( x[2] for x in rows.values() ) <= sim.profiler.sim_time
+
+#-----------------------------------------------------------------------
+# test_profiler_output
+#-----------------------------------------------------------------------
+def test_profiler_output( tmpdir, capsys ):
+
+  sim, outs = run_top( 50, profile=True )
+
+  sim.profiler.print_report( 2 )
+  out, err = capsys.readouterr()
+  assert 'ncycles:                 52' in out
+  assert len([ l for l in out.splitlines() if '  top.' in l ]) == 2
+
+  path = str( tmpdir.join( 'sim.folded' ) )
+  sim.profiler.write_folded( path )
+  stacks = {}
+  for line in open( path ):
+    stack, usecs = line.rsplit( ' ', 1 )
+    stacks[ stack ] = int( usecs )
+
+  assert set( stacks ) <= { 'top;seq', 'top;incr[0];comb', 'top;incr[1];comb',
+                            'top;slice:out[0:8]', 'top;slice:out[8:16]',
+                            'top;<sim>' }
+  assert all( usecs > 0 for usecs in stacks.values() )
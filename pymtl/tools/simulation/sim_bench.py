@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+#=======================================================================
+# sim_bench.py
+#=======================================================================
+# Benchmarks for simulator construction. Builds a synthetic design with
+# many submodules, ports, port lists and combinational blocks, then
+# measures the time spent elaborating it and constructing (and briefly
+# running) a SimulationTool for it.
+#
+# Usage:
+#
+#   python -m pymtl.tools.simulation.sim_bench [--nstages N] [--nports N]
+#                                              [--repeat N] [--sched S]
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from pymtl import Model, InPort, OutPort, Wire, SimulationTool
+
+#-----------------------------------------------------------------------
+# BenchStage
+#-----------------------------------------------------------------------
+# A pipeline stage with a list of inputs which are registered and summed
+# into a single output by a combinational block.
+class BenchStage( Model ):
+
+  def __init__( s, nports ):
+
+    s.in_ = InPort [ nports ]( 16 )
+    s.out = OutPort[ nports ]( 16 )
+    s.sum = OutPort( 16 )
+    s.reg = Wire   [ nports ]( 16 )
+
+    @s.tick
+    def seq():
+      for i in range( nports ):
+        s.reg[i].next = s.in_[i]
+
+    @s.combinational
+    def comb():
+      for i in range( nports ):
+        s.out[i].value = s.reg[i] + 1
+
+    @s.combinational
+    def comb_sum():
+      s.sum.value = s.reg[0] + s.reg[nports-1]
+
+#-----------------------------------------------------------------------
+# BenchChain
+#-----------------------------------------------------------------------
+class BenchChain( Model ):
+
+  def __init__( s, nstages, nports ):
+
+    s.in_    = InPort [ nports ]( 16 )
+    s.out    = OutPort[ nports ]( 16 )
+    s.stages = [ BenchStage( nports ) for _ in range( nstages ) ]
+
+    for i in range( nports ):
+      s.connect( s.in_[i], s.stages[0].in_[i] )
+      s.connect( s.out[i], s.stages[-1].out[i] )
+      for j in range( nstages - 1 ):
+        s.connect( s.stages[j].out[i], s.stages[j+1].in_[i] )
+
+#-----------------------------------------------------------------------
+# run_benchmark
+#-----------------------------------------------------------------------
+# Returns the best elaboration and simulator construction times (in
+# seconds) over repeat runs.
+def run_benchmark( nstages = 64, nports = 8, repeat = 3, ncycles = 10,
+                   **sim_kwargs ):
+
+  elab_times = []
+  sim_times  = []
+
+  for _ in range( repeat ):
+
+    model = BenchChain( nstages, nports )
+
+    start = timeit.default_timer()
+    model.elaborate()
+    elab_times.append( timeit.default_timer() - start )
+
+    start = timeit.default_timer()
+    sim   = SimulationTool( model, **sim_kwargs )
+    sim_times.append( timeit.default_timer() - start )
+
+    # Make sure the simulator actually works
+    sim.reset()
+    for i in range( ncycles ):
+      model.in_[0].value = i
+      sim.cycle()
+
+  return min( elab_times ), min( sim_times )
+
+#-----------------------------------------------------------------------
+# main
+#-----------------------------------------------------------------------
+def main():
+
+  p = argparse.ArgumentParser( description='simulator construction benchmark' )
+  p.add_argument( '--nstages', type=int, default=64 )
+  p.add_argument( '--nports',  type=int, default=8 )
+  p.add_argument( '--repeat',  type=int, default=3 )
+  p.add_argument( '--sched',   default='event' )
+  opts = p.parse_args()
+
+  elab, sim = run_benchmark( opts.nstages, opts.nports, opts.repeat,
+                             sched=opts.sched )
+
+  print( 'elaborate      {:8.3f} s'.format( elab ) )
+  print( 'SimulationTool {:8.3f} s'.format( sim  ) )
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,32 @@
+#=======================================================================
+# sim_bench_test.py
+#=======================================================================
+# Smoke tests for the simulator construction benchmark and the attribute
+# path helpers it exercises.
+
+import pytest
+
+from sim_bench import BenchChain, run_benchmark
+from sim_utils import _parse_attr_path, _get_attr_path, _set_attr_path
+
+def test_run_benchmark():
+
+  elab, sim = run_benchmark( nstages=4, nports=2, repeat=1 )
+  assert elab >= 0
+  assert sim  >= 0
+
+def test_parse_attr_path():
+
+  assert _parse_attr_path( 's.in_' )           == ( 's', 'in_' )
+  assert _parse_attr_path( 's.stages[3].out' ) == ( 's', 'stages', 3, 'out' )
+  assert _parse_attr_path( 'out[0][1]' )       == ( 'out', 0, 1 )
+  with pytest.raises( NameError ):
+    _parse_attr_path( 's.in_ + 1' )
+
+def test_get_set_attr_path():
+
+  model = BenchChain( 2, 2 )
+  path  = _parse_attr_path( 'stages[1].in_[0]' )
+  assert _get_attr_path( model, path ) is model.stages[1].in_[0]
+  _set_attr_path( model, path, 42 )
+  assert model.stages[1].in_[0] == 42
@@ -2,11 +2,13 @@
 # sim_utils.py
 #=======================================================================
 
+import re
 import warnings
 import greenlet
 
-from ..ast_helpers            import get_method_ast
+from ..ast_helpers            import get_cached_method_ast, get_method_analysis
 from ...datatypes.SignalValue import SignalValue
+from ...model.signals         import find_net
 
 from ast_visitor import (
   DetectLoadsAndStores,
@@ -33,58 +35,34 @@ def collect_signals( model ):
 # Generate nets describing structural connections in the model.  Each
 # net describes a set of Signal objects which have been interconnected,
 # either directly or indirectly, by calls to connect().
+#
+# Nets are tracked incrementally by a union-find structure as
+# connections are made (see find_net in signals.py), so here we only
+# group the signals by the representative of their net. Constants are
+# not part of the signal set, they are added through their connections.
+# Slice connections do not merge nets and are returned separately.
 def signals_to_nets( signals ):
 
-  nets           = []
+  nets           = {}
   slice_connects = set()
 
-  #---------------------------------------------------------------------
-  # valid_connection
-  #---------------------------------------------------------------------
-  # Utility function to filter only supported connections (ports/wires),
-  # ignore slices and constants.
-  def valid_connection( c ):
-    if c.src_slice != None or c.dest_slice != None:
-      # TODO: collect slice connections somewhere else
-      slice_connects.add( c )
-      return False
-    else:
-      return True
-
-  #---------------------------------------------------------------------
-  # iter_dfs
-  #---------------------------------------------------------------------
-  # Iterative Depth-First-Search algorithm, borrowed from Listing 5-5
-  # in 'Python Algorithms': http://www.apress.com/9781430232377/
-  def iter_dfs( s ):
-    S, Q = set(), []
-    Q.append( s )
-    while Q:
-      u = Q.pop()
-      if u in S: continue
-      S.add( u )
-      connected_signals = [ x.other( u ) for x in u.connections
-                            if valid_connection( x ) ]
-      Q.extend( connected_signals )
-      #yield u
-    return S
-
-  # Initially signals contains all the Signal type objects in the model.
-  # We perform a depth-first search on the connections of each Signal
-  # object, and remove connected objects from the signals set.  The
-  # result is a collection of nets describing structural connections in
-  # the design. Each independent net will later be transformed into a
-  # single SignalValue object.
-
-  while signals:
-    s = signals.pop()
-    net = iter_dfs( s )
-    for i in net:
-      #if i is not s: signals.remove( i )
-      signals.discard( i )
-    nets.append( net )
-
-  return nets, slice_connects
+  def add_to_net( signal ):
+    root = find_net( signal )
+    try:
+      nets[ id( root ) ].add( signal )
+    except KeyError:
+      nets[ id( root ) ] = set([ signal ])
+
+  for s in signals:
+    add_to_net( s )
+    for c in s.connections:
+      if c.src_slice is not None or c.dest_slice is not None:
+        # TODO: collect slice connections somewhere else
+        slice_connects.add( c )
+      else:
+        add_to_net( c.other( s ) )
+
+  return nets.values(), slice_connects
 
 #---------------------------------------------------------------------
 # insert_signal_values
@@ -92,7 +70,10 @@ def signals_to_nets( signals ):
 # Transform each net into a single SignalValue object. Model attributes
 # currently referencing Signal objects will be modified to reference
 # the SignalValue object of their associated net instead.
-def insert_signal_values( sim, nets ):
+#
+# If a NetStorage is provided, nets it supports are allocated as views
+# into its value arrays instead of as separate Bits objects.
+def insert_signal_values( sim, nets, storage = None ):
 
   # Utility functions which create SignalValue callbacks.
 
@@ -125,8 +106,11 @@ def insert_signal_values( sim, nets ):
     group.add( temp )
 
     # TODO: should this be visible to sim?
-    svalue       = temp.dtype()
-    svalue._next = temp.dtype()
+    if storage is not None and storage.supports( temp.dtype ):
+      svalue       = storage.alloc( temp.dtype )
+    else:
+      svalue       = temp.dtype()
+      svalue._next = temp.dtype()
 
     #svalue._DEBUG_signal_names = group
 
@@ -151,9 +135,7 @@ def insert_signal_values( sim, nets ):
         svalue.constant = True
       # Otherwise swap the value
       else:
-        # We need 'in locals()' because of the nested function above,
-        # see: http://stackoverflow.com/a/4484946
-        exec( "x.parent.{} = svalue".format( x.name ) ) in locals()
+        _set_attr_path( x.parent, _parse_attr_path( x.name ), svalue )
 
       # Also give signals a pointer to the SignalValue object.
       # (Needed for VCD tracing and slice logic generator).
@@ -178,24 +160,30 @@ def register_seq_blocks( model ):
   for i in all_models:
     for func in i.get_tick_blocks() + i.get_posedge_clk_blocks():
 
-      # Grab the AST and src code of each function
-      tree, src = get_method_ast( func )
+      # Grab the (shared) AST of each function
+      tree, src = get_cached_method_ast( func )
 
-      # Check there were no mistakes in use of .value/.next
-      DetectIncorrectValueNext( func, 'value' ).visit( tree )
-      DetectMissingValueNext  ( func, 'next'  ).visit( tree )
+      # Check there were no mistakes in use of .value/.next. The first
+      # check only depends on the AST so it is done once per function
+      get_method_analysis( func, 'incorrect_value',
+        lambda tree: DetectIncorrectValueNext( func, 'value' ).visit( tree ) )
+      DetectMissingValueNext( func, 'next' ).visit( tree )
 
       # If function is decorated with tick_fl, wrap it with a greenlet
-      if 'tick_fl' in DetectDecorators().enter( tree ):
+      decorators = get_method_analysis( func, 'decorators',
+        lambda tree: DetectDecorators().enter( tree ) )
+      if 'tick_fl' in decorators:
         func = _pausable_tick( func )
+        func._model = i
 
       sequential_blocks.append( func )
 
     for func in i.get_combinational_blocks():
 
-      tree, _ = get_method_ast( func )
-      DetectIncorrectValueNext( func, 'next'  ).visit( tree )
-      DetectMissingValueNext  ( func, 'value' ).visit( tree )
+      tree, _ = get_cached_method_ast( func )
+      get_method_analysis( func, 'incorrect_next',
+        lambda tree: DetectIncorrectValueNext( func, 'next' ).visit( tree ) )
+      DetectMissingValueNext( func, 'value' ).visit( tree )
 
   return sequential_blocks
 
@@ -205,16 +193,26 @@ def register_seq_blocks( model ):
 # Register all decorated @combinational functions with the simulator.
 # Combinational logic blocks are registered with SignalValue objects
 # and get added to the event queue when values are updated.
-def register_comb_blocks( model, event_queue ):
+#
+# If a comb_stores dictionary is provided, the signals written by each
+# block are also collected (used by the static scheduler). Returns a
+# list of all registered blocks.
+def register_comb_blocks( model, event_queue, comb_stores = None ):
+
+  comb_blocks = []
 
   # Get the sensitivity list of each event driven (combinational) block
   # TODO: do before or after we swap value nodes?
 
   for func in model.get_combinational_blocks():
-    tree, _ = get_method_ast( func )
-    loads, stores = DetectLoadsAndStores().enter( tree )
+    loads, stores = get_method_analysis( func, 'loads_stores',
+      lambda tree: DetectLoadsAndStores().enter( tree ) )
     for name in loads:
       _add_senses( func, model, name )
+    if comb_stores is not None:
+      comb_stores[ func ] = []
+      for name in stores:
+        _add_stores( func, model, name, comb_stores )
 
   # Iterate through all @combinational decorated function names we
   # detected, retrieve their associated function pointer, then add
@@ -227,7 +225,6 @@ def register_comb_blocks( model, event_queue ):
   for func_ptr, sensitivity_list in model._newsenses.items():
     func_ptr.id = event_queue.get_id()
     func_ptr.cb = func_ptr
-    #self.metrics.reg_eval( func_ptr.cb )
     for signal_value in sensitivity_list:
 
       # Only add "notify_sim" funcs if @comb blocks are sensitive to us
@@ -241,9 +238,13 @@ def register_comb_blocks( model, event_queue ):
 
       #self._DEBUG_signal_cbs[ signal_value ].append( func_ptr )
 
+    comb_blocks.append( func_ptr )
+
   # Recursively perform for submodules
   for m in model.get_submodules():
-    register_comb_blocks( m, event_queue )
+    comb_blocks += register_comb_blocks( m, event_queue, comb_stores )
+
+  return comb_blocks
 
 #-----------------------------------------------------------------------
 # _add_senses
@@ -273,18 +274,36 @@ def _add_senses( func, model, name ):
       warnings.warn( "Cannot add SignalValue '{}' to sensitivity list."
                      "".format( name ), Warning )
 
+#-----------------------------------------------------------------------
+# _add_stores
+#-----------------------------------------------------------------------
+# Utility function to recursively add signals/lists of signals to the
+# list of signals written by a combinational block. Stores to names we
+# cannot resolve (temporaries, plain Python attributes) are ignored.
+def _add_stores( func, model, name, comb_stores ):
+  try:
+    obj = _attr_name_to_object( model, name )
+  except AttributeError:
+    return
+  if   isinstance( obj, tuple ):
+    obj_list, list_name, attr = obj
+    for i, o in enumerate( obj_list ):
+      obj_name = "{}[{}]{}".format( list_name, i, attr )
+      _add_stores( func, model, obj_name, comb_stores )
+
+  elif isinstance( obj, SignalValue ):
+    target_bits = obj._target_bits
+    if hasattr( target_bits, '_ucb' ):
+      comb_stores[ func ].append( target_bits )
+
 #-----------------------------------------------------------------------
 # _attr_name_to_object
 #-----------------------------------------------------------------------
 # Utility function to turn attributes/names acquired from the ast
 # into Python objects
-# TODO: should never use eval... but this is easy
 # TODO: how to handle when self is neither 's' nor 'self'?
 # TODO: how to handle temps!
 def _attr_name_to_object( model, name ):
-  # Temporarily creates the names 'self' and 's' in the current
-  # scope.  SUPER HACKY
-  self = s = model
   # If slice or list, get name components previous to indexing
   if '[?]' in name:
     name, extra = name.split('[?]', 1)
@@ -298,7 +317,10 @@ def _attr_name_to_object( model, name ):
   # list. Return a tuple containing the list object, the list name
   # and the attribute string the appears after the list indexing.
   try:
-    x = eval( name )
+    path = _parse_attr_path( name )
+    if not path or path[0] not in ( 's', 'self' ):
+      raise NameError
+    x = _get_attr_path( model, path[1:] )
     if   isinstance( x, SignalValue ): return x
     elif isinstance( x, list        ): return ( x, name, extra )
     else:                              raise NameError
@@ -308,15 +330,65 @@ def _attr_name_to_object( model, name ):
                      "".format( name ), Warning )
     return None
 
+#-----------------------------------------------------------------------
+# _parse_attr_path
+#-----------------------------------------------------------------------
+# Parse an attribute name such as 's.ports[2].msg' into a path tuple
+# ('s', 'ports', 2, 'msg'), strings are attribute names and ints are
+# list indices. Parsed paths are cached. Raises NameError for names
+# which are not simple attribute paths.
+_attr_path_cache = {}
+_attr_path_token = re.compile( r'\.?([A-Za-z_]\w*)|\[(\d+)\]' )
+
+def _parse_attr_path( name ):
+  try:
+    return _attr_path_cache[ name ]
+  except KeyError:
+    pass
+
+  path = []
+  pos  = 0
+  while pos < len( name ):
+    match = _attr_path_token.match( name, pos )
+    if not match or ( pos == 0 and name[0] == '.' ):
+      raise NameError( "Cannot resolve '{}'".format( name ) )
+    attr, index = match.groups()
+    path.append( attr if attr is not None else int( index ) )
+    pos = match.end()
+
+  path = _attr_path_cache[ name ] = tuple( path )
+  return path
+
+#-----------------------------------------------------------------------
+# _get_attr_path
+#-----------------------------------------------------------------------
+# Return the object at the end of a path parsed by _parse_attr_path.
+def _get_attr_path( obj, path ):
+  for key in path:
+    if key.__class__ is int: obj = obj[ key ]
+    else:                    obj = getattr( obj, key )
+  return obj
+
+#-----------------------------------------------------------------------
+# _set_attr_path
+#-----------------------------------------------------------------------
+# Set the object at the end of a path parsed by _parse_attr_path.
+def _set_attr_path( obj, path, value ):
+  obj = _get_attr_path( obj, path[:-1] )
+  key = path[-1]
+  if key.__class__ is int: obj[ key ] = value
+  else:                    setattr( obj, key, value )
 
 #-----------------------------------------------------------------------
 # create_slice_callbacks
 #-----------------------------------------------------------------------
 # All ConnectionEdges that contain bit slicing need to be turned into
 # combinational blocks.  This significantly simplifies the connection
-# graph update logic.
+# graph update logic. Returns a list of all slice callbacks created.
 def create_slice_callbacks( slice_connects, event_queue ):
 
+  slice_blocks = []
+
   for c in slice_connects:
     src = c.src_node._signalvalue
     # If slice is connect to a Constant, don't create a callback.
@@ -334,9 +406,11 @@ def create_slice_callbacks( slice_connects, event_queue ):
       func_ptr.id = event_queue.get_id()
       func_ptr.cb = func_ptr
       event_queue.enq( func_ptr.cb, func_ptr.id )
-      #self.metrics.reg_eval( func_ptr.cb, is_slice = True )
+      slice_blocks.append( func_ptr )
       #self._DEBUG_signal_cbs[ signal_value ].append( func_ptr )
 
+  return slice_blocks
+
 #-----------------------------------------------------------------------
 # _create_slice_cb_closure
 #-----------------------------------------------------------------------
@@ -351,9 +425,108 @@ def _create_slice_cb_closure( c ):
     # to a BitSlice will updates the Bits it was sliced from, but
     # not vice versa.
     dest_bits.v = src[ src_addr ]
+  # Remember which nets we read and write for the static scheduler, and
+  # the connection for the profiler.
+  slice_cb._senses     = [ src ]
+  slice_cb._stores     = [ dest ]
+  slice_cb._connection = c
   return slice_cb
 
 
+#-----------------------------------------------------------------------
+# levelize_comb_blocks
+#-----------------------------------------------------------------------
+# Statically schedule combinational blocks (and slice callbacks) using
+# the signals each block reads (senses) and writes (stores). Blocks
+# are sorted topologically so that every block is ordered after all
+# blocks driving its inputs. Blocks which are part of a combinational
+# cycle are grouped into a single strongly connected component and
+# share a level. Returns the ordered list of blocks, the number of
+# levels, and the set of blocks which are part of a cycle.
+def levelize_comb_blocks( blocks, senses, stores ):
+
+  # Nets are keyed by id() because BitStructs hash by value.
+
+  readers = {}
+  for func in blocks:
+    for net in senses[ func ]:
+      readers.setdefault( id( net ), [] ).append( func )
+
+  succs = {}
+  for func in blocks:
+    succs[ func ] = edges = []
+    seen = set()
+    for net in stores[ func ]:
+      for reader in readers.get( id( net ), [] ):
+        if reader not in seen:
+          seen.add( reader )
+          edges.append( reader )
+
+  # Iterative version of Tarjan's strongly connected components
+  # algorithm. Components are discovered in reverse topological order.
+
+  index, lowlink, on_stack = {}, {}, set()
+  stack, sccs = [], []
+
+  for root in blocks:
+    if root in index: continue
+    work = [ ( root, 0 ) ]
+    while work:
+      func, i = work.pop()
+      if i == 0:
+        index[ func ] = lowlink[ func ] = len( index )
+        stack.append( func )
+        on_stack.add( func )
+      edges = succs[ func ]
+      while i < len( edges ):
+        succ = edges[ i ]
+        i += 1
+        if succ not in index:
+          work.append( ( func, i ) )
+          work.append( ( succ, 0 ) )
+          break
+        elif succ in on_stack:
+          lowlink[ func ] = min( lowlink[ func ], index[ succ ] )
+      else:
+        if lowlink[ func ] == index[ func ]:
+          scc = []
+          while True:
+            member = stack.pop()
+            on_stack.discard( member )
+            scc.append( member )
+            if member is func: break
+          sccs.append( scc )
+        if work:
+          parent = work[-1][0]
+          lowlink[ parent ] = min( lowlink[ parent ], lowlink[ func ] )
+
+  sccs.reverse()
+
+  # Assign levels to each component (longest path from a primary
+  # input), flatten into a schedule, and collect all cyclic blocks.
+
+  schedule = []
+  cyclic   = set()
+  level    = {}
+  nlevels  = 0
+
+  for scc in sccs:
+    members = set( scc )
+    lvl     = max( [ level.get( func, 0 ) for func in scc ] )
+    for func in scc:
+      for succ in succs[ func ]:
+        if succ not in members:
+          level[ succ ] = max( level.get( succ, 0 ), lvl + 1 )
+    nlevels = max( nlevels, lvl + 1 )
+
+    # Blocks never re-trigger themselves, so only components with more
+    # than one block form a real combinational cycle.
+    if len( scc ) > 1:
+      cyclic.update( scc )
+    schedule.extend( reversed( scc ) )
+
+  return schedule, nlevels, cyclic
+
 #---------------------------------------------------------------------
 # _pausable_tick
 #---------------------------------------------------------------------
@@ -389,6 +562,7 @@ def _pausable_tick( func ):
   def outer_wrapper():
     func._pausable_tick.switch()
 
+  outer_wrapper.__name__ = func.__name__
   return outer_wrapper
 
 #-----------------------------------------------------------------------
@@ -0,0 +1,250 @@
+#=======================================================================
+# swapping.py
+#=======================================================================
+# Support for swapping the implementation of a submodule during a
+# simulation, e.g., to fast-forward through uninteresting regions of a
+# run with a cheap FL/CL model and switch to the RTL model for a region
+# of interest (SMARTS-style sampling):
+#
+#   s.proc = SwappableModel([ ( 'fl',  ProcFL()  ),
+#                             ( 'rtl', ProcRTL() ) ])
+#   ...
+#   sim = SimulationTool( model )
+#   sim.reset()
+#   for i in range( 1000000 ):          # fast-forward
+#     sim.cycle()
+#   sim.swap( model.proc, 'rtl', transfer=copy_arch_state )
+#   for i in range( 1000 ):             # detailed simulation
+#     sim.cycle()
+#
+# A SwappableModel instantiates all implementations as submodules and
+# exposes their (identical) port interface. Inputs are connected to all
+# implementations, while the outputs of the active implementation are
+# routed to the outputs of the SwappableModel by the simulator. Only the
+# sequential and combinational blocks of the active implementation are
+# simulated.
+
+from collections import OrderedDict
+
+from pymtl                  import PyMTLError
+from pymtl.model.Model      import Model
+from pymtl.model.signals    import InPort, OutPort
+from pymtl.model.PortBundle import PortBundle
+
+#-----------------------------------------------------------------------
+# SwappableModel
+#-----------------------------------------------------------------------
+class SwappableModel( Model ):
+
+  def __init__( s, impls, level=None ):
+
+    impls = OrderedDict( impls )
+    if not impls:
+      raise PyMTLError( "SwappableModel needs at least one implementation!" )
+
+    s._levels = list( impls.keys() )
+    s.impls   = list( impls.values() )
+    s._active = s._levels.index( level ) if level is not None else 0
+
+    # Create a copy of the port interface of the first implementation,
+    # all other implementations must have the same interface
+
+    ifc = _get_interface( s.impls[0] )
+    for name, impl in zip( s._levels[1:], s.impls[1:] ):
+      if _get_interface_signature( impl ) != _get_interface_signature( s.impls[0] ):
+        raise PyMTLError( "The '{}' implementation of SwappableModel does "
+                          "not have the same port interface as the '{}' "
+                          "implementation!".format( name, s._levels[0] ) )
+
+    for name, value in ifc:
+      setattr( s, name, _copy_ports( value ) )
+
+    # Connect the inputs to all implementations and remember which ports
+    # of each implementation drive each output
+
+    s._routes = []
+    for name, value in ifc:
+      for path, port in _get_leaves( getattr( s, name ), name ):
+        impl_ports = [ _get_leaf( impl, path ) for impl in s.impls ]
+        if isinstance( port, InPort ):
+          for impl_port in impl_ports:
+            s.connect( port, impl_port )
+        else:
+          s._routes.append( ( port, impl_ports ) )
+
+  #---------------------------------------------------------------------
+  # levels
+  #---------------------------------------------------------------------
+  @property
+  def levels( s ):
+    return list( s._levels )
+
+  @property
+  def level( s ):
+    return s._levels[ s._active ]
+
+  #---------------------------------------------------------------------
+  # get_impl
+  #---------------------------------------------------------------------
+  # Return the implementation for level, or the active implementation.
+  def get_impl( s, level=None ):
+    if level is None:
+      return s.impls[ s._active ]
+    try:
+      return s.impls[ s._levels.index( level ) ]
+    except ValueError:
+      raise PyMTLError( "Unknown level '{}', expected one of {}!"
+                        "".format( level, ', '.join( s._levels ) ) )
+
+  def line_trace( s ):
+    return s.get_impl().line_trace()
+
+#-----------------------------------------------------------------------
+# Port Interface Helpers
+#-----------------------------------------------------------------------
+
+def _is_port( value ):
+  if isinstance( value, list ):
+    return bool( value ) and all( _is_port( x ) for x in value )
+  return isinstance( value, ( InPort, OutPort, PortBundle ) )
+
+# Public ports of an unelaborated model, sorted by name.
+
+def _get_interface( model ):
+  return [ ( name, value ) for name, value in sorted( vars( model ).items() )
+           if not name.startswith( '_' ) and name not in ( 'clk', 'reset' )
+           and _is_port( value ) ]
+
+def _get_interface_signature( model ):
+  return [ ( path, type( port ), port.nbits )
+           for name, value in _get_interface( model )
+           for path, port in _get_leaves( value, name ) ]
+
+# All ports in a port, bundle or list of ports, along with their path
+# relative to the model, e.g. ( 'in_[0].msg', port ).
+
+def _get_leaves( value, path ):
+  if isinstance( value, list ):
+    for i, x in enumerate( value ):
+      for leaf in _get_leaves( x, '{}[{}]'.format( path, i ) ):
+        yield leaf
+  elif isinstance( value, PortBundle ):
+    for name, port in sorted( vars( value ).items() ):
+      if isinstance( port, ( InPort, OutPort ) ):
+        yield '{}.{}'.format( path, name ), port
+  else:
+    yield path, value
+
+def _get_leaf( model, path ):
+  obj = model
+  for part in path.replace( ']', '' ).replace( '[', '.' ).split( '.' ):
+    obj = obj[ int( part ) ] if part.isdigit() else getattr( obj, part )
+  return obj
+
+# Create new, unconnected ports with the same types and direction.
+
+def _copy_ports( value ):
+  if isinstance( value, list ):
+    return [ _copy_ports( x ) for x in value ]
+  if isinstance( value, PortBundle ):
+    bundle = object.__new__( type( value ) )
+    for name, port in vars( value ).items():
+      if isinstance( port, ( InPort, OutPort ) ):
+        setattr( bundle, name, type( port )( port.dtype ) )
+        getattr( bundle, name ).name = name
+    bundle._ports = sorted( ( p for p in vars( bundle ).values() ),
+                            key=lambda x: x.name )
+    return bundle
+  return type( value )( value.dtype )
+
+#-----------------------------------------------------------------------
+# get_swappable_models
+#-----------------------------------------------------------------------
+# All SwappableModels in the hierarchy of model.
+def get_swappable_models( model ):
+  found = [ model ] if isinstance( model, SwappableModel ) else []
+  for sub in model.get_submodules():
+    found.extend( get_swappable_models( sub ) )
+  return found
+
+#-----------------------------------------------------------------------
+# get_models
+#-----------------------------------------------------------------------
+# The set of all models in the hierarchy of model.
+def get_models( model ):
+  models = set([ model ])
+  for sub in model.get_submodules():
+    models |= get_models( sub )
+  return models
+
+#-----------------------------------------------------------------------
+# get_inactive_models
+#-----------------------------------------------------------------------
+# All models in the hierarchies of inactive implementations.
+def get_inactive_models( model ):
+  inactive = set()
+  for swappable in get_swappable_models( model ):
+    for impl in swappable.impls:
+      if impl is not swappable.get_impl():
+        inactive |= get_models( impl )
+  return inactive
+
+#-----------------------------------------------------------------------
+# create_route_callbacks
+#-----------------------------------------------------------------------
+# Create the callbacks which copy the outputs of the active
+# implementation of each SwappableModel to its outputs. Like slice
+# callbacks, they are called whenever their source changes. Returns the
+# callbacks and a dict mapping each implementation to its callbacks.
+def create_route_callbacks( model, event_queue ):
+
+  routes = []
+  impl_routes = {}
+
+  for swappable in get_swappable_models( model ):
+    for port, impl_ports in swappable._routes:
+      dest = port._signalvalue
+      for idx, ( impl, impl_port ) in enumerate( zip( swappable.impls,
+                                                      impl_ports ) ):
+        func_ptr     = _create_route_cb_closure( swappable, idx, impl_port,
+                                                 port, dest )
+        signal_value = impl_port._signalvalue
+        signal_value.register_slice( func_ptr )
+        func_ptr.id  = event_queue.get_id()
+        func_ptr.cb  = func_ptr
+        event_queue.enq( func_ptr.cb, func_ptr.id )
+        routes.append( func_ptr )
+        impl_routes.setdefault( impl, [] ).append( func_ptr )
+
+  return routes, impl_routes
+
+def _create_route_cb_closure( swappable, idx, impl_port, port, dest ):
+  src = impl_port._signalvalue
+  def route_cb():
+    if swappable._active == idx:
+      dest.v = src
+  route_cb._senses = [ src  ]
+  route_cb._stores = [ dest ]
+  route_cb._dest   = port
+  return route_cb
+
+#-----------------------------------------------------------------------
+# set_comb_blocks_enabled
+#-----------------------------------------------------------------------
+# Enable or disable the combinational blocks of the provided models by
+# (un)registering them with the signals in their sensitivity lists.
+# Enabled blocks are placed on the event queue since their inputs may
+# have changed while they were disabled, disabled blocks are removed
+# from it.
+def set_comb_blocks_enabled( models, enabled, event_queue ):
+  for m in models:
+    for func, senses in m._newsenses.items():
+      for svalue in senses:
+        if func in svalue._callbacks:
+          svalue._callbacks = [ x for x in svalue._callbacks if x is not func ]
+      if enabled:
+        for svalue in senses:
+          svalue.register_callback( func )
+        event_queue.enq( func.cb, func.id )
+      else:
+        event_queue.discard( func.cb, func.id )
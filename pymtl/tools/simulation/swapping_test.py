@@ -0,0 +1,245 @@
+#=======================================================================
+# swapping_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl      import *
+from pymtl      import PyMTLError
+from pclib.ifcs import InValRdyBundle, OutValRdyBundle
+from pclib.test import TestSource, TestSink
+
+#-----------------------------------------------------------------------
+# AccumCL
+#-----------------------------------------------------------------------
+# Outputs the running sum of all input messages. The sum is kept in a
+# Python integer.
+class AccumCL( Model ):
+
+  def __init__( s ):
+
+    s.in_  = InValRdyBundle ( 16 )
+    s.out  = OutValRdyBundle( 16 )
+    s.acc  = 0
+    s.nticks = 0
+
+    @s.combinational
+    def comb():
+      s.in_.rdy.value = ~s.out.val | s.out.rdy
+
+    @s.tick_cl
+    def tick():
+      s.nticks += 1
+      if s.reset:
+        s.acc = 0
+        s.out.val.next = 0
+      elif s.in_.val and s.in_.rdy:
+        s.acc = ( s.acc + int( s.in_.msg ) ) & 0xffff
+        s.out.msg.next = s.acc
+        s.out.val.next = 1
+      elif s.out.rdy:
+        s.out.val.next = 0
+
+  def transfer_state( s, rtl ):
+    s.acc           = int( rtl.acc )
+    s.out.msg.value = rtl.out.msg
+    s.out.val.value = rtl.out.val
+
+#-----------------------------------------------------------------------
+# AccumRTL
+#-----------------------------------------------------------------------
+class AccumRTL( Model ):
+
+  def __init__( s ):
+
+    s.in_  = InValRdyBundle ( 16 )
+    s.out  = OutValRdyBundle( 16 )
+    s.acc  = Wire( 16 )
+    s.sum  = Wire( 16 )
+
+    @s.combinational
+    def comb():
+      s.in_.rdy.value = ~s.out.val | s.out.rdy
+      s.sum.value     = s.acc + s.in_.msg
+
+    @s.posedge_clk
+    def seq():
+      if s.reset:
+        s.acc.next     = 0
+        s.out.val.next = 0
+      elif s.in_.val and s.in_.rdy:
+        s.acc.next     = s.sum
+        s.out.msg.next = s.sum
+        s.out.val.next = 1
+      elif s.out.rdy:
+        s.out.val.next = 0
+
+  def transfer_state( s, cl ):
+    s.acc.value     = cl.acc
+    s.out.msg.value = cl.out.msg
+    s.out.val.value = cl.out.val
+
+#-----------------------------------------------------------------------
+# TestHarness
+#-----------------------------------------------------------------------
+class TestHarness( Model ):
+
+  def __init__( s, level ):
+
+    msgs = range( 1, 41 )
+    sums = [ sum( msgs[:i+1] ) for i in range( len( msgs ) ) ]
+
+    s.src   = TestSource( 16, msgs, 2 )
+    s.accum = SwappableModel([ ( 'cl',  AccumCL()  ),
+                               ( 'rtl', AccumRTL() ) ], level )
+    s.sink  = TestSink  ( 16, sums, 2 )
+
+    s.connect( s.src.out,   s.accum.in_ )
+    s.connect( s.accum.out, s.sink.in_  )
+
+  def done( s ):
+    return s.src.done and s.sink.done
+
+  def line_trace( s ):
+    return "{} ({}) {}".format( s.src.line_trace(), s.accum.level,
+                                s.sink.line_trace() )
+
+#-----------------------------------------------------------------------
+# test_swap
+#-----------------------------------------------------------------------
+@pytest.mark.parametrize( 'sched', [ 'event', 'static', 'compiled' ] )
+def test_swap( sched ):
+
+  model = TestHarness( 'cl' )
+  model.vcd_file = ''
+  model.elaborate()
+  sim = SimulationTool( model, sched=sched )
+  sim.reset()
+
+  cl, rtl = model.accum.impls
+  assert model.accum.levels == [ 'cl', 'rtl' ]
+
+  # Alternate between both implementations, the sink checks that the
+  # running sum is not disturbed by any of the swaps
+
+  levels = [ 'cl', 'rtl' ]
+  while not model.done() and sim.ncycles < 500:
+    if sim.ncycles % 7 == 0:
+      sim.swap( model.accum, levels[ ( sim.ncycles // 7 ) % 2 ] )
+    level  = model.accum.level
+    nticks = cl.nticks
+    acc    = int( rtl.acc )
+    sim.cycle()
+    if level == 'rtl':
+      assert cl.nticks == nticks
+    else:
+      assert int( rtl.acc ) == acc
+
+  assert model.done()
+
+#-----------------------------------------------------------------------
+# test_swap_transfer
+#-----------------------------------------------------------------------
+# An explicit transfer function replaces the transfer_state() hook.
+def test_swap_transfer():
+
+  model = TestHarness( 'rtl' )
+  model.vcd_file = ''
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  for i in range( 20 ):
+    sim.cycle()
+
+  calls = []
+  def transfer( old, new ):
+    calls.append( ( old, new ) )
+    new.transfer_state( old )
+
+  sim.swap( model.accum, 'cl', transfer=transfer )
+  sim.swap( model.accum, 'cl', transfer=transfer )
+  assert calls == [ tuple( reversed( model.accum.impls ) ) ]
+
+  while not model.done() and sim.ncycles < 500:
+    sim.cycle()
+  assert model.done()
+
+#-----------------------------------------------------------------------
+# test_swap_checkpoint
+#-----------------------------------------------------------------------
+# Restoring a checkpoint also restores the active implementations.
+@pytest.mark.parametrize( 'sched', [ 'event', 'compiled' ] )
+def test_swap_checkpoint( tmpdir, sched ):
+
+  path = str( tmpdir.join( 'cl.ckpt' ) )
+
+  model = TestHarness( 'cl' )
+  model.vcd_file = ''
+  model.elaborate()
+  sim = SimulationTool( model, sched=sched )
+  sim.reset()
+  for i in range( 10 ):
+    sim.cycle()
+
+  sim.checkpoint( path )
+  sim.swap( model.accum, 'rtl' )
+  for i in range( 5 ):
+    sim.cycle()
+
+  sim.restore( path )
+  assert model.accum.level == 'cl'
+  while not model.done() and sim.ncycles < 500:
+    sim.cycle()
+  assert model.done()
+
+#-----------------------------------------------------------------------
+# test_inactive_blocks
+#-----------------------------------------------------------------------
+# The combinational blocks of inactive implementations are never
+# evaluated, not even when the simulator is primed, and the pending
+# blocks of an implementation are dropped when it is swapped out.
+class Incr( Model ):
+
+  def __init__( s ):
+    s.in_   = InPort ( 8 )
+    s.out   = OutPort( 8 )
+    s.nevals = 0
+
+    @s.combinational
+    def comb():
+      s.nevals += 1
+      s.out.value = s.in_ + 1
+
+@pytest.mark.parametrize( 'sched', [ 'event', 'static', 'compiled' ] )
+def test_inactive_blocks( sched ):
+
+  model = SwappableModel([ ( 'cl', Incr() ), ( 'rtl', Incr() ) ], 'rtl' )
+  model.elaborate()
+  sim = SimulationTool( model, sched=sched )
+  cl, rtl = model.impls
+
+  sim.eval_combinational()
+  assert ( cl.nevals, rtl.nevals ) == ( 0, 1 )
+
+  model.in_.value = 4
+  sim.swap( model, 'cl' )
+  sim.eval_combinational()
+  assert ( cl.nevals, rtl.nevals ) == ( 1, 1 )
+  assert model.out == 5
+
+
+class Narrow( Model ):
+  def __init__( s ):
+    s.in_ = InValRdyBundle ( 8 )
+    s.out = OutValRdyBundle( 16 )
+
+def test_swap_errors():
+
+  with pytest.raises( PyMTLError ):
+    SwappableModel([ ( 'cl', AccumCL() ), ( 'rtl', Narrow() ) ])
+
+  model = SwappableModel([ ( 'cl', AccumCL() ), ( 'rtl', AccumRTL() ) ])
+  model.elaborate()
+  sim = SimulationTool( model )
+  with pytest.raises( PyMTLError ):
+    sim.swap( model, 'fl' )
@@ -7,6 +7,16 @@
 # - http://support.ema-eda.com/search/eslfiles/default/main/sl_legacy_releaseinfo/staging/sl3/release_info/psd142/vlogref/chap20.html#1031979
 # - http://staff.ustc.edu.cn/~songch/download/IEEE.1364-2005.pdf
 #
+# Which nets are dumped can be restricted by setting attributes on the
+# top-level model before creating the simulator:
+#
+#   model.vcd_file    = 'trace.vcd.gz'        # gzip compressed output
+#   model.vcd_signals = [ 'top.core.*.pc' ]   # glob patterns
+#   model.vcd_cycles  = ( 10000, 11000 )      # dump window [start, stop)
+#
+# Output is written after every cycle, see get_vcd_flush_cycles for
+# buffering more cycles per write.
+#
 # TODO:
 #
 # - distinguish reg signals from wire signals (maybe)
@@ -15,6 +25,15 @@ from __future__ import print_function
 
 import time
 import sys
+import atexit
+import weakref
+import threading
+import Queue
+import gzip
+
+from fnmatch import fnmatchcase
+
+from ...datatypes.Bits import Bits
 
 #-----------------------------------------------------------------------
 # get_vcd_timescale
@@ -26,6 +45,38 @@ def get_vcd_timescale( model ):
   except AttributeError:
     return DEFAULT_TIMESCALE
 
+#-----------------------------------------------------------------------
+# get_vcd_flush_cycles / get_vcd_threaded
+#-----------------------------------------------------------------------
+# VCD output is written every vcd_flush_cycles cycles, by default after
+# every cycle so that the .vcd file is complete up to the last cycle
+# even if the simulation fails. Larger values (e.g., 64) buffer more
+# cycles per write, the buffered cycles are written when the writer is
+# closed, at the latest at exit. With vcd_threaded set, the writes
+# happen on a background thread.
+DEFAULT_FLUSH_CYCLES = 1
+def get_vcd_flush_cycles( model ):
+  return getattr( model, 'vcd_flush_cycles', DEFAULT_FLUSH_CYCLES )
+
+def get_vcd_threaded( model ):
+  return getattr( model, 'vcd_threaded', False )
+
+#-----------------------------------------------------------------------
+# get_vcd_signals / get_vcd_cycles
+#-----------------------------------------------------------------------
+# Glob patterns selecting the dumped signals by hierarchical name (e.g.
+# 'top.core.*.pc'), and the window of cycles [start, stop) to dump.
+# Both default to None, dumping all signals during all cycles.
+
+def get_vcd_signals( model ):
+  signals = getattr( model, 'vcd_signals', None )
+  if isinstance( signals, str ):
+    signals = [ signals ]
+  return signals
+
+def get_vcd_cycles( model ):
+  return getattr( model, 'vcd_cycles', None )
+
 #-----------------------------------------------------------------------
 # write_vcd_header
 #-----------------------------------------------------------------------
@@ -60,20 +111,35 @@ def mangle_name( name ):
 #-----------------------------------------------------------------------
 # write_vcd_signal_defs
 #-----------------------------------------------------------------------
-def write_vcd_signal_defs( o, model ):
+#
+# If signals is provided, only the signals whose hierarchical name (e.g.
+# 'top.core.pc') matches one of the glob patterns are defined, and only
+# their nets are returned. The clock of the top-level model is always
+# defined since it is used to advance the time.
+def write_vcd_signal_defs( o, model, signals=None ):
 
   vcd_symbol = _gen_vcd_symbol()
   all_nets   = set()
+  top        = model
+
+  def is_selected( model, signal, path ):
+    if signals is None or ( model is top and signal.name == 'clk' ):
+      return True
+    return any( fnmatchcase( path, p ) for p in signals )
 
   # Inner utility function to perform recursive descent of the model.
-  def recurse_models( model, level ):
+  # Returns the lines defining the scope of the model, or an empty list
+  # if no signal in its hierarchy was selected.
+  def recurse_models( model, path ):
 
-    # Create a new scope for this module
-    print( "$scope module {name} $end".format( name=model.name ), file=o )
+    lines = []
 
-    # Define all signals for this model.
+    # Define all selected signals for this model.
     for i in model.get_ports() + model.get_wires():
 
+      if not is_selected( model, i, path + '.' + i.name ):
+        continue
+
       # Multiple signals may be collapsed into a single net in the
       # simulator if they are connected. Generate new vcd symbols per
       # net, not per signal as an optimization.
@@ -83,20 +149,25 @@ def write_vcd_signal_defs( o, model ):
         net._vcd_is_clk = i.name == 'clk'
       symbol = net._vcd_symbol
 
-      print( "$var {type} {nbits} {symbol} {name} $end".format(
+      lines.append( "$var {type} {nbits} {symbol} {name} $end".format(
           type='reg', nbits=i.nbits, symbol=symbol, name=mangle_name(i.name),
-      ), file=o )
+      ) )
 
       all_nets.add( net )
 
     # Recursively visit all submodels.
     for submodel in model.get_submodules():
-      recurse_models( submodel, level+1 )
+      lines.extend( recurse_models( submodel, path + '.' + submodel.name ) )
 
-    print( "$upscope $end", file=o )
+    # Create a new scope for this module
+    if not lines:
+      return []
+    return ( [ "$scope module {name} $end".format( name=model.name ) ]
+             + lines + [ "$upscope $end" ] )
 
   # Begin recursive descent from the top-level model.
-  recurse_models( model, 0 )
+  for line in recurse_models( model, model.name ):
+    print( line, file=o )
 
   # Once all models and their signals have been defined, end the
   # definition section of the vcd and print the initial values of all
@@ -104,44 +175,274 @@ def write_vcd_signal_defs( o, model ):
   print( "$enddefinitions $end\n", file=o )
   for net in all_nets:
     print( "b{value} {symbol}".format(
-        value=net.bin(), symbol=net._vcd_symbol,
+        value=_vcd_value( net ), symbol=net._vcd_symbol,
     ), file=o )
 
   return all_nets
 
 #-----------------------------------------------------------------------
-# insert_vcd_callbacks
+# get_vcd_formatter
 #-----------------------------------------------------------------------
-# Add callbacks which write the vcd file for each net in the design.
-def insert_vcd_callbacks( sim, nets ):
-
-  # A utility function which creates callbacks that write a nets current
-  # value to the vcd file. The returned callback function is a closure
-  # which is executed by the simulator whenever the net's value changes.
-  def create_vcd_callback( sim, net ):
+# Return a function converting the raw unsigned value of an nbits wide
+# net into its binary VCD representation. Formatters are cached per
+# width, narrow widths use a lookup table of all possible values.
+_vcd_formatters = {}
+def get_vcd_formatter( nbits ):
+  try:
+    return _vcd_formatters[ nbits ]
+  except KeyError:
+    spec = '0{}b'.format( nbits )
+    if nbits <= 8:
+      fmt = [ format( v, spec ) for v in range( 2**nbits ) ].__getitem__
+    else:
+      fmt = lambda v: format( v, spec )
+    _vcd_formatters[ nbits ] = fmt
+    return fmt
 
-    # Each signal writes its binary value and unique identifier to the
-    # specified vcd file
-    if not net._vcd_is_clk:
-      cb = lambda: print( 'b%s %s\n' % (net.bin(), net._vcd_symbol),
-                          file=sim.vcd )
+def _vcd_value( net ):
+  if isinstance( net, Bits ):
+    return get_vcd_formatter( net.nbits )( net._uint )
+  value = net.bin()
+  return value[2:] if value.startswith( '0b' ) else value
 
-    # The clock signal additionally must update the vcd time stamp
+#-----------------------------------------------------------------------
+# _VCDOutput
+#-----------------------------------------------------------------------
+# Destination of the VCD text. Chunks are buffered and either written
+# directly or, if threaded, handed to a background thread which does the
+# writing. The output does not reference the simulator, so it is closed
+# (and any remaining chunks are written) once the VCDWriter using it is
+# garbage collected, or at exit. The VCDWriter itself is part of the
+# reference cycles of the simulator and cannot have a __del__, it emits
+# its changes at the end of each cycle instead.
+class _VCDOutput( object ):
+
+  def __init__( self, outfile, threaded, close_file=False ):
+    self.outfile    = outfile
+    self.close_file = close_file
+    self.chunks     = []
+    self.queue   = None
+    self.thread  = None
+    if threaded:
+      self.queue  = Queue.Queue( maxsize=64 )
+      self.thread = threading.Thread( target=self._write_chunks,
+                                      args=( self.queue, outfile ) )
+      self.thread.daemon = True
+      self.thread.start()
+    _vcd_outputs.add( self )
+
+  @staticmethod
+  def _write_chunks( queue, outfile ):
+    while True:
+      chunk = queue.get()
+      if chunk is None:
+        outfile.flush()
+        return
+      outfile.write( chunk )
+
+  def flush( self ):
+    if not self.chunks:
+      return
+    chunk = ''.join( self.chunks )
+    del self.chunks[:]
+    if self.queue is not None:
+      self.queue.put( chunk )
     else:
-      cb = lambda: print( '#%s\nb%s %s\n' % (100*sim.ncycles+50*net.uint(),
-                          net.bin(), net._vcd_symbol),
-                          file=sim.vcd )
+      self.outfile.write( chunk )
+
+  def close( self ):
+    if self.outfile is None:
+      return
+    self.flush()
+    if self.thread is not None:
+      self.queue.put( None )
+      self.thread.join()
+    if self.close_file:
+      self.outfile.close()
+    else:
+      self.outfile.flush()
+    self.outfile = None
+    _vcd_outputs.discard( self )
+
+  def __del__( self ):
+    self.close()
+
+_vcd_outputs = weakref.WeakSet()
+_vcd_writers = weakref.WeakSet()
 
-    # Return the callback
-    return cb
+# Writers still alive at exit (e.g., if the simulation raised an
+# exception mid-cycle) emit the changes of their current time step first
 
-  # For each net in the simulator, create a callback and register it with
-  # the net to be fired whenever the value changes. We repurpose the
-  # existing callback facilities designed for slices (these execute
-  # immediately), rather than the default callback mechanism (these are
-  # put on the event queue to execute later).
-  for net in nets:
-    net.register_slice( create_vcd_callback( sim, net ) )
+@atexit.register
+def _close_vcd_outputs():
+  for writer in list( _vcd_writers ):
+    writer.close()
+  for output in list( _vcd_outputs ):
+    output.close()
+
+#-----------------------------------------------------------------------
+# VCDWriter
+#-----------------------------------------------------------------------
+# Writes value changes of all nets in the design to the VCD output.
+#
+# Value changes are only recorded as they happen: the first change of a
+# net in a time step appends its index to a list of changed nets. When
+# the clock toggles (which starts a new time step) and at the end of
+# each cycle (see end_cycle), the current values of all changed nets are
+# formatted at once and appended to a buffer, which is written with a
+# single write every flush_cycles cycles.
+#
+# If cycles is provided, only the time steps of the cycles in the window
+# [start, stop) are dumped. The values of all nets are dumped when the
+# window starts (unless it starts with the initial values).
+class VCDWriter( object ):
+
+  def __init__( self, sim, output, nets, flush_cycles=1, cycles=None ):
+
+    self.sim          = sim
+    self.output       = output
+    self.flush_cycles = max( 1, flush_cycles )
+
+    self.start, self.stop = cycles if cycles else ( 0, float( 'inf' ) )
+    self.dumping          = self.start <= sim.ncycles < self.stop
+
+    self.nets    = [ net for net in nets if not net._vcd_is_clk ]
+    self.symbols = [ net._vcd_symbol for net in self.nets ]
+    self.clocks  = [ net for net in nets if net._vcd_is_clk ]
+
+    self.dirty   = bytearray( len( self.nets ) )
+    self.changed = []
+    self.chunks  = output.chunks
+    self.nedges  = 0
+
+    _vcd_writers.add( self )
+
+  #---------------------------------------------------------------------
+  # register_callbacks
+  #---------------------------------------------------------------------
+  # For each net in the simulator, register a callback which is fired
+  # whenever its value changes. We repurpose the existing callback
+  # facilities designed for slices (these execute immediately), rather
+  # than the default callback mechanism (these are put on the event
+  # queue to execute later).
+  def register_callbacks( self ):
+
+    dirty          = self.dirty
+    changed_append = self.changed.append
+
+    def create_vcd_callback( i ):
+      def vcd_cb():
+        if not dirty[ i ]:
+          dirty[ i ] = 1
+          changed_append( i )
+      return vcd_cb
+
+    for i, net in enumerate( self.nets ):
+      net.register_slice( create_vcd_callback( i ) )
+
+    for net in self.clocks:
+      net.register_slice( self._create_clock_callback( net ) )
+
+  # The clock signal additionally starts a new time step
+
+  def _create_clock_callback( self, net ):
+    def vcd_clock_cb():
+
+      if self.dumping:
+        self.emit_changes()
+      else:
+        self.discard_changes()
+
+      ncycles = self.sim.ncycles
+      dumping = self.start <= ncycles < self.stop
+
+      if not dumping:
+        if self.dumping:
+          self.flush()
+        self.dumping = False
+        return
+
+      if not self.dumping:
+        self.dumping = True
+        self.changed[:] = range( len( self.nets ) )
+        self.dirty[:]   = bytearray( '\x01' ) * len( self.nets )
+
+      value = net._uint
+      self.chunks.append( '#%d\nb%d %s\n' % ( 100*ncycles + 50*value,
+                                               value, net._vcd_symbol ) )
+      if value:
+        self.nedges += 1
+
+    return vcd_clock_cb
+
+  #---------------------------------------------------------------------
+  # end_cycle
+  #---------------------------------------------------------------------
+  # Called by the simulator at the end of each cycle. Formats the changes
+  # made by the sequential logic right away, so that they reach the
+  # output even if the writer is never closed, and writes the buffered
+  # chunks every flush_cycles cycles.
+  def end_cycle( self ):
+
+    if not self.dumping:
+      self.discard_changes()
+      return
+
+    self.emit_changes()
+    if self.nedges % self.flush_cycles == 0:
+      self.flush()
+
+  #---------------------------------------------------------------------
+  # emit_changes
+  #---------------------------------------------------------------------
+  # Format the values of all nets changed in the current time step.
+  def emit_changes( self ):
+
+    if not self.changed:
+      return
+
+    nets, symbols, dirty = self.nets, self.symbols, self.dirty
+    lines = []
+    for i in self.changed:
+      dirty[ i ] = 0
+      lines.append( 'b%s %s\n' % ( _vcd_value( nets[ i ] ), symbols[ i ] ) )
+
+    self.chunks.append( ''.join( lines ) )
+    del self.changed[:]
+
+  # Forget the changes of the current time step (outside of the window).
+
+  def discard_changes( self ):
+    dirty = self.dirty
+    for i in self.changed:
+      dirty[ i ] = 0
+    del self.changed[:]
+
+  #---------------------------------------------------------------------
+  # flush / close
+  #---------------------------------------------------------------------
+  # Write all buffered chunks with a single write. close() additionally
+  # emits the changes of the current time step and closes the output.
+
+  def flush( self ):
+    self.output.flush()
+
+  def close( self ):
+    if self.dumping:
+      self.emit_changes()
+    self.output.close()
+    _vcd_writers.discard( self )
+
+#-----------------------------------------------------------------------
+# insert_vcd_callbacks
+#-----------------------------------------------------------------------
+# Add callbacks which write the vcd file for each net in the design.
+def insert_vcd_callbacks( sim, nets, flush_cycles=1, threaded=False,
+                          cycles=None, close_file=False ):
+  writer = VCDWriter( sim, _VCDOutput( sim.vcd, threaded, close_file ), nets,
+                      flush_cycles, cycles )
+  writer.register_callbacks()
+  return writer
 
 #-----------------------------------------------------------------------
 # _gen_vcd_symbol
@@ -180,21 +481,28 @@ class VCDUtil():
 
   def __init__(self, simulator, outfile=None):
 
-    # Select the output for VCD
+    # Select the output for VCD, file names ending in .gz are written
+    # gzip compressed
 
+    close_file = False
     if not outfile:
       outfile = sys.stdout
     elif isinstance(outfile, str):
-      outfile = open( outfile, 'w' )
-    else:
-      outfile = outfile
+      close_file = True
+      if outfile.endswith( '.gz' ):
+        outfile = gzip.open( outfile, 'wb' )
+      else:
+        outfile = open( outfile, 'w' )
 
     # Write out vcd header, signal definitions, and initial state
 
-    write_vcd_header( outfile, simulator.model )
-    nets = write_vcd_signal_defs( outfile, simulator.model )
+    model = simulator.model
+    write_vcd_header( outfile, model )
+    nets = write_vcd_signal_defs( outfile, model, get_vcd_signals( model ) )
 
     # Enable vcd mode on the simulator, set simulator output file name
 
-    simulator.vcd = outfile
-    insert_vcd_callbacks( simulator, nets )
+    simulator.vcd        = outfile
+    simulator.vcd_writer = insert_vcd_callbacks( simulator, nets,
+      get_vcd_flush_cycles( model ), get_vcd_threaded( model ),
+      get_vcd_cycles( model ), close_file )
@@ -37,3 +37,270 @@ def local_setup_sim( model ):
 
   sim = SimulationTool( model )
   return model, sim
+
+#=======================================================================
+# VCDWriter Tests
+#=======================================================================
+
+import gc
+import pytest
+
+from sys      import flags
+from StringIO import StringIO
+from pymtl    import *
+
+# The clock is only toggled (and hence time only advances in the VCD) by
+# the dev (non -O) cycle
+
+requires_dev_cycle = pytest.mark.skipif( flags.optimize,
+                                         reason='requires dev cycle' )
+
+class Counter( Model ):
+
+  def __init__( s, nbits ):
+
+    s.en    = InPort ( 1 )
+    s.out   = OutPort( nbits )
+    s.wide  = OutPort( 3*nbits )
+
+    @s.posedge_clk
+    def seq():
+      if s.reset:
+        s.out.next = 0
+      elif s.en:
+        s.out.next = s.out + 1
+
+    @s.combinational
+    def comb():
+      s.wide.value = concat( s.out, s.out, s.out )
+
+class Pair( Model ):
+
+  def __init__( s ):
+
+    s.en = InPort( 1 )
+    s.c  = [ Counter( 8 ) for i in range( 2 ) ]
+
+    for c in s.c:
+      s.connect( s.en, c.en )
+
+# Parse a vcd dump. Returns a dict mapping the hierarchical names of all
+# defined signals to their symbols, and the dumped value changes as a
+# list of ( time, { symbol : value } ) tuples.
+
+def parse_vcd( text ):
+
+  header, body = text.split( '$enddefinitions $end' )
+
+  scopes, names = [], {}
+  for line in header.splitlines():
+    fields = line.split()
+    if line.startswith( '$scope' ):
+      scopes.append( fields[2] )
+    elif line.startswith( '$upscope' ):
+      scopes.pop()
+    elif line.startswith( '$var' ):
+      names[ '.'.join( scopes + [ fields[4] ] ) ] = fields[3]
+
+  dumps = [ ( 0, {} ) ]
+  for line in body.splitlines():
+    if line.startswith( '#' ):
+      dumps.append( ( int( line[1:] ), {} ) )
+    elif line.startswith( 'b' ):
+      value, symbol = line[1:].split()
+      dumps[-1][1][ symbol ] = value
+
+  return names, dumps
+
+# Run the model for ncycles, toggling its enable input.
+
+def run_model( model, ncycles=300, **kwargs ):
+
+  for name, value in kwargs.items():
+    setattr( model, name, value )
+  model.elaborate()
+
+  sim = SimulationTool( model )
+  sim.reset()
+  for i in range( ncycles ):
+    model.en.value = i % 3 != 0
+    sim.cycle()
+  sim.vcd_writer.close()
+
+def dump_counter( **kwargs ):
+
+  model = Counter( 8 )
+  model.vcd_file = StringIO()
+  run_model( model, **kwargs )
+
+  names, dumps = parse_vcd( model.vcd_file.getvalue() )
+  symbols = { 'out' : names['top.out'],
+              'wide': names['top.wide'],
+              'en'  : names['top.en'] }
+  return dumps, symbols
+
+#-----------------------------------------------------------------------
+# test_vcd_writer
+#-----------------------------------------------------------------------
+@requires_dev_cycle
+@pytest.mark.parametrize( 'flush_cycles,threaded', [
+  ( 1, False ), ( 64, False ), ( 7, True )
+])
+def test_vcd_writer( flush_cycles, threaded ):
+
+  dumps, sym = dump_counter( vcd_flush_cycles=flush_cycles,
+                             vcd_threaded=threaded )
+
+  # Timestamps advance by half a clock period
+
+  times = [ t for t, changes in dumps[1:] ]
+  assert times == range( 50, 50*len( times ) + 50, 50 )
+
+  # Values are dumped without prefix, and only when they change
+
+  out = {}
+  for t, changes in dumps:
+    assert all( not v.startswith( '0b' ) for v in changes.values() )
+    if sym['out'] in changes:
+      out[ t ] = int( changes[ sym['out'] ], 2 )
+      assert changes[ sym['wide'] ] == changes[ sym['out'] ] * 3
+
+  values = [ v for t, v in sorted( out.items() ) ]
+  assert values == range( len( values ) )
+  assert values[-1] == 200
+
+#-----------------------------------------------------------------------
+# test_vcd_writer_buffering
+#-----------------------------------------------------------------------
+# Buffered and threaded output must be identical to unbuffered output.
+@requires_dev_cycle
+def test_vcd_writer_buffering():
+
+  expected = dump_counter( vcd_flush_cycles=1 )[0]
+  assert dump_counter( vcd_flush_cycles=64 )[0] == expected
+  assert dump_counter( vcd_flush_cycles=5, vcd_threaded=True )[0] == expected
+
+#-----------------------------------------------------------------------
+# test_vcd_writer_default_flush
+#-----------------------------------------------------------------------
+# By default every cycle is written at its end, larger buffers are
+# opt-in.
+@requires_dev_cycle
+def test_vcd_writer_default_flush():
+
+  model = Counter( 8 )
+  model.vcd_file = StringIO()
+  model.elaborate()
+
+  sim = SimulationTool( model )
+  sim.reset()
+  for i in range( 3 ):
+    sim.cycle()
+    times = [ t for t, changes in parse_vcd( model.vcd_file.getvalue() )[1] ]
+    assert times[-1] == 100*sim.ncycles - 50
+
+  model = Counter( 8 )
+  model.vcd_file         = StringIO()
+  model.vcd_flush_cycles = 64
+  model.elaborate()
+
+  sim = SimulationTool( model )
+  sim.reset()
+  sim.cycle()
+  assert len( parse_vcd( model.vcd_file.getvalue() )[1] ) == 1
+  sim.vcd_writer.close()
+  assert len( parse_vcd( model.vcd_file.getvalue() )[1] ) > 1
+
+#-----------------------------------------------------------------------
+# test_vcd_writer_unclosed
+#-----------------------------------------------------------------------
+# The changes of the last cycle reach the output without closing the
+# writer, and the file once the simulator is garbage collected.
+@requires_dev_cycle
+@pytest.mark.parametrize( 'sched', [ 'event', 'compiled' ] )
+def test_vcd_writer_unclosed( tmpdir, sched ):
+
+  def run( vcd_file ):
+    model = Counter( 8 )
+    model.vcd_file = vcd_file
+    model.elaborate()
+
+    sim = SimulationTool( model, sched=sched )
+    sim.reset()
+    model.en.value = 1
+    for i in range( 3 ):
+      sim.cycle()
+    return model, sim
+
+  model, sim = run( StringIO() )
+  names, dumps = parse_vcd( model.vcd_file.getvalue() )
+  time, changes = dumps[-1]
+  assert time == 100*sim.ncycles - 50
+  assert int( changes[ names['top.out'] ], 2 ) == model.out == 3
+
+  vcd_file = str( tmpdir.join( 'counter.vcd' ) )
+  del model, sim
+  run( vcd_file )
+  gc.collect()
+
+  names, dumps = parse_vcd( open( vcd_file ).read() )
+  time, changes = dumps[-1]
+  assert time == 450
+  assert int( changes[ names['top.out'] ], 2 ) == 3
+
+#-----------------------------------------------------------------------
+# test_vcd_signals
+#-----------------------------------------------------------------------
+# Only selected signals (and the clock) are defined and dumped.
+@requires_dev_cycle
+def test_vcd_signals():
+
+  model = Pair()
+  model.vcd_file = StringIO()
+  run_model( model, 20, vcd_signals=[ 'top.c[[]0].out', 'top.*.en' ] )
+
+  names, dumps = parse_vcd( model.vcd_file.getvalue() )
+  assert sorted( names ) == [ 'top.c[0].en', 'top.c[0].out', 'top.c[1].en',
+                              'top.clk' ]
+
+  symbols = set( names.values() )
+  assert len( symbols ) == 3
+  assert all( set( changes ) <= symbols for t, changes in dumps )
+
+  out = names[ 'top.c[0].out' ]
+  assert [ c[ out ] for t, c in dumps if out in c ][-1] == '{:08b}'.format( 13 )
+
+#-----------------------------------------------------------------------
+# test_vcd_cycles
+#-----------------------------------------------------------------------
+# Only the cycles in the window are dumped, starting with all values.
+@requires_dev_cycle
+def test_vcd_cycles():
+
+  dumps, sym = dump_counter( vcd_cycles=( 50, 60 ) )
+
+  times = [ t for t, changes in dumps[1:] ]
+  assert times == range( 5000, 6000, 50 )
+
+  assert set( dumps[1][1] ) >= set( sym.values() )
+
+  out = [ int( c[ sym['out'] ], 2 ) for t, c in dumps[1:] if sym['out'] in c ]
+  assert out == range( 32, 39 )
+
+#-----------------------------------------------------------------------
+# test_vcd_gzip
+#-----------------------------------------------------------------------
+@requires_dev_cycle
+def test_vcd_gzip( tmpdir ):
+
+  import gzip
+
+  for name in [ 'trace.vcd', 'trace.vcd.gz' ]:
+    model = Counter( 8 )
+    model.vcd_file = str( tmpdir.join( name ) )
+    run_model( model )
+
+  plain = tmpdir.join( 'trace.vcd' ).read()
+  assert parse_vcd( gzip.open( str( tmpdir.join( 'trace.vcd.gz' ) ) ).read() ) \
+      == parse_vcd( plain )
+  assert tmpdir.join( 'trace.vcd.gz' ).size() < len( plain ) / 4
@@ -0,0 +1,242 @@
+#=======================================================================
+# build_cache.py
+#=======================================================================
+# Persistent, content-addressed cache of build artifacts (e.g. the
+# verilated shared library and its Python wrapper), shared between all
+# working directories and all concurrently running processes.
+#
+# Each entry is a directory named by the hash of everything which
+# affects the build (see get_key). Entries are built in a private
+# temporary directory and installed with an atomic rename, builds of the
+# same key are serialized with a file lock so that concurrent processes
+# (e.g. pytest-xdist workers) build each entry only once. The cache is
+# kept below a maximum size by evicting the least recently used entries.
+#
+# The location and size of the cache can be configured with the
+# PYMTL_CACHE_DIR (default ~/.cache/pymtl) and PYMTL_CACHE_MAX_MB
+# (default 2048) environment variables.
+
+import os
+import errno
+import shutil
+import hashlib
+import tempfile
+import filecmp
+
+from contextlib import contextmanager
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+DEFAULT_CACHE_DIR    = os.path.join( '~', '.cache', 'pymtl' )
+DEFAULT_CACHE_MAX_MB = 2048
+
+# Mode of newly created files, mkstemp() creates private (0600) files
+
+_umask     = os.umask( 0 )
+os.umask( _umask )
+_file_mode = 0666 & ~_umask
+
+#-----------------------------------------------------------------------
+# get_key
+#-----------------------------------------------------------------------
+# Hash all parts (strings, or anything with a meaningful repr) into a
+# cache key.
+def get_key( *parts ):
+  h = hashlib.sha1()
+  for part in parts:
+    part = part if isinstance( part, str ) else repr( part )
+    h.update( '{}:'.format( len( part ) ) )
+    h.update( part )
+  return h.hexdigest()
+
+#-----------------------------------------------------------------------
+# BuildCache
+#-----------------------------------------------------------------------
+class BuildCache( object ):
+
+  def __init__( self, root, max_bytes ):
+    self.root      = os.path.abspath( os.path.expanduser( root ) )
+    self.max_bytes = max_bytes
+    _makedirs( os.path.join( self.root, 'locks' ) )
+
+  def get_entry_dir( self, key ):
+    return os.path.join( self.root, key[:2], key )
+
+  #---------------------------------------------------------------------
+  # lock
+  #---------------------------------------------------------------------
+  # Context manager holding an exclusive lock for key (or for the whole
+  # cache if key is None), blocking until it is acquired. Returns False
+  # instead of blocking if the lock is held elsewhere and wait is False.
+  @contextmanager
+  def lock( self, key=None, wait=True ):
+    path = os.path.join( self.root, 'locks', key or 'cache' )
+    with open( path + '.lock', 'a' ) as fd:
+      if fcntl is None:
+        yield True
+        return
+      try:
+        fcntl.flock( fd, fcntl.LOCK_EX | ( 0 if wait else fcntl.LOCK_NB ) )
+      except IOError as e:
+        if e.errno not in ( errno.EAGAIN, errno.EACCES ):
+          raise
+        yield False
+        return
+      try:
+        yield True
+      finally:
+        fcntl.flock( fd, fcntl.LOCK_UN )
+
+  #---------------------------------------------------------------------
+  # get
+  #---------------------------------------------------------------------
+  # Return the directory of the entry for key, or None on a miss. Hits
+  # mark the entry as most recently used.
+  def get( self, key ):
+    entry = self.get_entry_dir( key )
+    if not os.path.isdir( entry ):
+      return None
+    os.utime( entry, None )
+    return entry
+
+  #---------------------------------------------------------------------
+  # install
+  #---------------------------------------------------------------------
+  # Create the entry for key by calling build( build_dir ), which must
+  # write all artifacts into build_dir. The entry only becomes visible
+  # once build succeeded. Returns the directory of the entry.
+  def install( self, key, build ):
+
+    entry     = self.get_entry_dir( key )
+    build_dir = tempfile.mkdtemp( prefix='.build-', dir=self.root )
+    try:
+      build( build_dir )
+      _makedirs( os.path.dirname( entry ) )
+      try:
+        os.rename( build_dir, entry )
+      except OSError:
+        # Someone else installed the same entry first
+        if not os.path.isdir( entry ):
+          raise
+    finally:
+      if os.path.exists( build_dir ):
+        shutil.rmtree( build_dir, ignore_errors=True )
+
+    self.evict( keep=key )
+    return entry
+
+  #---------------------------------------------------------------------
+  # open_entry
+  #---------------------------------------------------------------------
+  # Context manager providing the directory of the entry for key,
+  # building it first on a miss. Concurrent users of the same key wait
+  # for a single build, and the entry is not evicted while in use.
+  @contextmanager
+  def open_entry( self, key, build ):
+    with self.lock( key ):
+      yield self.get( key ) or self.install( key, build )
+
+  #---------------------------------------------------------------------
+  # evict
+  #---------------------------------------------------------------------
+  # Remove the least recently used entries until the cache is no larger
+  # than max_bytes. Entries which are currently locked (being built or
+  # copied) and the entry keep are never removed.
+  def evict( self, keep=None ):
+
+    with self.lock():
+
+      entries = []
+      for prefix in os.listdir( self.root ):
+        if len( prefix ) != 2:
+          continue
+        for key in os.listdir( os.path.join( self.root, prefix ) ):
+          entry = os.path.join( self.root, prefix, key )
+          entries.append( ( os.stat( entry ).st_mtime, key,
+                            _get_size( entry ) ) )
+
+      total = sum( size for mtime, key, size in entries )
+      for mtime, key, size in sorted( entries ):
+        if total <= self.max_bytes:
+          break
+        if key == keep:
+          continue
+        with self.lock( key, wait=False ) as unused:
+          if unused:
+            shutil.rmtree( self.get_entry_dir( key ), ignore_errors=True )
+            total -= size
+
+#-----------------------------------------------------------------------
+# get_build_cache
+#-----------------------------------------------------------------------
+# The build cache configured by the environment, in subdirectory name.
+def get_build_cache( name ):
+  root      = os.environ.get( 'PYMTL_CACHE_DIR', DEFAULT_CACHE_DIR )
+  max_bytes = int( os.environ.get( 'PYMTL_CACHE_MAX_MB',
+                                   DEFAULT_CACHE_MAX_MB ) ) * 2**20
+  return BuildCache( os.path.join( root, name ), max_bytes )
+
+#-----------------------------------------------------------------------
+# install_file
+#-----------------------------------------------------------------------
+# Atomically replace dest with a copy of src, unless it is identical
+# already. Processes which still use (e.g. have dlopen'ed) the old file
+# are not affected. The copy gets the default mode of new files, plus
+# the execute permissions of src.
+def install_file( src, dest ):
+  if os.path.exists( dest ) and filecmp.cmp( src, dest, shallow=False ):
+    return
+  dest_dir = os.path.dirname( os.path.abspath( dest ) )
+  fd, temp = tempfile.mkstemp( prefix='.' + os.path.basename( dest ) + '.',
+                               dir=dest_dir )
+  os.close( fd )
+  try:
+    shutil.copy2( src, temp )
+    os.chmod( temp, _file_mode | ( os.stat( src ).st_mode & 0111 & ~_umask ) )
+    os.rename( temp, dest )
+  except:
+    os.remove( temp )
+    raise
+
+#-----------------------------------------------------------------------
+# write_file
+#-----------------------------------------------------------------------
+# Atomically replace dest with a file containing data, so that
+# concurrent processes never see a partially written file. The file
+# gets the default mode of new files (e.g. 0644).
+def write_file( dest, data ):
+  dest_dir = os.path.dirname( os.path.abspath( dest ) )
+  fd, temp = tempfile.mkstemp( prefix='.' + os.path.basename( dest ) + '.',
+                               dir=dest_dir )
+  try:
+    with os.fdopen( fd, 'w' ) as fp:
+      fp.write( data )
+    os.chmod( temp, _file_mode )
+    os.rename( temp, dest )
+  except:
+    os.remove( temp )
+    raise
+
+#-----------------------------------------------------------------------
+# Helpers
+#-----------------------------------------------------------------------
+
+def _makedirs( path ):
+  try:
+    os.makedirs( path )
+  except OSError:
+    if not os.path.isdir( path ):
+      raise
+
+def _get_size( path ):
+  size = 0
+  for dirpath, dirnames, filenames in os.walk( path ):
+    for filename in filenames:
+      try:
+        size += os.lstat( os.path.join( dirpath, filename ) ).st_size
+      except OSError:
+        pass
+  return size
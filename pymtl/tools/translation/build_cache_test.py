@@ -0,0 +1,187 @@
+#=======================================================================
+# build_cache_test.py
+#=======================================================================
+
+import os
+import pytest
+import multiprocessing
+
+from build_cache import BuildCache, get_key, install_file, write_file
+
+#-----------------------------------------------------------------------
+# Helpers
+#-----------------------------------------------------------------------
+
+def write( path, data ):
+  with open( path, 'w' ) as fp:
+    fp.write( data )
+
+def read( path ):
+  with open( path ) as fp:
+    return fp.read()
+
+def mk_build( data, log=None ):
+  def build( build_dir ):
+    if log is not None:
+      log.append( data )
+    write( os.path.join( build_dir, 'lib.so' ), data )
+  return build
+
+#-----------------------------------------------------------------------
+# test_get_key
+#-----------------------------------------------------------------------
+def test_get_key():
+  assert get_key( 'module', 'flags', True ) == get_key( 'module', 'flags', True )
+  assert get_key( 'module', 'flags', True ) != get_key( 'module', 'flags', False )
+  assert get_key( 'ab', 'c' ) != get_key( 'a', 'bc' )
+
+#-----------------------------------------------------------------------
+# test_open_entry
+#-----------------------------------------------------------------------
+def test_open_entry( tmpdir ):
+
+  cache = BuildCache( str( tmpdir.join( 'cache' ) ), 2**20 )
+  log   = []
+
+  for i in range( 3 ):
+    with cache.open_entry( get_key( 'a' ), mk_build( 'a', log ) ) as entry:
+      assert read( os.path.join( entry, 'lib.so' ) ) == 'a'
+  with cache.open_entry( get_key( 'b' ), mk_build( 'b', log ) ) as entry:
+    assert read( os.path.join( entry, 'lib.so' ) ) == 'b'
+
+  assert log == [ 'a', 'b' ]
+
+  # A cache at the same location shares the entries
+
+  cache = BuildCache( str( tmpdir.join( 'cache' ) ), 2**20 )
+  with cache.open_entry( get_key( 'a' ), mk_build( 'a', log ) ) as entry:
+    pass
+  assert log == [ 'a', 'b' ]
+
+#-----------------------------------------------------------------------
+# test_failed_build
+#-----------------------------------------------------------------------
+def test_failed_build( tmpdir ):
+
+  cache = BuildCache( str( tmpdir ), 2**20 )
+
+  def build( build_dir ):
+    write( os.path.join( build_dir, 'lib.so' ), 'partial' )
+    raise RuntimeError( 'compile error' )
+
+  with pytest.raises( RuntimeError ):
+    with cache.open_entry( get_key( 'a' ), build ) as entry:
+      pass
+
+  assert cache.get( get_key( 'a' ) ) is None
+  assert sorted( os.listdir( str( tmpdir ) ) ) == [ 'locks' ]
+
+#-----------------------------------------------------------------------
+# test_evict
+#-----------------------------------------------------------------------
+def test_evict( tmpdir ):
+
+  cache = BuildCache( str( tmpdir ), 250 )
+  keys  = [ get_key( i ) for i in range( 3 ) ]
+
+  for i, key in enumerate( keys[:2] ):
+    cache.install( key, mk_build( 'x' * 100 ) )
+    os.utime( cache.get_entry_dir( key ), ( i, i ) )
+
+  # Using the first entry makes the second one the least recently used
+
+  assert cache.get( keys[0] ) is not None
+  cache.install( keys[2], mk_build( 'x' * 100 ) )
+
+  assert cache.get( keys[1] ) is None
+  assert cache.get( keys[0] ) is not None
+  assert cache.get( keys[2] ) is not None
+
+  # Entries in use are not evicted
+
+  with cache.lock( keys[0] ):
+    cache.install( get_key( 3 ), mk_build( 'x' * 200 ) )
+  assert cache.get( keys[0] ) is not None
+  assert cache.get( keys[2] ) is None
+
+#-----------------------------------------------------------------------
+# test_concurrent_builds
+#-----------------------------------------------------------------------
+# Concurrent processes build each entry only once.
+
+def _open_entry( args ):
+  root, log = args
+  cache = BuildCache( root, 2**20 )
+  def build( build_dir ):
+    with open( log, 'a' ) as fp:
+      fp.write( 'x' )
+    write( os.path.join( build_dir, 'lib.so' ), 'a' )
+  with cache.open_entry( get_key( 'a' ), build ) as entry:
+    return read( os.path.join( entry, 'lib.so' ) )
+
+def test_concurrent_builds( tmpdir ):
+
+  log  = str( tmpdir.join( 'log' ) )
+  pool = multiprocessing.Pool( 4 )
+  try:
+    results = pool.map( _open_entry, [ ( str( tmpdir.join( 'cache' ) ), log ) ] * 8 )
+  finally:
+    pool.close()
+    pool.join()
+
+  assert results == [ 'a' ] * 8
+  assert read( log ) == 'x'
+
+#-----------------------------------------------------------------------
+# test_install_file
+#-----------------------------------------------------------------------
+def test_install_file( tmpdir ):
+
+  src  = str( tmpdir.join( 'src' ) )
+  dest = str( tmpdir.join( 'dest' ) )
+
+  write( src, 'a' )
+  install_file( src, dest )
+  assert read( dest ) == 'a'
+
+  # Identical files are not replaced, others are replaced atomically
+
+  inode = os.stat( dest ).st_ino
+  install_file( src, dest )
+  assert os.stat( dest ).st_ino == inode
+
+  write( src, 'b' )
+  install_file( src, dest )
+  assert read( dest ) == 'b'
+  assert sorted( os.listdir( str( tmpdir ) ) ) == [ 'dest', 'src' ]
+
+#-----------------------------------------------------------------------
+# test_write_file
+#-----------------------------------------------------------------------
+# Written and installed files get the default mode of new files, not the
+# private mode of temporary files (and of stale cache entries).
+def test_write_file( tmpdir ):
+
+  umask = os.umask( 0 )
+  os.umask( umask )
+
+  def mode( path ):
+    return os.stat( path ).st_mode & 0777
+
+  src  = str( tmpdir.join( 'src' ) )
+  dest = str( tmpdir.join( 'dest' ) )
+
+  write_file( src, 'a' )
+  assert read( src ) == 'a'
+  assert mode( src ) == 0666 & ~umask
+
+  os.chmod( src, 0600 )
+  install_file( src, dest )
+  assert mode( dest ) == 0666 & ~umask
+
+  os.chmod( src, 0755 )
+  write( src, 'b' )
+  install_file( src, dest )
+  assert mode( dest ) == 0777 & ~umask
+
+  assert sorted( os.listdir( str( tmpdir ) ) ) == [ 'dest', 'src' ]
@@ -4,6 +4,9 @@
 
 from __future__ import print_function
 
+import sys
+
+from binascii             import hexlify, unhexlify
 from pymtl                import *
 from ...model.signal_lists import PortList
 from cffi                 import FFI
@@ -242,3 +245,31 @@ def recurse_port_hierarchy( p, list_ ):
     else:
       list_.append( "s.{} = OutPort( {} )".format( p.name, p.nbits ) )
 
+
+#-----------------------------------------------------------------------
+# wdata_to_int / int_to_wdata
+#-----------------------------------------------------------------------
+# Conversion between integers and the bytes of a Verilator WData array
+# (the 32-bit words of ports wider than 64 bits, least significant word
+# first), e.g. read from or written to an ffi.buffer mapped onto the
+# array. Converting all words at once through a hex string is much
+# faster than setting each word from a 32-bit slice of the Bits.
+
+if sys.byteorder == 'little':
+
+  def wdata_to_int( data ):
+    return int( hexlify( data[::-1] ), 16 )
+
+  def int_to_wdata( value, nbytes ):
+    return unhexlify( '%0*x' % ( 2*nbytes, int( value ) ) )[::-1]
+
+else:
+
+  def _reverse_words( data ):
+    return ''.join( data[i:i+4] for i in range( len( data )-4, -1, -4 ) )
+
+  def wdata_to_int( data ):
+    return int( hexlify( _reverse_words( data ) ), 16 )
+
+  def int_to_wdata( value, nbytes ):
+    return _reverse_words( unhexlify( '%0*x' % ( 2*nbytes, int( value ) ) ) )
@@ -0,0 +1,31 @@
+#=======================================================================
+# cpp_helpers_test.py
+#=======================================================================
+
+import pytest
+
+from cffi        import FFI
+from pymtl       import Bits
+from cpp_helpers import wdata_to_int, int_to_wdata
+
+#-----------------------------------------------------------------------
+# test_wdata
+#-----------------------------------------------------------------------
+# Values are converted to and from WData words, least significant word
+# first, through a buffer mapped onto the array.
+
+@pytest.mark.parametrize( 'nbits', [ 65, 96, 100, 512 ] )
+def test_wdata( nbits ):
+
+  nwords = ( nbits - 1 ) / 32 + 1
+  ffi    = FFI()
+  words  = ffi.new( 'unsigned int[]', nwords )
+  buf    = ffi.buffer( words, 4*nwords )
+
+  for value in [ 0, 1, 0xdeadbeef << 32, ( 1 << nbits ) - 1,
+                 ( 1 << ( nbits - 1 ) ) | 0x0123456789abcdef ]:
+
+    buf[:] = int_to_wdata( Bits( nbits, value ), 4*nwords )
+    assert list( words ) == [ ( value >> ( 32*i ) ) & 0xffffffff
+                              for i in range( nwords ) ]
+    assert wdata_to_int( buf[:] ) == value
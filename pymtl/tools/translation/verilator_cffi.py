@@ -6,32 +6,171 @@ from __future__ import print_function
 
 import os
 import shutil
+import multiprocessing
 
 import verilog_structural
 from ...tools.simulation.vcd import get_vcd_timescale
 
+from multiprocessing.pool import ThreadPool
 from subprocess          import check_output, STDOUT, CalledProcessError
+from build_cache         import get_build_cache, get_key, install_file
 from ...model.signals    import InPort, OutPort
 from ...model.PortBundle import PortBundle
 from exceptions          import VerilatorCompileError
 
+#-----------------------------------------------------------------------
+# Build Profiles
+#-----------------------------------------------------------------------
+# Named sets of flags passed to verilator, the C++ compiler and the
+# linker, selected with TranslationTool( ..., profile=name ) or with the
+# PYMTL_BUILD_PROFILE environment variable (see the comment above
+# create_shared_lib for the background on these flags):
+#
+#  debug:        no optimization and debug info, for debugging the
+#                verilated model with gdb
+#  fast-compile: the verilator manual's suggestion for good performance
+#                at low compile times (default)
+#  max-perf:     -O3 for verilator and the C++ compiler, without
+#                assertions and with fast X assignment. Compiles much
+#                slower but pays off for long simulations.
+#  pgo-generate: max-perf, instrumented to record an execution profile
+#                into PYMTL_PGO_DIR (default ./pgo) when the simulation
+#                process exits
+#  pgo:          max-perf, optimized with the profile recorded by a run
+#                of a pgo-generate build
+#
+# The profile is part of the key of all cached builds. The recorded
+# profile is part of the key of pgo builds.
+
+DEFAULT_BUILD_PROFILE = 'fast-compile'
+
+BUILD_PROFILES = {
+  'debug' : dict(
+    verilator = '--assert',
+    cxx       = '-O0 -g',
+    ld        = '',
+  ),
+  'fast-compile' : dict(
+    verilator = '--assert',
+    cxx       = '-O1 -fstrict-aliasing',
+    ld        = '',
+  ),
+  'max-perf' : dict(
+    verilator = '-O3 --x-assign fast --noassert',
+    cxx       = '-O3 -fstrict-aliasing',
+    ld        = '',
+  ),
+  'pgo-generate' : dict(
+    verilator = '-O3 --x-assign fast --noassert',
+    cxx       = '-O3 -fstrict-aliasing -fprofile-generate={pgo_dir}',
+    ld        = '-fprofile-generate',
+  ),
+  'pgo' : dict(
+    verilator = '-O3 --x-assign fast --noassert',
+    cxx       = '-O3 -fstrict-aliasing -fprofile-use={pgo_dir} '
+                '-fprofile-correction -Wno-missing-profile',
+    ld        = '',
+  ),
+}
+
+#-----------------------------------------------------------------------
+# get_build_profile
+#-----------------------------------------------------------------------
+# Return the build profile name (or the one configured by the
+# environment if name is None) as a dict with the verilator, cxx and ld
+# flags, the name and, for profile guided optimization, the absolute
+# pgo_dir.
+
+def get_build_profile( name=None ):
+
+  if name is None:
+    name = os.environ.get( 'PYMTL_BUILD_PROFILE', DEFAULT_BUILD_PROFILE )
+
+  if name not in BUILD_PROFILES:
+    raise VerilatorCompileError(
+      'Unknown build profile "{}", expected one of: {}'.format(
+        name, ', '.join( sorted( BUILD_PROFILES ) ) ) )
+
+  pgo_dir = None
+  if name.startswith( 'pgo' ):
+    pgo_dir = os.path.abspath( os.environ.get( 'PYMTL_PGO_DIR', 'pgo' ) )
+
+  profile = dict( ( k, v.format( pgo_dir=pgo_dir ) )
+                  for k, v in BUILD_PROFILES[ name ].items() )
+  profile[ 'name'    ] = name
+  profile[ 'pgo_dir' ] = pgo_dir
+  profile[ 'cxx'     ] += ' -fPIC'
+  profile[ 'ld'      ] += ' -shared'
+  return profile
+
+#-----------------------------------------------------------------------
+# get_profile_key
+#-----------------------------------------------------------------------
+# The part of a build key covering the profile: its flags, and the
+# recorded execution profile used by pgo builds.
+
+def get_profile_key( profile ):
+  parts   = [ profile[ k ] for k in [ 'name', 'verilator', 'cxx', 'ld' ] ]
+  pgo_dir = profile[ 'pgo_dir' ]
+  if '-fprofile-use' in profile[ 'cxx' ] and os.path.isdir( pgo_dir ):
+    for filename in sorted( os.listdir( pgo_dir ) ):
+      with open( os.path.join( pgo_dir, filename ), 'rb' ) as fp:
+        parts += [ filename, fp.read() ]
+  return get_key( *parts )
+
+#-----------------------------------------------------------------------
+# get_verilator_flags
+#-----------------------------------------------------------------------
+# Flags passed to verilator, depending on the lint and vcd options and
+# on the build profile.
+
+def get_verilator_flags( vcd_en, lint, profile ):
+  return ' '.join([
+    '-Wno-lint' if not lint else '',
+    '-Wno-UNOPTFLAT',
+    '--unroll-count 1000000',
+    '--unroll-stmts 1000000',
+    profile[ 'verilator' ],
+    '--trace' if vcd_en else '',
+  ])
+
+#-----------------------------------------------------------------------
+# Tool Versions
+#-----------------------------------------------------------------------
+# Versions of verilator and of the C++ compiler, which are part of the
+# keys of cached builds.
+
+_tool_versions = {}
+
+def get_tool_version( tool ):
+  if tool not in _tool_versions:
+    _tool_versions[ tool ] = check_output([ tool, '--version' ]).strip()
+  return _tool_versions[ tool ]
+
+def get_verilator_version():
+  return get_tool_version( 'verilator' )
+
 #-----------------------------------------------------------------------
 # verilog_to_pymtl
 #-----------------------------------------------------------------------
 # Create a PyMTL compatible interface for Verilog HDL.
 
 def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
-                      lib_file, py_wrapper_file, vcd_en, lint, verilator_xinit ):
+                      lib_file, py_wrapper_file, vcd_en, lint, verilator_xinit,
+                      profile=None ):
 
   model_name = model.class_name
 
+  if profile is None:
+    profile = get_build_profile()
+
   try:
     vlinetrace = model.vlinetrace
   except AttributeError:
     vlinetrace = False
 
   # Verilate the model  # TODO: clean this up
-  verilate_model( verilog_file, model_name, vcd_en, lint )
+  verilate_model( verilog_file, model_name, vcd_en, lint, profile )
 
   # Add names to ports of module
   for port in model.get_ports():
@@ -43,7 +182,7 @@ def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
 
   # Create Shared C Library
   create_shared_lib( model_name, c_wrapper_file, lib_file,
-                     vcd_en, vlinetrace )
+                     vcd_en, vlinetrace, profile )
 
   # Create PyMTL wrapper for CFFI interface to Verilated model
   create_verilator_py_wrapper( model, py_wrapper_file, lib_file,
@@ -55,7 +194,10 @@ def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
 # Convert Verilog HDL into a C++ simulator using Verilator.
 # http://www.veripool.org/wiki/verilator
 
-def verilate_model( filename, model_name, vcd_en, lint ):
+def verilate_model( filename, model_name, vcd_en, lint, profile=None ):
+
+  if profile is None:
+    profile = get_build_profile()
 
   # verilator commandline template
 
@@ -66,14 +208,7 @@ def verilate_model( filename, model_name, vcd_en, lint ):
 
   source  = filename
   obj_dir = 'obj_dir_' + model_name
-  flags   = ' '.join([
-              '-Wno-lint' if not lint else '',
-              '-Wno-UNOPTFLAT',
-              '--unroll-count 1000000',
-              '--unroll-stmts 1000000',
-              '--assert',
-              '--trace' if vcd_en else '',
-            ])
+  flags   = get_verilator_flags( vcd_en, lint, profile )
 
   # remove the obj_dir because issues with staleness
 
@@ -141,13 +276,7 @@ def create_c_wrapper( model, c_wrapper_file, vcd_en, vlinetrace, verilator_xinit
     code = '{data_type} * {verilator_name};'
 
     verilator_name = port.verilator_name
-    bitwidth       = port.nbits
-
-    if   bitwidth <= 8:  data_type = 'unsigned char'
-    elif bitwidth <= 16: data_type = 'unsigned short'
-    elif bitwidth <= 32: data_type = 'unsigned int'
-    elif bitwidth <= 64: data_type = 'unsigned long'
-    else:                data_type = 'unsigned int'
+    data_type      = get_c_type( port )
 
     return code.format( **locals() )
 
@@ -171,6 +300,21 @@ def create_c_wrapper( model, c_wrapper_file, vcd_en, vlinetrace, verilator_xinit
   port_decls   = indent_zero.join( [ port_to_decl( x ) for x in ports ] )
   port_inits   = indent_two .join( [ port_to_init( x ) for x in ports ] )
 
+  # Create the output shadow copies and the statements reporting the
+  # changed outputs
+  shadow_decls   = []
+  changed_checks = []
+  for idx, port in enumerate( model.get_outports() ):
+    shadow_decls.append( shadow_decl( port ) )
+    changed_checks.extend( changed_check_stmt( port, idx ) )
+
+  # Create the statements setting the inputs from a stimulus record
+  stim_inputs = []
+  stim_nwords = 0
+  for port in get_stimulus_ports( model ):
+    stim_inputs.extend( stim_input_stmt( port, stim_nwords ) )
+    stim_nwords += get_stimulus_nwords( port )
+
   # Convert verilator_xinit to number
   if   ( verilator_xinit == "zeros" ) : verilator_xinit_num = 0
   elif ( verilator_xinit == "ones"  ) : verilator_xinit_num = 1
@@ -191,6 +335,10 @@ def create_c_wrapper( model, c_wrapper_file, vcd_en, vlinetrace, verilator_xinit
                           vcd_timescale = get_vcd_timescale( model ),
                           dump_vcd      = '1' if vcd_en else '0',
                           vlinetrace    = '1' if vlinetrace else '0',
+                          stim_inputs   = indent_four.join( stim_inputs ),
+                          stim_nwords   = stim_nwords,
+                          shadow_decls  = indent_four.join( shadow_decls ),
+                          changed_checks = indent_two.join( changed_checks ),
 
                           verilator_xinit_num = verilator_xinit_num,
                         )
@@ -199,6 +347,52 @@ def create_c_wrapper( model, c_wrapper_file, vcd_en, vlinetrace, verilator_xinit
 
   return port_decls.replace( indent_zero, indent_six )
 
+#-----------------------------------------------------------------------
+# get_c_type
+#-----------------------------------------------------------------------
+# C type of the Verilator signal of a port (of its words, for ports
+# wider than 64 bits).
+def get_c_type( port ):
+  bitwidth = port.nbits
+  if   bitwidth <= 8:  return 'unsigned char'
+  elif bitwidth <= 16: return 'unsigned short'
+  elif bitwidth <= 32: return 'unsigned int'
+  elif bitwidth <= 64: return 'unsigned long'
+  else:                return 'unsigned int'
+
+#-----------------------------------------------------------------------
+# shadow_decl
+#-----------------------------------------------------------------------
+# Declaration of the copy of an output used to detect its changes.
+def shadow_decl( port ):
+  if port.nbits > 64:
+    return 'unsigned int _prev_{}[{}];'.format(
+      port.verilator_name, get_wdata_nbytes( port ) / 4 )
+  return '{} _prev_{};'.format( get_c_type( port ), port.verilator_name )
+
+#-----------------------------------------------------------------------
+# changed_check_stmt
+#-----------------------------------------------------------------------
+# C statements adding an output to the changed outputs if it differs
+# from its shadow copy, and updating the copy.
+def changed_check_stmt( port, idx ):
+  v_name = port.verilator_name
+  if port.nbits > 64:
+    nbytes = get_wdata_nbytes( port )
+    return [
+      'if ( m->_sync_all || memcmp( m->_prev_{0}, m->{0}, {1} ) ) {{'
+        .format( v_name, nbytes ),
+      '  memcpy( m->_prev_{0}, m->{0}, {1} );'.format( v_name, nbytes ),
+      '  changed[n++] = {};'.format( idx ),
+      '}',
+    ]
+  return [
+    'if ( m->_sync_all || m->_prev_{0} != *m->{0} ) {{'.format( v_name ),
+    '  m->_prev_{0} = *m->{0};'.format( v_name ),
+    '  changed[n++] = {};'.format( idx ),
+    '}',
+  ]
+
 #-----------------------------------------------------------------------
 # create_shared_lib
 #-----------------------------------------------------------------------
@@ -248,12 +442,12 @@ def create_c_wrapper( model, c_wrapper_file, vcd_en, vlinetrace, verilator_xinit
 # code into a static library and then simply links this in. This reduces
 # compile times.
 
-def try_cmd( name, cmd ):
+def try_cmd( name, cmd, cwd=None ):
 
   # print( "cmd: ", cmd )
 
   try:
-    result = check_output( cmd.split() , stderr=STDOUT )
+    result = check_output( cmd.split() , stderr=STDOUT, cwd=cwd )
 
   # handle gcc/llvm failure
 
@@ -274,7 +468,7 @@ def try_cmd( name, cmd ):
       error     = e.output
     ))
 
-def compile( flags, include_dirs, output_file, input_files ):
+def compile( flags, include_dirs, output_file, input_files, cwd=None ):
 
   compile_cmd = 'g++ {flags} {idirs} -o {ofile} {ifiles}'
 
@@ -285,7 +479,7 @@ def compile( flags, include_dirs, output_file, input_files ):
     ifiles = ' '.join( input_files ),
   )
 
-  try_cmd( "Compilation", compile_cmd )
+  try_cmd( "Compilation", compile_cmd, cwd )
 
 def make_lib( output_file, input_files ):
 
@@ -310,8 +504,89 @@ def make_lib( output_file, input_files ):
 
   try_cmd( "Make library", ranlib_cmd )
 
+#-----------------------------------------------------------------------
+# compile_objects
+#-----------------------------------------------------------------------
+# Compile each source into an object file in output_dir, running up to
+# PYMTL_BUILD_JOBS (default: the number of cores) compiler processes in
+# parallel. sources is a list of ( source file, dependencies ) tuples,
+# where the dependencies are the files (e.g. generated headers) whose
+# content affects the object besides the source itself.
+#
+# Objects are cached in the build cache, keyed by the content of the
+# source and of its dependencies, the flags, the compiler version and
+# salt. Unchanged translation units are thus never recompiled, and
+# sources without dependencies (e.g. the Verilator runtime) are compiled
+# only once per salt (e.g. the Verilator version) and flags. Returns the
+# list of object files.
+#
+# For profile guided optimization, profile_dir is the directory of the
+# execution profile. Each object is then recorded into (or optimized
+# with) the profile file named after its source, and the profile file is
+# part of the key of objects optimized with it.
+
+def compile_objects( flags, include_dirs, sources, output_dir, salt='',
+                     profile_dir=None ):
+
+  cache    = get_build_cache( 'objects' )
+  cxx_key  = get_key( flags, include_dirs, get_tool_version( 'g++' ), salt )
+
+  if not os.path.exists( output_dir ):
+    os.makedirs( output_dir )
+
+  def compile_object( args ):
+
+    source, deps = args
+    name         = os.path.splitext( os.path.basename( source ) )[0]
+    object_file  = os.path.join( output_dir, name + '.o' )
+
+    deps = [ source ] + list( deps )
+    if profile_dir and '-fprofile-use' in flags:
+      deps.append( os.path.join( profile_dir, name + '.gcda' ) )
+
+    contents = []
+    for filename in deps:
+      if os.path.exists( filename ):
+        with open( filename, 'rb' ) as fp:
+          contents.append( fp.read() )
+      else:
+        contents.append( None )
+
+    # Compile in the (temporary) build directory, so that the profile
+    # file is named after the object path relative to it
+
+    def build( build_dir ):
+      prefix = ' -fprofile-prefix-path=' + build_dir if profile_dir else ''
+      compile(
+        flags        = flags + prefix + ' -c',
+        include_dirs = [ os.path.abspath( d ) for d in include_dirs ],
+        output_file  = name + '.o',
+        input_files  = [ os.path.abspath( source ) ],
+        cwd          = build_dir,
+      )
+
+    # The entry holds name.o, so the name is part of the key too
+
+    key = get_key( cxx_key, name, *contents )
+    with cache.open_entry( key, build ) as entry:
+      install_file( os.path.join( entry, name + '.o' ), object_file )
+
+    return object_file
+
+  jobs = int( os.environ.get( 'PYMTL_BUILD_JOBS', 0 ) ) \
+         or multiprocessing.cpu_count()
+  pool = ThreadPool( max( 1, min( jobs, len( sources ) ) ) )
+  try:
+    return pool.map( compile_object, sources )
+  finally:
+    pool.close()
+    pool.join()
+
 def create_shared_lib( model_name, c_wrapper_file, lib_file,
-                       vcd_en, vlinetrace ):
+                       vcd_en, vlinetrace, profile=None ):
+
+  if profile is None:
+    profile = get_build_profile()
 
   # We need to find out where the verilator include directories are
   # globally installed. We first check the PYMTL_VERILATOR_INCLUDE_DIR
@@ -378,44 +653,13 @@ Error:
     verilator_include_dir+"/vltstd",
   ]
 
-  # Compile standard Verilator code if libverilator.a does not exist.
-  # Originally, I was also including verilated_dpi.cpp in this library,
-  # but for some reason that screws up line tracing. Somehow there is
-  # some kind of global state or something that is shared across the
-  # shared libraries or something. I was able to fix it by recompiling
-  # verilated_dpi if linetracing is enabled. Actually, the line tracing
-  # doesn't work -- if you use this line tracing approach, so we are back
-  # to always recomping everyting every time for now.
-
-  # if not os.path.exists( "libverilator.a" ):
-  #
-  #   compile(
-  #     flags        = "-O3 -c",
-  #     include_dirs = include_dirs,
-  #     output_file  = "verilator.o",
-  #     input_files  = [ verilator_include_dir+"/verilated.cpp" ]
-  #   )
-  #
-  #   compile(
-  #     flags        = "-O3 -c",
-  #     include_dirs = include_dirs,
-  #     output_file  = "verilator_vcd_c.o",
-  #     input_files  = [ verilator_include_dir+"/verilated_vcd_c.cpp" ]
-  #   )
-  #
-  #   # compile(
-  #   #   flags        = "-O3 -c",
-  #   #   include_dirs = include_dirs,
-  #   #   output_file  = "verilator_dpi.o",
-  #   #   input_files  = [ verilator_include_dir+"/verilated_dpi.cpp" ]
-  #   # )
-  #
-  #   make_lib(
-  #     output_file  = "libverilator.a",
-  #     # input_files  = [ "verilator.o", "verilator_vcd_c.o", "verilator_dpi.o" ]
-  #     input_files  = [ "verilator.o", "verilator_vcd_c.o" ]
-  #    )
+  # The Verilator runtime is compiled into objects (only once per
+  # Verilator version and flags, see compile_objects) which are linked
+  # into each shared library. Sharing the runtime across the shared
+  # libraries (e.g. as a static libverilator.a) broke line tracing, so
+  # each shared library still links its own copy.
 
+  obj_dir        = "obj_dir_{m}".format( m=model_name )
   obj_dir_prefix = "obj_dir_{m}/V{m}".format( m=model_name )
 
   # We need to find a list of all the generated classes. We look in the
@@ -436,28 +680,50 @@ Error:
           cpp_file = "obj_dir_{m}/{f}.cpp".format( m=model_name, f=filename )
           cpp_sources_list.append( cpp_file )
 
-  # Compile this module
-
   cpp_sources_list += [
     obj_dir_prefix+"__Syms.cpp",
+    c_wrapper_file,
+  ]
+
+  runtime_sources_list = [
     verilator_include_dir+"/verilated.cpp",
     verilator_include_dir+"/verilated_dpi.cpp",
-    c_wrapper_file,
   ]
 
   if vcd_en:
     cpp_sources_list += [
-      verilator_include_dir+"/verilated_vcd_c.cpp",
       obj_dir_prefix+"__Trace.cpp",
       obj_dir_prefix+"__Trace__Slow.cpp",
     ]
+    runtime_sources_list += [
+      verilator_include_dir+"/verilated_vcd_c.cpp",
+    ]
 
-  compile(
-    # flags        = "-O1 -fstrict-aliasing -fPIC -shared -L. -lverilator",
-    flags        = "-O1 -fstrict-aliasing -fPIC -shared",
+  # Generated sources depend on all generated headers, the runtime only
+  # on the Verilator version
+
+  headers = sorted( os.path.join( obj_dir, f ) for f in os.listdir( obj_dir )
+                    if f.endswith( '.h' ) )
+
+  sources = [ ( f, headers ) for f in cpp_sources_list ] + \
+            [ ( f, [] ) for f in runtime_sources_list ]
+
+  object_files = compile_objects(
+    flags        = profile['cxx'],
     include_dirs = include_dirs,
+    sources      = sources,
+    output_dir   = obj_dir + "/objs",
+    salt         = get_verilator_version(),
+    profile_dir  = profile['pgo_dir'],
+  )
+
+  # Link the shared library
+
+  compile(
+    flags        = profile['cxx'] + ' ' + profile['ld'],
+    include_dirs = [],
     output_file  = lib_file,
-    input_files  = cpp_sources_list,
+    input_files  = object_files,
   )
 
 #-----------------------------------------------------------------------
@@ -472,6 +738,7 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file,
 
   port_defs  = []
   set_inputs = []
+  set_inputs_step = []
   set_comb   = []
   set_next   = []
 
@@ -481,14 +748,26 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file,
 
   for port in model.get_inports():
     if port.name == 'clk': continue
-    input_ = set_input_stmt( port )
-    set_inputs.extend( input_ )
+    set_inputs.extend( set_input_stmt( port ) )
+    set_inputs_step.extend( set_input_stmt( port, track_changes=False ) )
 
   for port in model.get_outports():
     comb, next_ = set_output_stmt( port )
     set_comb.extend( comb  )
     set_next.extend( next_ )
 
+  wdata_bufs = [ wdata_buffer_stmt( port ) for port in model.get_ports()
+                 if port.nbits > 64 ]
+  wdata_bufs.extend( wdata_last_stmt( port ) for port in model.get_inports()
+                     if port.nbits > 64 )
+
+  invalidate_inputs = [ wdata_last_stmt( port )
+                        for port in model.get_inports() if port.nbits > 64 ]
+
+  stim_ports = get_stimulus_ports( model )
+  stim_layout = [ ( port.nbits, get_stimulus_nwords( port ) )
+                  for port in stim_ports ]
+
   # pretty printing
   indent_four = '\n    '
   indent_six  = '\n      '
@@ -504,9 +783,16 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file,
         lib_file    = lib_file,
         port_defs   = indent_four.join( port_defs ),
         set_inputs  = indent_six .join( set_inputs ),
-        set_comb    = indent_six .join( set_comb ),
-        set_next    = indent_six .join( set_next ),
+        set_comb    = ( ',' + indent_six ).join( set_comb ),
+        set_next    = ( ',' + indent_six ).join( set_next ),
+        noutputs    = len( model.get_outports() ),
+        wdata_bufs  = indent_four.join( wdata_bufs ),
         vlinetrace  = '1' if vlinetrace else '0',
+        stim_ports  = ', '.join( repr( port.name ) for port in stim_ports ),
+        stim_layout = stim_layout,
+        stim_nwords = sum( nwords for nbits, nwords in stim_layout ),
+        set_inputs_step   = indent_four.join( set_inputs_step ),
+        invalidate_inputs = indent_six .join( invalidate_inputs ),
     )
 
     #py_src += 'XTraceEverOn()' # TODO: add for tracing?
@@ -515,49 +801,110 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file,
     #print( py_src )
 
 #-----------------------------------------------------------------------
-# get_indices
+# get_wdata_nbytes
+#-----------------------------------------------------------------------
+# Ports wider than 64 bits are Verilator WData arrays of 32-bit words.
+# The Python wrapper accesses all words of such a port at once through
+# an ffi.buffer mapped directly onto the array (see wdata_buffer_stmt),
+# instead of setting each word from a 32-bit slice of the Bits.
+def get_wdata_nbytes( port ):
+  return ( ( port.nbits - 1 ) / 32 + 1 ) * 4
+
+#-----------------------------------------------------------------------
+# wdata_buffer_stmt
 #-----------------------------------------------------------------------
-# Utility function for determining assignment of wide ports
-def get_indices( port ):
-  num_assigns = 1 if port.nbits <= 64 else (port.nbits-1)/32 + 1
-  if num_assigns == 1:
-    return [(0, "")]
-  return [ ( i, '[{}:{}]'.format( i*32, min( i*32+32, port.nbits) ) )
-           for i in range(num_assigns) ]
+def wdata_buffer_stmt( port ):
+  return 's._{v_name}_wdata = s.ffi.buffer( s._m.{v_name}, {nbytes} )' \
+         .format( v_name = port.verilator_name,
+                  nbytes = get_wdata_nbytes( port ) )
+
+#-----------------------------------------------------------------------
+# wdata_last_stmt
+#-----------------------------------------------------------------------
+# Wide inputs are compared against the last value written to the C
+# model (reading the WData array back would cost a conversion), this
+# statement forces the next write.
+def wdata_last_stmt( port ):
+  return 's._{v_name}_last = None'.format( v_name = port.verilator_name )
 
 #-----------------------------------------------------------------------
 # set_input_stmt
 #-----------------------------------------------------------------------
-def set_input_stmt( port ):
-  inputs = []
-  for idx, offset in get_indices( port ):
-    inputs.append( 's._m.{v_name}[{idx}] = s.{py_name}{offset}' \
-                    .format( v_name  = port.verilator_name,
-                             py_name = port.name,
-                             idx     = idx,
-                             offset  = offset )
-                   )
-  return inputs
+# Inputs are only written to the C model if they changed, which sets
+# changed to trigger the evaluation of the model. Without track_changes
+# (used by step, which always simulates), only wide inputs are compared
+# with their last written value, to avoid converting them.
+def set_input_stmt( port, track_changes=True ):
+  if port.nbits > 64:
+    stmt = ( 'if s._{v_name}_last != s.{py_name}: '
+             's._{v_name}_last = int( s.{py_name} ); '
+             's._{v_name}_wdata[:] = '
+             'int_to_wdata( s._{v_name}_last, {nbytes} )' )
+  elif track_changes:
+    stmt = ( 'if s._m.{v_name}[0] != s.{py_name}: '
+             's._m.{v_name}[0] = s.{py_name}' )
+  else:
+    stmt = 's._m.{v_name}[0] = s.{py_name}'
+  if track_changes:
+    stmt += '; changed = True'
+  return [ stmt.format( v_name  = port.verilator_name,
+                        py_name = port.name,
+                        nbytes  = get_wdata_nbytes( port ) ) ]
 
 #-----------------------------------------------------------------------
 # set_output_stmt
 #-----------------------------------------------------------------------
+# Functions writing an output back as a combinational (.value) and as a
+# registered (.next) output, called for the outputs reported as changed
+# by the C model.
 # TODO: no way to distinguish between combinational and sequential
 #       outputs, so we set outputs both ways...
 #       This seems broken, but I can't think of a better way.
 def set_output_stmt( port ):
-  comb, next_ = [], []
-  for idx, offset in get_indices( port ):
-    assign = 's.{py_name}{offset}.{sigtype} = s._m.{v_name}[{idx}]' \
-             .format( v_name  = port.verilator_name,
-                      py_name = port.name,
-                      idx     = idx,
-                      offset  = offset,
-                      sigtype = '{sigtype}' )
-    comb .append( assign.format( sigtype = 'value' ) )
-    next_.append( assign.format( sigtype = 'next'  ) )
+  if port.nbits > 64:
+    value = 'wdata_to_int( s._{v_name}_wdata[:] )'
+  else:
+    value = 's._m.{v_name}[0]'
+  assign = "lambda: setattr( s.{py_name}, '{sigtype}', " + value + " )"
+  assign = assign.format( v_name  = port.verilator_name,
+                          py_name = port.name,
+                          sigtype = '{sigtype}' )
+  comb  = [ assign.format( sigtype = 'value' ) ]
+  next_ = [ assign.format( sigtype = 'next'  ) ]
   return comb, next_
 
+#-----------------------------------------------------------------------
+# get_stimulus_ports
+#-----------------------------------------------------------------------
+# Input ports set from the stimulus records of step(), in record order
+# (sorted by name, see SimulationTool.get_stimulus_ports).
+def get_stimulus_ports( model ):
+  return [ port for port in
+           sorted( model.get_inports(), key=lambda x: x.name )
+           if port.name != 'clk' ]
+
+#-----------------------------------------------------------------------
+# get_stimulus_nwords
+#-----------------------------------------------------------------------
+# Number of 32-bit words taken by a port in a stimulus record.
+def get_stimulus_nwords( port ):
+  return ( port.nbits - 1 ) / 32 + 1
+
+#-----------------------------------------------------------------------
+# stim_input_stmt
+#-----------------------------------------------------------------------
+# C statements setting an input port from the stimulus record words
+# starting at offset.
+def stim_input_stmt( port, offset ):
+  v_name = port.verilator_name
+  if port.nbits <= 32:
+    return [ '*m->{} = stim[{}];'.format( v_name, offset ) ]
+  if port.nbits <= 64:
+    return [ '*m->{0} = ( (vluint64_t) stim[{2}] << 32 ) | stim[{1}];'
+             .format( v_name, offset, offset+1 ) ]
+  return [ 'm->{}[{}] = stim[{}];'.format( v_name, i, offset+i )
+           for i in range( get_stimulus_nwords( port ) ) ]
+
 #-----------------------------------------------------------------------
 # verilator_mangle
 #-----------------------------------------------------------------------
@@ -0,0 +1,227 @@
+#=======================================================================
+# verilator_cffi_test.py
+#=======================================================================
+
+import os
+import sys
+import ctypes
+import pytest
+
+from subprocess      import check_call
+from distutils.spawn import find_executable
+from verilator_cffi  import compile_objects, compile, get_build_profile, \
+                            get_profile_key, create_c_wrapper, get_c_type, \
+                            verilator_mangle
+from verilog_structural import mangle_name
+from exceptions      import VerilatorCompileError
+from pclib.rtl       import Reg
+
+requires_cxx = pytest.mark.skipif( find_executable( 'g++' ) is None,
+                                   reason='requires g++' )
+
+#-----------------------------------------------------------------------
+# test_compile_objects
+#-----------------------------------------------------------------------
+# Objects are only recompiled when their source or dependencies change.
+
+def count_entries( cache_dir ):
+  return sum( len( os.listdir( os.path.join( cache_dir, d ) ) )
+              for d in os.listdir( cache_dir ) if len( d ) == 2 )
+
+@requires_cxx
+def test_compile_objects( tmpdir, monkeypatch ):
+
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', str( tmpdir.join( 'cache' ) ) )
+  monkeypatch.setenv( 'PYMTL_BUILD_JOBS', '2' )
+  monkeypatch.chdir( tmpdir )
+
+  tmpdir.join( 'value.h' ).write( '#define VALUE 42\n' )
+  tmpdir.join( 'a.cpp' ).write( '#include "value.h"\n'
+                                'extern "C" int a() { return VALUE; }\n' )
+  tmpdir.join( 'b.cpp' ).write( 'extern "C" int b() { return 1; }\n' )
+
+  sources = [ ( 'a.cpp', [ 'value.h' ] ), ( 'b.cpp', [] ) ]
+  objects = str( tmpdir.join( 'cache', 'objects' ) )
+
+  profile = get_build_profile()
+
+  def build( lib_file ):
+    lib_file     = str( tmpdir.join( lib_file ) )
+    object_files = compile_objects( profile['cxx'], [ '.' ], sources, 'objs' )
+    compile( profile['cxx'] + ' ' + profile['ld'], [], lib_file, object_files )
+    lib = ctypes.CDLL( lib_file )
+    return lib.a() + lib.b()
+
+  assert build( 'lib0.so' ) == 43
+  assert sorted( os.listdir( 'objs' ) ) == [ 'a.o', 'b.o' ]
+  assert count_entries( objects ) == 2
+
+  assert build( 'lib1.so' ) == 43
+  assert count_entries( objects ) == 2
+
+  # Changing the dependency only recompiles a.cpp
+
+  tmpdir.join( 'value.h' ).write( '#define VALUE 2\n' )
+  assert build( 'lib2.so' ) == 3
+  assert count_entries( objects ) == 3
+
+#-----------------------------------------------------------------------
+# test_compile_objects_same_source
+#-----------------------------------------------------------------------
+# Sources with identical contents are cached as separate objects.
+
+@requires_cxx
+def test_compile_objects_same_source( tmpdir, monkeypatch ):
+
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', str( tmpdir.join( 'cache' ) ) )
+  monkeypatch.chdir( tmpdir )
+
+  for name in [ 'c.cpp', 'd.cpp' ]:
+    tmpdir.join( name ).write( 'static int f() { return 1; }\n' )
+
+  profile      = get_build_profile()
+  object_files = compile_objects( profile['cxx'], [],
+                                  [ ( 'c.cpp', [] ), ( 'd.cpp', [] ) ],
+                                  'objs' )
+  assert object_files == [ os.path.join( 'objs', 'c.o' ),
+                           os.path.join( 'objs', 'd.o' ) ]
+  assert sorted( os.listdir( 'objs' ) ) == [ 'c.o', 'd.o' ]
+
+#-----------------------------------------------------------------------
+# test_build_profile
+#-----------------------------------------------------------------------
+def test_build_profile( tmpdir, monkeypatch ):
+
+  monkeypatch.delenv( 'PYMTL_BUILD_PROFILE', raising=False )
+  monkeypatch.chdir( tmpdir )
+
+  assert get_build_profile()['name'] == 'fast-compile'
+  assert '-O1' in get_build_profile()['cxx']
+  assert '-O3' in get_build_profile( 'max-perf' )['cxx']
+
+  monkeypatch.setenv( 'PYMTL_BUILD_PROFILE', 'debug' )
+  assert get_build_profile()['name'] == 'debug'
+  assert get_build_profile( 'max-perf' )['name'] == 'max-perf'
+
+  with pytest.raises( VerilatorCompileError ):
+    get_build_profile( 'fastest' )
+
+  # Profiles have different keys, the key of pgo builds also covers the
+  # recorded profile
+
+  keys = set( get_profile_key( get_build_profile( name ) )
+              for name in [ 'debug', 'fast-compile', 'max-perf',
+                            'pgo-generate', 'pgo' ] )
+  assert len( keys ) == 5
+
+  pgo = get_build_profile( 'pgo' )
+  assert pgo['pgo_dir'] == str( tmpdir.join( 'pgo' ) )
+
+  key = get_profile_key( pgo )
+  tmpdir.join( 'pgo', 'a.gcda' ).write( 'a', ensure=True )
+  assert get_profile_key( pgo ) != key
+
+#-----------------------------------------------------------------------
+# test_compile_objects_pgo
+#-----------------------------------------------------------------------
+# Objects built in (different) temporary directories find the profile
+# recorded by the instrumented build.
+
+@requires_cxx
+def test_compile_objects_pgo( tmpdir, monkeypatch ):
+
+  monkeypatch.setenv( 'PYMTL_CACHE_DIR', str( tmpdir.join( 'cache' ) ) )
+  monkeypatch.chdir( tmpdir )
+
+  tmpdir.join( 'a.cpp' ).write( 'extern "C" int a( int n ) {\n'
+                                '  int s = 0;\n'
+                                '  for ( int i = 0; i < n; i++ )\n'
+                                '    s += i % 3 ? i : -i;\n'
+                                '  return s;\n'
+                                '}\n' )
+
+  def build( name, lib_file ):
+    profile      = get_build_profile( name )
+    lib_file     = str( tmpdir.join( lib_file ) )
+    object_files = compile_objects( profile['cxx'], [], [ ( 'a.cpp', [] ) ],
+                                    name, profile_dir=profile['pgo_dir'] )
+    compile( profile['cxx'] + ' ' + profile['ld'], [], lib_file, object_files )
+    return lib_file
+
+  # The instrumented library records the profile when it runs. Profiles
+  # are written at process exit, so run it in a separate process.
+
+  lib_file = build( 'pgo-generate', 'lib0.so' )
+  check_call([ sys.executable, '-c',
+               'import ctypes; ctypes.CDLL( {!r} ).a( 1000 )'.format( lib_file ) ])
+  assert os.listdir( 'pgo' ) == [ 'a.gcda' ]
+
+  lib = ctypes.CDLL( build( 'pgo', 'lib1.so' ) )
+  assert lib.a( 6 ) == 9
+
+#-----------------------------------------------------------------------
+# test_c_wrapper_tick
+#-----------------------------------------------------------------------
+# The C wrapper of a register, built against a minimal stand-in for the
+# Verilated model, must step and tick. Calls between the exported
+# functions could bind to libc symbols (e.g., step) and crash, so the
+# library runs in a separate process.
+
+@requires_cxx
+def test_c_wrapper_tick( tmpdir, monkeypatch ):
+
+  monkeypatch.chdir( tmpdir )
+
+  model = Reg( 8 )
+  model.elaborate()
+  for port in model.get_ports():
+    port.verilog_name   = mangle_name( port.name )
+    port.verilator_name = verilator_mangle( port.verilog_name )
+
+  name  = model.class_name
+  ports = '\n'.join( '  {} {};'.format( get_c_type( p ), p.verilator_name )
+                     for p in model.get_ports() )
+
+  tmpdir.mkdir( 'obj_dir_' + name ).join( 'V{}.h'.format( name ) ).write(
+    'class V{0} {{\n'
+    ' public:\n'
+    '{1}\n'
+    '  unsigned char prev_clk;\n'
+    '  V{0}() : prev_clk( 0 ) {{}}\n'
+    '  void eval() {{ if ( clk && !prev_clk ) out = in_; prev_clk = clk; }}\n'
+    '  void final() {{}}\n'
+    '}};\n'.format( name, ports ) )
+  tmpdir.join( 'verilated.h' ).write(
+    '#include <stdint.h>\n'
+    '#include <stdlib.h>\n'
+    'typedef uint64_t vluint64_t;\n'
+    'struct Verilated { static void randReset( int ) {} };\n' )
+  tmpdir.join( 'verilated_vcd_c.h' ).write( '' )
+
+  decls = create_c_wrapper( model, 'wrapper.cpp', False, False, 'zeros' )
+
+  for profile in [ 'fast-compile', 'max-perf' ]:
+    profile  = get_build_profile( profile )
+    lib_file = str( tmpdir.join( 'lib{}.so'.format( profile['name'] ) ) )
+    compile( profile['cxx'] + ' ' + profile['ld'], [ '.' ], lib_file,
+             [ 'wrapper.cpp' ] )
+
+    check_call([ sys.executable, '-c', '\n'.join([
+      'from cffi import FFI',
+      'ffi = FFI()',
+      'ffi.cdef( """',
+      '  typedef struct {{ {decls} }} M_t;',
+      '  M_t * create_model( const char * );',
+      '  void step( M_t *, unsigned long );',
+      '  unsigned int tick_changed( M_t *, unsigned int * );',
+      '""" )',
+      'lib     = ffi.dlopen( {lib_file!r} )',
+      'm       = lib.create_model( "" )',
+      'changed = ffi.new( "unsigned int[]", 1 )',
+      'm.in_[0] = 42',
+      'assert lib.tick_changed( m, changed ) == 1 and m.out[0] == 42',
+      'assert lib.tick_changed( m, changed ) == 0',
+      'm.in_[0] = 7',
+      'lib.step( m, 3 )',
+      'assert m.out[0] == 7',
+    ]).format( decls=decls, lib_file=lib_file ) ])
@@ -6,35 +6,40 @@ from __future__ import print_function
 
 import os
 import sys
-import filecmp
+import tempfile
 import verilog
 
-from os.path        import exists
-from verilator_cffi import verilog_to_pymtl
+from build_cache    import get_build_cache, get_key, install_file, \
+                           write_file
+from verilator_cffi import verilog_to_pymtl, get_verilator_flags, \
+                           get_verilator_version, get_build_profile, \
+                           get_profile_key
+from ...tools.simulation.vcd import get_vcd_timescale
 
 #-----------------------------------------------------------------------
 # TranslationTool
 #-----------------------------------------------------------------------
-def TranslationTool( model_inst, lint=False, enable_blackbox=False, verilator_xinit="zeros" ):
+def TranslationTool( model_inst, lint=False, enable_blackbox=False, verilator_xinit="zeros",
+                     profile=None ):
   """Translates a PyMTL model into Python-wrapped Verilog.
 
   model_inst:      an un-elaborated Model instance
   lint:            run verilator linter, warnings are fatal
                    (disables -Wno-lint flag)
   enable_blackbox: also generate a .v file with black boxes
+  profile:         name of the build profile (see verilator_cffi.py),
+                   defaults to $PYMTL_BUILD_PROFILE or 'fast-compile'
   """
 
   model_inst.elaborate()
 
-  # Translate the PyMTL module to Verilog, if we've already done
-  # translation check if there's been any changes to the source
+  # Translate the PyMTL module to Verilog, then fetch the verilated model
+  # from the build cache (building it on a miss)
   model_name      = model_inst.class_name
   verilog_file    = model_name + '.v'
-  temp_file       = model_name + '.v.tmp'
   c_wrapper_file  = model_name + '_v.cpp'
   py_wrapper_file = model_name + '_v.py'
   lib_file        = 'lib{}_v.so'.format( model_name )
-  obj_dir         = 'obj_dir_' + model_name
   blackbox_file   = model_name + '_blackbox' + '.v'
 
   vcd_en   = True
@@ -45,39 +50,50 @@ def TranslationTool( model_inst, lint=False, enable_blackbox=False, verilator_xi
   except AttributeError:
     vcd_en = False
 
-  # Write the output to a temporary file
-  with open( temp_file, 'w+' ) as fd:
-    verilog.translate( model_inst, fd, verilator_xinit=verilator_xinit )
-
-  # write Verilog with black boxes
-  if enable_blackbox:
-    with open( blackbox_file, 'w+' ) as fd:
-      verilog.translate( model_inst, fd, enable_blackbox=True, verilator_xinit=verilator_xinit )
-
-  # Check if the temporary file matches an existing file (caching)
-
-  cached = False
-  if (     exists(verilog_file)
-       and exists(py_wrapper_file)
-       and exists(lib_file)
-       and exists(obj_dir) ):
-
-    cached = filecmp.cmp( temp_file, verilog_file )
+  try:
+    vlinetrace = model_inst.vlinetrace
+  except AttributeError:
+    vlinetrace = False
 
-    # if not cached:
-    #   os.system( ' diff %s %s'%( temp_file, verilog_file ))
+  profile = get_build_profile( profile )
 
-  # Rename temp to actual output
-  os.rename( temp_file, verilog_file )
+  # Translate the model
+  verilog_src = _translate( model_inst, verilator_xinit=verilator_xinit )
 
-  # Verilate the module only if we've updated the verilog source
-  if not cached:
-    #print( "NOT CACHED", verilog_file )
-    verilog_to_pymtl( model_inst, verilog_file, c_wrapper_file,
-                      lib_file, py_wrapper_file, vcd_en, lint,
-                      verilator_xinit )
-  #else:
-  #  print( "CACHED", verilog_file )
+  # write Verilog with black boxes
+  if enable_blackbox:
+    write_file( blackbox_file, _translate( model_inst, enable_blackbox=True,
+                                           verilator_xinit=verilator_xinit ) )
+
+  # The key covers everything that affects the verilated model
+
+  key = get_key( verilog_src, model_name, get_verilator_version(),
+                 get_verilator_flags( vcd_en, lint, profile ),
+                 get_profile_key( profile ), vcd_en, vlinetrace,
+                 verilator_xinit, get_vcd_timescale( model_inst ),
+                 get_template_digest() )
+
+  # Verilate the module in a private build directory. The build writes
+  # all files relative to the working directory.
+
+  def build( build_dir ):
+    cwd = os.getcwd()
+    os.chdir( build_dir )
+    try:
+      write_file( verilog_file, verilog_src )
+      verilog_to_pymtl( model_inst, verilog_file, c_wrapper_file,
+                        lib_file, py_wrapper_file, vcd_en, lint,
+                        verilator_xinit, profile )
+    finally:
+      os.chdir( cwd )
+
+  # Install the generated files into the working directory
+
+  cache = get_build_cache( 'verilator' )
+  with cache.open_entry( key, build ) as entry:
+    for filename in [ verilog_file, c_wrapper_file, lib_file,
+                      py_wrapper_file ]:
+      install_file( os.path.join( entry, filename ), filename )
 
   # Use some trickery to import the verilated version of the model
   sys.path.append( os.getcwd() )
@@ -92,3 +108,24 @@ def TranslationTool( model_inst, lint=False, enable_blackbox=False, verilator_xi
     model_inst.vcd_file = vcd_file
 
   return model_inst
+
+#-----------------------------------------------------------------------
+# Helpers
+#-----------------------------------------------------------------------
+
+def _translate( model_inst, **kwargs ):
+  with tempfile.TemporaryFile() as fd:
+    verilog.translate( model_inst, fd, **kwargs )
+    fd.seek( 0 )
+    return fd.read()
+
+# Digest of the wrapper templates and of the code generating the wrappers
+
+def get_template_digest():
+  template_dir = os.path.dirname( os.path.abspath( __file__ ) )
+  sources = []
+  for filename in [ 'verilator_wrapper.templ.c', 'verilator_wrapper.templ.py',
+                    'verilator_cffi.py', 'cpp_helpers.py' ]:
+    with open( os.path.join( template_dir, filename ) ) as fp:
+      sources.append( fp.read() )
+  return get_key( *sources )
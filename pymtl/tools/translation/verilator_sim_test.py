@@ -2,6 +2,8 @@
 # verilator_sim_test.py
 #=======================================================================
 
+import pytest
+
 from pymtl          import SimulationTool
 from verilator_sim  import TranslationTool
 from pymtl          import requires_verilator
@@ -46,3 +48,56 @@ def test_reg8():
 
 def test_reg16():
   reg_test( Reg(16) )
+
+#-----------------------------------------------------------------------
+# Multi-cycle stepping
+#-----------------------------------------------------------------------
+# step() simulates in C and must match cycle-by-cycle simulation.
+
+def step_test( model, nbits ):
+
+  vmodel = TranslationTool( model )
+  vmodel.elaborate()
+
+  sim = SimulationTool( vmodel )
+  sim.reset()
+
+  vmodel.in_.value = 10
+  sim.step( 3 )
+  assert vmodel.out == 10
+  assert sim.ncycles == 5
+
+  # ports are in_, reset
+
+  values   = [ ( 1 << nbits ) - 1 - i for i in range( 4 ) ]
+  stimulus = [ ( value, 0 ) for value in values ]
+  sim.step( 4, stimulus )
+  assert vmodel.out == values[-1]
+  assert vmodel.in_ == values[-1]
+  assert sim.ncycles == 9
+
+  # packed stimulus can be reused
+
+  packed = vmodel.pack_stimulus( stimulus[:2] )
+  vmodel.step( 2, packed )
+  assert vmodel.out == values[1]
+
+  # packed stimulus can be passed to the simulator too
+
+  packed = vmodel.pack_stimulus( stimulus )
+  assert vmodel.unpack_stimulus( packed, 2 ) == list( stimulus[2] )
+  sim.step( 3, packed )
+  assert vmodel.out == values[2]
+  assert vmodel.in_ == values[2]
+  with pytest.raises( ValueError ):
+    sim.step( 5, packed )
+  assert sim.ncycles == 12
+
+def test_step_reg8():
+  step_test( Reg(8), 8 )
+
+def test_step_reg48():
+  step_test( Reg(48), 48 )
+
+def test_step_reg100():
+  step_test( Reg(100), 100 )
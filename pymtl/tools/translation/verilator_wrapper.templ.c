@@ -8,6 +8,7 @@
 #include "obj_dir_{model_name}/V{model_name}.h"
 #include "stdio.h"
 #include "stdint.h"
+#include "string.h"
 #include "verilated.h"
 #include "verilated_vcd_c.h"
 
@@ -46,12 +47,22 @@ extern "C" {{
     unsigned char prev_clk;
     #endif
 
+    // Output change detection: the output values when they were last
+    // reported as changed (not exposed to CFFI)
+    int _sync_all;
+    {shadow_decls}
+
   }} V{model_name}_t;
 
   // Exposed methods
   V{model_name}_t * create_model( const char * );
   void destroy_model( V{model_name}_t *);
   void eval( V{model_name}_t * );
+  void step( V{model_name}_t *, unsigned long );
+  void step_stim( V{model_name}_t *, unsigned long, const uint32_t * );
+  unsigned int get_changed( V{model_name}_t *, unsigned int * );
+  unsigned int eval_changed( V{model_name}_t *, unsigned int * );
+  unsigned int tick_changed( V{model_name}_t *, unsigned int * );
 
   #if VLINETRACE
   void trace( V{model_name}_t *, char * );
@@ -113,6 +124,9 @@ V{model_name}_t * create_model( const char *vcd_filename ) {{
   // initialize exposed model interface pointers
   {port_inits}
 
+  // report all outputs as changed on the first call to get_changed
+  m->_sync_all = 1;
+
   return m;
 }}
 
@@ -143,11 +157,16 @@ void destroy_model( V{model_name}_t * m ) {{
 }}
 
 //----------------------------------------------------------------------
-// eval()
+// eval_step()
 //----------------------------------------------------------------------
 // Simulate one time-step in the Verilated model.
+//
+// The exported functions must not call each other, they share static
+// helpers instead: calls to exported functions go through the PLT and
+// may bind to a libc symbol of the same name (e.g., the regexp.h
+// step()).
 
-void eval( V{model_name}_t * m ) {{
+static void eval_step( V{model_name}_t * m ) {{
 
   V{model_name} * model = (V{model_name} *) m->model;
 
@@ -174,6 +193,116 @@ void eval( V{model_name}_t * m ) {{
 
 }}
 
+//----------------------------------------------------------------------
+// eval()
+//----------------------------------------------------------------------
+
+void eval( V{model_name}_t * m ) {{
+  eval_step( m );
+}}
+
+//----------------------------------------------------------------------
+// step_cycles()
+//----------------------------------------------------------------------
+// Simulate ncycles clock cycles with the inputs held constant.
+
+static void step_cycles( V{model_name}_t * m, unsigned long ncycles ) {{
+
+  V{model_name} * model = (V{model_name} *) m->model;
+
+  for ( unsigned long i = 0; i < ncycles; i++ ) {{
+    model->clk = 0;
+    eval_step( m );
+    model->clk = 1;
+    eval_step( m );
+  }}
+
+}}
+
+//----------------------------------------------------------------------
+// step()
+//----------------------------------------------------------------------
+
+void step( V{model_name}_t * m, unsigned long ncycles ) {{
+  step_cycles( m, ncycles );
+}}
+
+//----------------------------------------------------------------------
+// step_stim()
+//----------------------------------------------------------------------
+// Simulate ncycles clock cycles, setting the inputs from the stimulus
+// buffer before each cycle. The buffer holds one record of
+// {stim_nwords} 32-bit words per cycle, containing the value of each
+// input port (except clk) in the order of the _stim_ports of the Python
+// wrapper. Ports up to 32 bits take one word, wider ports take as many
+// words as needed, least significant word first.
+
+void step_stim( V{model_name}_t * m, unsigned long ncycles,
+                const uint32_t * stim ) {{
+
+  V{model_name} * model = (V{model_name} *) m->model;
+
+  for ( unsigned long i = 0; i < ncycles; i++ ) {{
+
+    // set inputs
+    {stim_inputs}
+    stim += {stim_nwords};
+
+    model->clk = 0;
+    eval_step( m );
+    model->clk = 1;
+    eval_step( m );
+  }}
+
+}}
+
+//----------------------------------------------------------------------
+// changed_outputs()
+//----------------------------------------------------------------------
+// Store the indices (in the order of the model's outputs) of all outputs
+// which changed since they were last reported in changed, and return
+// their number. The Python wrapper only writes back these outputs.
+
+static unsigned int changed_outputs( V{model_name}_t * m,
+                                     unsigned int * changed ) {{
+
+  unsigned int n = 0;
+
+  {changed_checks}
+
+  m->_sync_all = 0;
+  return n;
+
+}}
+
+//----------------------------------------------------------------------
+// get_changed()
+//----------------------------------------------------------------------
+
+unsigned int get_changed( V{model_name}_t * m, unsigned int * changed ) {{
+  return changed_outputs( m, changed );
+}}
+
+//----------------------------------------------------------------------
+// eval_changed()
+//----------------------------------------------------------------------
+// Simulate one time-step and report the changed outputs.
+
+unsigned int eval_changed( V{model_name}_t * m, unsigned int * changed ) {{
+  eval_step( m );
+  return changed_outputs( m, changed );
+}}
+
+//----------------------------------------------------------------------
+// tick_changed()
+//----------------------------------------------------------------------
+// Simulate one clock cycle and report the changed outputs.
+
+unsigned int tick_changed( V{model_name}_t * m, unsigned int * changed ) {{
+  step_cycles( m, 1 );
+  return changed_outputs( m, changed );
+}}
+
 //----------------------------------------------------------------------
 // trace()
 //----------------------------------------------------------------------
@@ -9,6 +9,8 @@ import os
 from pymtl import *
 from cffi  import FFI
 
+from pymtl.tools.translation.cpp_helpers import wdata_to_int, int_to_wdata
+
 #-----------------------------------------------------------------------
 # {model_name}
 #-----------------------------------------------------------------------
@@ -36,6 +38,11 @@ class {model_name}( Model ):
       V{model_name}_t * create_model( const char * );
       void destroy_model( V{model_name}_t *);
       void eval( V{model_name}_t * );
+      void step( V{model_name}_t *, unsigned long );
+      void step_stim( V{model_name}_t *, unsigned long, const uint32_t * );
+      unsigned int get_changed( V{model_name}_t *, unsigned int * );
+      unsigned int eval_changed( V{model_name}_t *, unsigned int * );
+      unsigned int tick_changed( V{model_name}_t *, unsigned int * );
       void trace( V{model_name}_t *, char * );
 
     ''')
@@ -53,6 +60,11 @@ class {model_name}( Model ):
     # define the port interface
     {port_defs}
 
+    # names of the input ports set by step() stimulus records, and their
+    # ( nbits, nwords ) layout in the C stimulus buffer
+    s._stim_ports  = [ {stim_ports} ]
+    s._stim_layout = {stim_layout}
+
     # increment instance count
     {model_name}.id_ += 1
 
@@ -80,30 +92,118 @@ class {model_name}( Model ):
 
     s._m = s._ffi.create_model( s.ffi.new("char[]", verilator_vcd_file) )
 
+    # Buffers mapped onto the WData arrays of ports wider than 64 bits,
+    # and the last values written to wide inputs
+    {wdata_bufs}
+
+    # The C model reports the indices of the outputs which changed since
+    # they were last written back, only these outputs are written back
+    # by calling their entry in set_comb (.value) or set_next (.next)
+
+    s._changed    = s.ffi.new( "unsigned int[]", {noutputs} )
+    s._force_eval = True
+
+    set_comb = [
+      {set_comb}
+    ]
+
+    set_next = [
+      {set_next}
+    ]
+
+    s._set_comb = set_comb
+
     @s.combinational
     def logic():
 
-      # set inputs
+      # set changed inputs
+      changed = s._force_eval
       {set_inputs}
 
-      # execute combinational logic
-      s._ffi.eval( s._m )
-
-      # set outputs
-      # FIXME: currently write all outputs, not just combinational outs
-      {set_comb}
+      # execute combinational logic, unless no input changed since the
+      # last evaluation, and set the changed outputs
+      if changed:
+        s._force_eval = False
+        changed_idxs  = s._changed
+        for i in xrange( s._ffi.eval_changed( s._m, changed_idxs ) ):
+          set_comb[ changed_idxs[i] ]()
 
     @s.posedge_clk
     def tick():
 
-      s._m.clk[0] = 0
-      s._ffi.eval( s._m )
-      s._m.clk[0] = 1
-      s._ffi.eval( s._m )
-
-      # double buffer register outputs
-      # FIXME: currently write all outputs, not just registered outs
-      {set_next}
+      # double buffer the changed register outputs
+      changed_idxs = s._changed
+      for i in xrange( s._ffi.tick_changed( s._m, changed_idxs ) ):
+        set_next[ changed_idxs[i] ]()
+
+  #---------------------------------------------------------------------
+  # step
+  #---------------------------------------------------------------------
+  # Simulate ncycles clock cycles entirely in C. The inputs are held
+  # constant, or set before each cycle from stimulus: a sequence of one
+  # record per cycle holding the values of the _stim_ports, or a buffer
+  # returned by pack_stimulus(). Only the final output values are
+  # written back to the output ports (as if by combinational logic).
+  def step( s, ncycles, stimulus=None ):
+
+    # set inputs
+    {set_inputs_step}
+
+    if stimulus is None:
+      s._ffi.step( s._m, ncycles )
+    else:
+      if not isinstance( stimulus, s.ffi.CData ):
+        stimulus = s.pack_stimulus( stimulus )
+      if len( stimulus ) < ncycles * {stim_nwords}:
+        raise ValueError( "stimulus holds less than {{}} cycles"
+                          .format( ncycles ) )
+      s._ffi.step_stim( s._m, ncycles, stimulus )
+      {invalidate_inputs}
+
+    # set changed outputs
+    changed_idxs = s._changed
+    for i in xrange( s._ffi.get_changed( s._m, changed_idxs ) ):
+      s._set_comb[ changed_idxs[i] ]()
+
+  #---------------------------------------------------------------------
+  # pack_stimulus
+  #---------------------------------------------------------------------
+  # Pack a sequence of stimulus records (see step) into a C buffer,
+  # which can be reused for many calls to step.
+  def pack_stimulus( s, stimulus ):
+
+    words = []
+    for record in stimulus:
+      if len( record ) != len( s._stim_layout ):
+        raise ValueError( "stimulus record {{}} does not match the input "
+                          "ports {{}}".format( record, s._stim_ports ) )
+      for value, ( nbits, nwords ) in zip( record, s._stim_layout ):
+        value = int( value ) & ( ( 1 << nbits ) - 1 )
+        for i in range( nwords ):
+          words.append( ( value >> ( 32 * i ) ) & 0xffffffff )
+
+    return s.ffi.new( "uint32_t[]", words )
+
+  #---------------------------------------------------------------------
+  # unpack_stimulus
+  #---------------------------------------------------------------------
+  # Return record i of a buffer returned by pack_stimulus().
+  def unpack_stimulus( s, stimulus, i ):
+
+    offset = i * {stim_nwords}
+    if offset + {stim_nwords} > len( stimulus ):
+      raise ValueError( "stimulus holds less than {{}} cycles"
+                        .format( i + 1 ) )
+
+    record = []
+    for nbits, nwords in s._stim_layout:
+      value = 0
+      for j in range( nwords ):
+        value |= stimulus[ offset + j ] << ( 32 * j )
+      record.append( value )
+      offset += nwords
+
+    return record
 
   def line_trace( s ):
     if {vlinetrace}: